@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.db import models
-from .models import Course, Category, Thread, Replies, Tags, Report, ThreadResource
+from .models import Course, Category, Thread, Replies, Tags, Report, ThreadResource, PendingNotification
 from martor.widgets import AdminMartorWidget
 
 # Register your models here.
@@ -16,4 +16,5 @@ admin.site.register(Category)
 admin.site.register(Replies)
 admin.site.register(Tags)
 admin.site.register(Report)
-admin.site.register(ThreadResource)
\ No newline at end of file
+admin.site.register(ThreadResource)
+admin.site.register(PendingNotification)
@@ -0,0 +1,121 @@
+"""
+Async versions of the hottest views, routed instead of their forum/views.py
+counterparts when FORUM_ASYNC_VIEWS is on (the ASGI profile, see
+docker-compose.asgi.yaml). Under WSGI the sync views stay in use, since an
+async view there costs an event loop per request.
+
+Queries go through the async ORM. Anything without an async form runs in a
+worker thread via sync_to_async: template rendering (which reads the
+session and may still evaluate lazy querysets), markdown re-rendering in
+refresh_stale(), the taxonomy registry, toggle_like() (it needs a
+transaction, which the async ORM can't open) and queueing Celery tasks.
+Emails are sent by the Celery worker, never here.
+
+Django has no async database driver yet, so each async query still runs in
+a thread; the gain is in scheduling, not in query time. Compare both modes
+with ``manage.py loadtest`` before switching.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.cache import cache
+from django.http import Http404
+from django.shortcuts import aget_object_or_404, redirect
+from django.views import View
+
+from forum import caching, taxonomy, views
+from forum.models import Likes, Thread
+from forum.services import toggle_like
+
+
+async def resolve_user(request):
+    """
+    Load the user with the async ORM. request.user is a lazy object that
+    would query synchronously the first time it is touched.
+    """
+    request.user = await request.auser()
+    return request.user
+
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    async def dispatch(self, request, *args, **kwargs):
+        user = await resolve_user(request)
+        if not user.is_authenticated:
+            return self.handle_no_permission()
+        return await View.dispatch(self, request, *args, **kwargs)
+
+
+class AsyncRenderMixin:
+    async def arender(self, **kwargs):
+        """
+        Build the context and render the template in a worker thread.
+        """
+        def render():
+            return self.render_to_response(self.get_context_data(**kwargs)).render()
+        return await sync_to_async(render)()
+
+
+class ThreadListView(AsyncRenderMixin, views.ThreadListView):
+    async def get(self, request, *args, **kwargs):
+        await resolve_user(request)
+        key = None
+        if await sync_to_async(self.is_page_cacheable)():
+            key = await sync_to_async(self.page_cache_key)()
+            frozen = await cache.aget(key)
+            if frozen is not None:
+                return caching.thaw_response(frozen)
+
+        # get_queryset() may load the taxonomy registry.
+        self.object_list = await sync_to_async(self.get_queryset)()
+        paginator = self.get_cursor_paginator(self.object_list, self.get_paginate_by(self.object_list))
+        if paginator is not None:
+            page = await paginator.apage(request.GET.get('cursor'))
+            self.cursor_page = (paginator, page, page.object_list, page.has_other_pages())
+
+        response = await self.arender()
+        if key is not None and response.status_code == 200:
+            await cache.aset(key, caching.freeze_response(response), timeout=settings.FORUM_THREAD_LIST_CACHE_TIMEOUT)
+        return response
+
+    def paginate_queryset(self, queryset, page_size):
+        # Cursor pages were fetched in get(); ranked search results still
+        # page by OFFSET, in the rendering thread.
+        return getattr(self, 'cursor_page', None) or super().paginate_queryset(queryset, page_size)
+
+
+class TagThreadListView(ThreadListView):
+    def get_tag_name(self):
+        return self.kwargs['name']
+
+    async def get(self, request, *args, **kwargs):
+        if await sync_to_async(taxonomy.find_tag)(self.kwargs['name']) is None:
+            raise Http404("No such tag")
+        return await super().get(request, *args, **kwargs)
+
+
+class ThreadDetailView(AsyncLoginRequiredMixin, AsyncRenderMixin, views.ThreadDetailView):
+    async def get(self, request, *args, **kwargs):
+        thread = await aget_object_or_404(self.get_queryset(), pk=self.kwargs['pk'])
+        # Adds buffered likes and re-renders stale markdown.
+        self.object = await sync_to_async(self.prepare_object)(thread)
+        self.reader_context = {
+            'replies_page': await views.replies_paginator(thread.pk).apage(),
+            'is_moderator': await request.user.groups.filter(name='Moderator').aexists(),
+            'liked': await Likes.objects.filter(thread=thread, user=request.user).aexists(),
+        }
+        return await self.arender()
+
+    def get_reader_context(self):
+        return self.reader_context
+
+
+@login_required
+async def like_thread(request, pk):
+    user = await resolve_user(request)
+    thread = await aget_object_or_404(Thread.objects.select_related('author'), id=pk)
+    liked, changed = await sync_to_async(toggle_like)(thread.id, user)
+    if liked and changed:
+        await sync_to_async(views.queue_like_notification)(thread, user)
+    return redirect('thread-detail', pk=pk)
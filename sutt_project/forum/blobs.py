@@ -0,0 +1,137 @@
+"""
+Content-addressed storage for thread resource files.
+
+The same lecture PDF gets attached to many threads, so file content is
+stored once per SHA-256 as a ResourceBlob under ``blobs/ab/cd/<sha256>``
+and every ThreadResource with that content points at it. store() takes a
+reference, and release() (called from a post_delete receiver in
+forum/signals.py, so cascades are covered) drops one and removes the file
+with the last. The row is locked while its count changes, and the file is
+only deleted by a transaction holding the SHA-256's row, so an upload and a
+delete of the same content can't race.
+
+``manage.py dedupe_resources`` moves files from before content addressing
+over and reports disk usage via stats().
+"""
+
+import hashlib
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from forum.models import ResourceBlob, ThreadResource
+
+READ_SIZE = 64 * 1024
+
+
+def hash_file(fileobj):
+    """
+    (sha256 hex digest, size) of a file, read in READ_SIZE pieces from the
+    start. Leaves the file positioned at the start.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    while data := fileobj.read(READ_SIZE):
+        digest.update(data)
+        size += len(data)
+    fileobj.seek(0)
+    return digest.hexdigest(), size
+
+
+def store(content, sha256=None, size=None):
+    """
+    Return the ResourceBlob for ``content`` (a django File) with one more
+    reference, writing the file only if this content is new. Storage moves
+    files that expose temporary_file_path() instead of copying them.
+    """
+    if sha256 is None:
+        sha256, size = hash_file(content)
+
+    with transaction.atomic():
+        blob, created = ResourceBlob.objects.select_for_update().get_or_create(
+            sha256=sha256, defaults={'size': size},
+        )
+        if created:
+            name = blob.file.field.generate_filename(blob, sha256)
+            # Left behind by a release() that died before deleting its file.
+            blob.file.storage.delete(name)
+            blob.file.save(sha256, content, save=False)
+            blob.save(update_fields=['file'])
+        ResourceBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+    blob.ref_count += 1
+    return blob
+
+
+def _delete_orphaned_file(storage, sha256, name):
+    # Claim the content with a placeholder row while deleting the file. A
+    # store() that got there first still has its row, so the file stays;
+    # one that comes later waits on the unique sha256 until the file is gone.
+    with transaction.atomic():
+        blob, created = ResourceBlob.objects.select_for_update().get_or_create(
+            sha256=sha256, defaults={'size': 0},
+        )
+        if created:
+            storage.delete(name)
+            blob.delete()
+
+
+def release(blob_id):
+    """
+    Drop one reference. The last one deletes the blob, and its file once
+    the transaction commits.
+    """
+    with transaction.atomic():
+        blob = ResourceBlob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1:
+            ResourceBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            return
+        blob.delete()
+        transaction.on_commit(partial(_delete_orphaned_file, blob.file.storage, blob.sha256, blob.file.name))
+
+
+def attach(resource, content, filename):
+    """
+    Store ``content`` and point ``resource`` (not yet saved) at its blob.
+    """
+    blob = store(content)
+    resource.blob = blob
+    resource.file.name = blob.file.name
+    resource.original_name = filename
+    return resource
+
+
+def reconcile_ref_counts():
+    """
+    Reset every ref_count to the number of resources using the blob.
+    Returns how many were wrong.
+    """
+    wrong = ResourceBlob.objects.annotate(refs=Count('resources')).exclude(ref_count=F('refs'))
+    fixed = 0
+    for blob in wrong.only('pk'):
+        fixed += ResourceBlob.objects.filter(pk=blob.pk).update(ref_count=blob.refs)
+    return fixed
+
+
+def stats():
+    """
+    Disk usage: what is stored, what it would take without deduplication,
+    and what is still outside the blob store.
+    """
+    stored = ResourceBlob.objects.aggregate(blobs=Count('pk'), bytes=Sum('size'))
+    logical = ThreadResource.objects.filter(blob__isnull=False).aggregate(
+        resources=Count('pk'), bytes=Sum('blob__size'),
+    )
+    stored_bytes = stored['bytes'] or 0
+    logical_bytes = logical['bytes'] or 0
+    return {
+        'blobs': stored['blobs'],
+        'resources': logical['resources'],
+        'stored_bytes': stored_bytes,
+        'logical_bytes': logical_bytes,
+        'saved_bytes': logical_bytes - stored_bytes,
+        'legacy_resources': ThreadResource.objects.filter(blob__isnull=True).count(),
+    }
@@ -0,0 +1,91 @@
+"""
+Versioned caching for the thread list.
+
+Cached pages and template fragments embed a version number in their keys.
+The signal receivers in forum/signals.py bump the version whenever a thread,
+tag, category or resource changes, which orphans every old entry at once
+instead of deleting keys one by one. Orphans expire on their own timeout.
+
+Two versions are kept: ``threads`` covers pages and per-thread cards,
+``taxonomy`` covers the category and tag fragments and the per-process
+registry in forum/taxonomy.py, and is bumped less often.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+
+VERSION_KEY = 'forum:cache-version:{}'
+PAGE_KEY = 'forum:thread-list:{}:{}:{}'
+
+
+def get_version(name):
+    return cache.get_or_set(VERSION_KEY.format(name), 1, timeout=None)
+
+
+def get_versions():
+    """
+    {'threads': n, 'taxonomy': m}, for fragment cache keys in templates.
+    """
+    keys = {VERSION_KEY.format(name): name for name in ('threads', 'taxonomy')}
+    found = cache.get_many(list(keys))
+    return {name: found.get(key) or get_version(name) for key, name in keys.items()}
+
+
+def bump_version(name):
+    key = VERSION_KEY.format(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Never set, or evicted: any fresh value orphans old entries.
+        cache.add(key, 2, timeout=None)
+
+
+def freeze_response(response):
+    """
+    A rendered response as a picklable (status, headers, content) tuple.
+    """
+    return response.status_code, dict(response.headers), response.content
+
+
+def thaw_response(frozen):
+    status, headers, content = frozen
+    return HttpResponse(content, status=status, headers=headers)
+
+
+class AnonymousPageCacheMixin:
+    """
+    Serve rendered pages to anonymous visitors from the cache, keyed on the
+    ``threads`` version and the query string. Requests with pending flash
+    messages bypass the cache so one visitor's message is never stored.
+
+    Like counts change through UPDATEs that don't bump the version, so a
+    cached page shows them, buffered likes from forum/counters.py
+    included, as they were when it was rendered, for up to
+    FORUM_THREAD_LIST_CACHE_TIMEOUT seconds.
+    """
+
+    def page_cache_key(self):
+        query = hashlib.md5(self.request.GET.urlencode().encode()).hexdigest()
+        return PAGE_KEY.format(get_version('threads'), self.request.path, query)
+
+    def is_page_cacheable(self):
+        return not self.request.user.is_authenticated and not len(get_messages(self.request))
+
+    def get(self, request, *args, **kwargs):
+        if not self.is_page_cacheable():
+            return super().get(request, *args, **kwargs)
+
+        key = self.page_cache_key()
+        frozen = cache.get(key)
+        if frozen is not None:
+            return thaw_response(frozen)
+
+        response = super().get(request, *args, **kwargs)
+        response.render()
+        if response.status_code == 200:
+            cache.set(key, freeze_response(response), timeout=settings.FORUM_THREAD_LIST_CACHE_TIMEOUT)
+        return response
@@ -0,0 +1,159 @@
+"""
+Write-behind buffer for Thread.likes_count.
+
+With FORUM_LIKE_BUFFER enabled, toggle_like records +1/-1 deltas in the
+cache instead of updating the thread row, so likers of a hot thread don't
+queue up on its row lock. flush() applies the summed delta with one UPDATE
+per thread. Views add the pending delta on read so counts stay consistent.
+
+Dirty threads are kept in a Redis set: add() bumps the delta and then
+SADDs the thread, and flush() SPOPs the set, so a thread is never dropped
+between the two. The cache must be shared between the web workers and the
+process running flush(), i.e. Redis; with any other backend the set is
+per-process, which only suits development and tests.
+"""
+
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from forum.models import Thread
+
+logger = logging.getLogger(__name__)
+
+DELTA_KEY = 'forum:likes:delta:{}'
+DIRTY_KEY = 'forum:likes:dirty'
+FLUSH_LOCK_KEY = 'forum:likes:flush-lock'
+POP_BATCH = 1000
+
+# Dirty set for caches without one, e.g. LocMemCache.
+_local_dirty = set()
+_local_lock = threading.Lock()
+
+
+def is_enabled():
+    return settings.FORUM_LIKE_BUFFER
+
+
+def _cache():
+    return caches[settings.FORUM_LIKE_BUFFER_CACHE]
+
+
+def _redis(cache):
+    """
+    The redis-py client behind Django's RedisCache, or None.
+    """
+    backend = getattr(cache, '_cache', None)
+    return backend.get_client(write=True) if hasattr(backend, 'get_client') else None
+
+
+def _mark_dirty(cache, thread_id):
+    client = _redis(cache)
+    if client is None:
+        with _local_lock:
+            _local_dirty.add(thread_id)
+    else:
+        client.sadd(cache.make_key(DIRTY_KEY), thread_id)
+
+
+def _pop_dirty(cache):
+    """
+    Take every dirty thread id out of the set.
+    """
+    client = _redis(cache)
+    if client is None:
+        with _local_lock:
+            thread_ids = set(_local_dirty)
+            _local_dirty.clear()
+        return thread_ids
+
+    key = cache.make_key(DIRTY_KEY)
+    thread_ids = set()
+    while batch := client.spop(key, POP_BATCH):
+        thread_ids.update(int(thread_id) for thread_id in batch)
+    return thread_ids
+
+
+def add(thread_id, delta):
+    """
+    Buffer a like (+1) or unlike (-1) for a thread.
+    """
+    cache = _cache()
+    key = DELTA_KEY.format(thread_id)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Evicted between add() and incr().
+        cache.set(key, delta, timeout=None)
+
+    # After the delta, so a flush that pops the thread first still finds
+    # it registered again for the next run.
+    _mark_dirty(cache, thread_id)
+
+
+def pending(thread_ids):
+    """
+    Return {thread_id: delta} for threads with unflushed likes.
+    """
+    if not is_enabled():
+        return {}
+    keys = {DELTA_KEY.format(thread_id): thread_id for thread_id in thread_ids}
+    values = _cache().get_many(list(keys))
+    return {keys[key]: delta for key, delta in values.items() if delta}
+
+
+def apply_pending(threads):
+    """
+    Add buffered deltas to likes_count on already loaded threads.
+    """
+    threads = list(threads)
+    deltas = pending(thread.pk for thread in threads)
+    for thread in threads:
+        thread.likes_count = max(thread.likes_count + deltas.get(thread.pk, 0), 0)
+    return threads
+
+
+def flush():
+    """
+    Apply buffered deltas to the database. Returns the number of threads
+    updated. A crash between the UPDATE and the cache decrement can apply a
+    delta twice; reconcile_likes repairs that.
+    """
+    cache = _cache()
+    if not cache.add(FLUSH_LOCK_KEY, 1, timeout=60):
+        return 0
+
+    try:
+        thread_ids = sorted(_pop_dirty(cache))
+        updated = 0
+        for index, thread_id in enumerate(thread_ids):
+            key = DELTA_KEY.format(thread_id)
+            delta = cache.get(key) or 0
+            if not delta:
+                continue
+
+            try:
+                Thread.objects.filter(pk=thread_id).update(
+                    likes_count=Greatest(F('likes_count') + delta, 0)
+                )
+            except Exception:
+                # Leave this and the remaining threads for the next run.
+                for remaining in thread_ids[index:]:
+                    _mark_dirty(cache, remaining)
+                raise
+            try:
+                cache.decr(key, delta)
+            except ValueError:
+                pass
+            updated += 1
+
+        if updated:
+            logger.info(f"✅ Flushed buffered likes for {updated} threads")
+        return updated
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
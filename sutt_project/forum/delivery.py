@@ -0,0 +1,238 @@
+"""
+Batched email delivery for forum notifications.
+
+Tasks in forum/tasks.py only queue a PendingNotification row. The delivery
+stage drains the queue in batches over a single SMTP connection, merging
+like and reply notifications for the same recipient and thread into one
+digest email when they arrive within FORUM_EMAIL_DIGEST_WINDOW seconds.
+
+A batch is claimed (``claimed_at``) in a short transaction and sent
+outside it, so a slow SMTP server holds no row locks. Each email is marked
+sent as soon as the server accepts it; after a failure only the email that
+failed counts an attempt, and it is abandoned after MAX_ATTEMPTS.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.html import escape, strip_tags
+
+from forum import metrics
+from forum.models import PendingNotification
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+
+# Claims older than this belong to a run that died mid-send.
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def queue_notification(recipient, kind, subject, html_message, thread_id=None, actor_name=""):
+    """
+    Store a notification for the delivery stage to pick up.
+    """
+    return PendingNotification.objects.create(
+        recipient=recipient,
+        kind=kind,
+        subject=subject,
+        html_message=html_message,
+        thread_id=thread_id,
+        actor_name=actor_name,
+    )
+
+
+def _build_message(subject, html_message, recipient):
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body=strip_tags(html_message),
+        from_email=settings.EMAIL_HOST_USER,
+        to=[recipient],
+    )
+    message.attach_alternative(html_message, "text/html")
+    return message
+
+
+def _build_digest(notifications):
+    """
+    Merge several like/reply notifications for one recipient and thread.
+    """
+    thread_title = notifications[0].thread.title if notifications[0].thread else ""
+    likers = [n.actor_name for n in notifications if n.kind == 'like']
+    repliers = [n.actor_name for n in notifications if n.kind == 'reply']
+
+    subject = f"{len(notifications)} new notifications on your thread: {thread_title}"
+
+    html_message = f"""
+    <h3>There is new activity on your thread</h3>
+    <p><em>"{escape(thread_title)}"</em></p>
+    <ul>
+    """
+    if repliers:
+        html_message += f"<li><strong>{len(repliers)}</strong> new replies from {escape(', '.join(OrderedDict.fromkeys(repliers)))}</li>"
+    if likers:
+        html_message += f"<li><strong>{len(likers)}</strong> new likes from {escape(', '.join(OrderedDict.fromkeys(likers)))}</li>"
+    html_message += f"""
+    </ul>
+    <p><a href="{settings.SITE_URL}/forum/threads/{notifications[0].thread_id}/">View Thread</a></p>
+    """
+    return subject, html_message
+
+
+def _group(notifications):
+    """
+    Group notifications into outgoing emails. Digest kinds are keyed by
+    (recipient, thread); everything else is sent on its own.
+    """
+    groups = OrderedDict()
+    for notification in notifications:
+        if notification.kind in PendingNotification.DIGEST_KINDS and notification.thread_id:
+            key = (notification.recipient, notification.thread_id)
+        else:
+            key = ('single', notification.pk)
+        groups.setdefault(key, []).append(notification)
+    return list(groups.values())
+
+
+def _claim_batch(batch_size, cutoff):
+    """
+    Claim the next batch of ready notifications. A digest group is ready
+    once its oldest notification is older than the cutoff; newer
+    notifications in the same group are pulled in so the burst goes out as
+    one email.
+    """
+    claimed_at = timezone.now()
+    pending = PendingNotification.objects.filter(
+        Q(claimed_at__isnull=True) | Q(claimed_at__lt=claimed_at - CLAIM_TIMEOUT),
+        sent_at__isnull=True,
+        attempts__lt=MAX_ATTEMPTS,
+    )
+    with transaction.atomic():
+        ready = list(
+            pending.filter(~Q(kind__in=PendingNotification.DIGEST_KINDS) | Q(created_at__lte=cutoff))
+            .select_related('thread')
+            .select_for_update(skip_locked=True, of=('self',))
+            .order_by('created_at')[:batch_size]
+        )
+
+        digest_keys = {
+            (n.recipient, n.thread_id)
+            for n in ready
+            if n.kind in PendingNotification.DIGEST_KINDS and n.thread_id
+        }
+        if digest_keys:
+            followers = (
+                pending.filter(
+                    kind__in=PendingNotification.DIGEST_KINDS,
+                    thread_id__in={thread_id for _, thread_id in digest_keys},
+                    recipient__in={recipient for recipient, _ in digest_keys},
+                )
+                .exclude(pk__in=[n.pk for n in ready])
+                .select_related('thread')
+                .select_for_update(skip_locked=True, of=('self',))
+            )
+            ready.extend(n for n in followers if (n.recipient, n.thread_id) in digest_keys)
+
+        PendingNotification.objects.filter(pk__in=[n.pk for n in ready]).update(claimed_at=claimed_at)
+    return ready
+
+
+def _group_message(group):
+    if len(group) > 1:
+        subject, html_message = _build_digest(group)
+    else:
+        subject, html_message = group[0].subject, group[0].html_message
+    return _build_message(subject, html_message, group[0].recipient)
+
+
+def _send_groups(groups):
+    """
+    Send one email per group over a single connection, marking each group
+    sent once the server accepts it. Returns how many groups were sent;
+    on a failure the failed group counts an attempt and the rest are
+    released for the next run.
+    """
+    sent = 0
+    try:
+        with metrics.EMAIL_SEND_LATENCY.time(), get_connection(fail_silently=False) as connection:
+            for group in groups:
+                connection.send_messages([_group_message(group)])
+                PendingNotification.objects.filter(pk__in=[n.pk for n in group]).update(sent_at=timezone.now())
+                metrics.EMAILS.labels('sent').inc()
+                sent += 1
+    except Exception as exc:
+        if sent == len(groups):
+            # Everything went out; only closing the connection failed.
+            logger.warning(f"⚠️ Closing the SMTP connection failed: {str(exc)}")
+            return sent
+        failed, rest = groups[sent], groups[sent + 1:]
+        logger.error(f"❌ Failed to deliver a notification email to {failed[0].recipient}: {str(exc)}")
+        metrics.EMAILS.labels('failed').inc()
+        PendingNotification.objects.filter(pk__in=[n.pk for n in failed]).update(
+            attempts=F('attempts') + 1, claimed_at=None,
+        )
+        PendingNotification.objects.filter(pk__in=[n.pk for group in rest for n in group]).update(claimed_at=None)
+
+        abandoned = [n.pk for n in failed if n.attempts + 1 >= MAX_ATTEMPTS]
+        if abandoned:
+            logger.error(
+                f"❌ Giving up on notifications {abandoned} for {failed[0].recipient} after {MAX_ATTEMPTS} attempts"
+            )
+            metrics.EMAILS.labels('abandoned').inc()
+    return sent
+
+
+def deliver_pending_notifications(batch_size=None, window=None, now=None):
+    """
+    Drain ready notifications and send them over one pooled connection per
+    batch. Returns throughput metrics for the run.
+    """
+    batch_size = batch_size or settings.FORUM_EMAIL_BATCH_SIZE
+    window = settings.FORUM_EMAIL_DIGEST_WINDOW if window is None else window
+    cutoff = (now or timezone.now()) - timedelta(seconds=window)
+
+    stats = {
+        'batches': 0,
+        'notifications': 0,
+        'messages': 0,
+        'failed': 0,
+        'elapsed': 0.0,
+        'messages_per_second': 0.0,
+    }
+    started = time.monotonic()
+
+    while True:
+        batch = _claim_batch(batch_size, cutoff)
+        if not batch:
+            break
+
+        groups = _group(batch)
+        sent = _send_groups(groups)
+        stats['notifications'] += sum(len(group) for group in groups[:sent])
+        stats['messages'] += sent
+        if sent < len(groups):
+            stats['failed'] += 1
+            # Leave the rest of the queue for the next run.
+            break
+        stats['batches'] += 1
+
+        if len(batch) < batch_size:
+            break
+
+    stats['elapsed'] = time.monotonic() - started
+    if stats['elapsed'] > 0:
+        stats['messages_per_second'] = stats['messages'] / stats['elapsed']
+
+    if stats['notifications']:
+        logger.info(
+            f"✅ Delivered {stats['notifications']} notifications as {stats['messages']} emails "
+            f"in {stats['batches']} batches ({stats['messages_per_second']:.1f} emails/s)"
+        )
+    return stats
@@ -0,0 +1,129 @@
+"""
+Thread resource downloads.
+
+Django only decides who may fetch a file. With FORUM_MEDIA_ACCEL_REDIRECT on
+(production), the response is an empty one carrying ``X-Accel-Redirect`` to
+nginx's internal FORUM_MEDIA_ACCEL_PREFIX location, and nginx sends the file
+with sendfile, answering Range and conditional requests itself, so a large
+video never ties up a gunicorn worker. Without nginx (runserver, tests)
+Django streams the file, with the same ETag, Cache-Control and single-range
+support.
+
+The ETag is built the way nginx builds its own, from the file's mtime and
+size, so a validator from either path matches the other.
+"""
+
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
+
+from forum.uploads import READ_SIZE
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def make_etag(stat):
+    return '"%x-%x"' % (int(stat.st_mtime), stat.st_size)
+
+
+def parse_range(header, size):
+    """
+    The inclusive (start, end) of a single byte range, or None to send the
+    whole file (no header, or one we don't handle such as multiple ranges).
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # A suffix range: the last N bytes.
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def _read_range(fh, start, length):
+    with fh:
+        fh.seek(start)
+        while length > 0:
+            data = fh.read(min(READ_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def serve(request, fieldfile, filename=None, as_attachment=True):
+    """
+    Respond with ``fieldfile`` (a FieldFile on local storage) once the
+    caller has checked permissions.
+    """
+    if not fieldfile:
+        raise Http404
+    try:
+        stat = os.stat(fieldfile.path)
+    except FileNotFoundError:
+        raise Http404
+
+    filename = filename or os.path.basename(fieldfile.name)
+    etag = make_etag(stat)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': f'private, max-age={settings.FORUM_DOWNLOAD_MAX_AGE}',
+        'Accept-Ranges': 'bytes',
+    }
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified.headers.setdefault(header, value)
+        return not_modified
+
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    disposition = content_disposition_header(as_attachment, filename)
+
+    if settings.FORUM_MEDIA_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['X-Accel-Redirect'] = settings.FORUM_MEDIA_ACCEL_PREFIX + quote(fieldfile.name)
+        response['Content-Disposition'] = disposition
+        return response
+
+    # An If-Range validator that no longer matches means the client's
+    # partial copy is stale: send the whole file instead.
+    if_range = request.headers.get('If-Range')
+    try:
+        byte_range = parse_range(request.headers.get('Range'), stat.st_size) if if_range in (None, etag) else None
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416, headers=headers)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(fieldfile.open('rb'), content_type=content_type, headers=headers)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(fieldfile.open('rb'), start, end - start + 1),
+            status=206,
+            content_type=content_type,
+            headers=headers,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Content-Length'] = str(end - start + 1)
+    response['Content-Disposition'] = disposition
+    return response
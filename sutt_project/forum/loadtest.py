@@ -0,0 +1,240 @@
+"""
+Reproducible HTTP benchmark for the forum endpoints, e.g. to compare sync
+gunicorn against the ASGI profile or to catch regressions between commits.
+
+Worker threads each hold a logged-in session (a session row created
+directly in the database the server uses, so no login round trip) and
+replay a seeded, weighted mix of list, search, detail, like, reply and
+upload requests against a running server. Latencies are grouped by URL
+name and summarized as p50/p95/p99 and requests per second; compare()
+checks a run against a stored baseline.
+"""
+
+import random
+import secrets
+import subprocess
+import threading
+import time
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from importlib import import_module
+
+import requests
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from forum.models import Thread
+
+USER_PREFIX = 'loadtest_user_'
+UPLOAD_SIZE = 4096
+
+# key: session key; thread_id: a thread the user wrote, the only kind they
+# may upload resources to.
+Session = namedtuple('Session', 'key user_id thread_id')
+
+
+def session_for(user):
+    """
+    A session key logged in as ``user``, as django.contrib.auth.login()
+    would create it.
+    """
+    store = import_module(settings.SESSION_ENGINE).SessionStore()
+    store[SESSION_KEY] = str(user.pk)
+    store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    store.create()
+    return store.session_key
+
+
+def load_users(count):
+    User.objects.bulk_create(
+        [User(username=f'{USER_PREFIX}{i}') for i in range(count)],
+        ignore_conflicts=True,
+    )
+    return list(User.objects.filter(username__startswith=USER_PREFIX).order_by('pk')[:count])
+
+
+def load_sessions(count):
+    """
+    A Session per load test user, each with a thread of their own.
+    """
+    sessions = []
+    for user in load_users(count):
+        thread, _ = Thread.objects.get_or_create(
+            author=user,
+            title=f'Load test uploads ({user.username})',
+            defaults={'content': 'Resources uploaded by the load test.'},
+        )
+        sessions.append(Session(session_for(user), user.pk, thread.pk))
+    return sessions
+
+
+@contextmanager
+def serve(command, base_url, timeout=60, env=None):
+    """
+    Run ``command`` (a server bound to ``base_url``) for the duration of
+    the block, once it answers HTTP requests.
+    """
+    process = subprocess.Popen(command, env=env)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f'Server exited with status {process.returncode}')
+            try:
+                requests.get(base_url + reverse('forum-home'), timeout=1, allow_redirects=False)
+                break
+            except requests.RequestException:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f'Server did not answer on {base_url} within {timeout}s')
+                time.sleep(0.2)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def summarize(samples, elapsed):
+    """
+    {url_name: {requests, errors, rps, p50_ms, p95_ms, p99_ms}} from
+    {url_name: [(seconds, ok), ...]}.
+    """
+    summary = {}
+    for name, results in sorted(samples.items()):
+        latencies = sorted(seconds * 1000 for seconds, _ in results)
+        summary[name] = {
+            'requests': len(results),
+            'errors': sum(1 for _, ok in results if not ok),
+            'rps': round(len(results) / elapsed, 1) if elapsed else 0,
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+        }
+    return summary
+
+
+def upload_body(rng):
+    return b'%PDF-1.4\n' + rng.randbytes(UPLOAD_SIZE)
+
+
+def mixes(thread_ids, search_terms):
+    """
+    Named request mixes: {name: [(url_name, weight, make_request)]}.
+    make_request(rng, session) returns (method, path, requests kwargs).
+    Weights are relative to the other entries in the same mix.
+    """
+    def thread_list(rng, session):
+        return 'GET', reverse('thread-list'), {}
+
+    def search(rng, session):
+        return 'GET', reverse('thread-list'), {'params': {'q': rng.choice(search_terms)}}
+
+    def detail(rng, session):
+        return 'GET', reverse('thread-detail', args=[rng.choice(thread_ids)]), {}
+
+    def like(rng, session):
+        return 'POST', reverse('thread-like', args=[rng.choice(thread_ids)]), {}
+
+    def reply(rng, session):
+        data = {'content': f'Load test reply {rng.getrandbits(32):08x}'}
+        return 'POST', reverse('thread-reply', args=[rng.choice(thread_ids)]), {'data': data}
+
+    def upload(rng, session):
+        data = {'title': 'Load test resource'}
+        files = {'file': ('notes.pdf', upload_body(rng), 'application/pdf')}
+        return 'POST', reverse('upload-resource', args=[session.thread_id]), {'data': data, 'files': files}
+
+    # Searches are thread-list requests, reported separately.
+    return {
+        'read': [('thread-list', 6, thread_list), ('thread-list?q', 2, search), ('thread-detail', 4, detail)],
+        'mixed': [
+            ('thread-list', 20, thread_list), ('thread-list?q', 8, search), ('thread-detail', 15, detail),
+            ('thread-like', 4, like), ('thread-reply', 2, reply), ('upload-resource', 1, upload),
+        ],
+        'write': [('thread-detail', 2, detail), ('thread-like', 4, like), ('thread-reply', 4, reply), ('upload-resource', 1, upload)],
+        # The paths the ASGI profile serves asynchronously.
+        'hot': [('thread-list', 6, thread_list), ('thread-detail', 3, detail), ('thread-like', 1, like)],
+    }
+
+
+def run(base_url, mix, sessions, requests_per_worker, seed=0, timeout=30):
+    """
+    Replay ``mix`` from one thread per Session. Returns (samples, elapsed
+    seconds).
+    """
+    names = [name for name, _, _ in mix]
+    weights = [weight for _, weight, _ in mix]
+    makers = {name: make for name, _, make in mix}
+    samples = defaultdict(list)
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(sessions))
+
+    def work(index, session):
+        rng = random.Random(seed * 1000 + index)
+        csrf = secrets.token_hex(16)
+        client = requests.Session()
+        client.cookies.set(settings.SESSION_COOKIE_NAME, session.key)
+        client.cookies.set(settings.CSRF_COOKIE_NAME, csrf)
+        client.headers['X-CSRFToken'] = csrf
+        local = []
+        barrier.wait()
+        for _ in range(requests_per_worker):
+            name = rng.choices(names, weights)[0]
+            method, path, kwargs = makers[name](rng, session)
+            started = time.perf_counter()
+            try:
+                response = client.request(method, base_url + path, allow_redirects=False, timeout=timeout, **kwargs)
+                # Views redirect on success; a redirect to the login page
+                # means the session was rejected.
+                ok = response.status_code < 400 and settings.LOGIN_URL not in response.headers.get('Location', '')
+            except requests.RequestException:
+                ok = False
+            local.append((name, time.perf_counter() - started, ok))
+        with lock:
+            for name, seconds, ok in local:
+                samples[name].append((seconds, ok))
+
+    pool = [threading.Thread(target=work, args=(i, session)) for i, session in enumerate(sessions)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return samples, time.perf_counter() - started
+
+
+def compare(result, baseline, tolerance=0.2, min_delta_ms=5):
+    """
+    Regressions of ``result`` against ``baseline`` (both as written by the
+    loadtest command), as readable strings. A latency percentile regresses
+    when it grew by more than ``tolerance`` and by at least
+    ``min_delta_ms``, so noise on fast endpoints doesn't count; throughput
+    when overall requests/sec fell by more than ``tolerance``; errors when
+    an endpoint's error rate went up. URL names missing from either run are
+    skipped.
+    """
+    regressions = []
+    for name, base in sorted(baseline['urls'].items()):
+        row = result['urls'].get(name)
+        if row is None:
+            continue
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if row[key] > base[key] * (1 + tolerance) and row[key] - base[key] >= min_delta_ms:
+                regressions.append(f'{name} {key}: {base[key]} -> {row[key]}')
+        if row['errors'] / row['requests'] > base['errors'] / base['requests']:
+            regressions.append(f"{name} errors: {base['errors']}/{base['requests']} -> {row['errors']}/{row['requests']}")
+    if result['rps'] < baseline['rps'] * (1 - tolerance):
+        regressions.append(f"requests/sec: {baseline['rps']} -> {result['rps']}")
+    return regressions
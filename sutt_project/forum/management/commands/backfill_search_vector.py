@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from forum.models import Thread
+from forum.search import thread_search_vector
+
+
+class Command(BaseCommand):
+    help = 'Fill Thread.search_vector for existing rows in primary key chunks (PostgreSQL only).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Threads updated per statement',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recompute every row, not only rows with an empty search_vector',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('search_vector is only maintained on PostgreSQL')
+
+        chunk_size = options['chunk_size']
+        queryset = Thread.objects.all()
+        if not options['all']:
+            queryset = queryset.filter(search_vector__isnull=True)
+
+        last_id = Thread.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        updated = 0
+        started = time.monotonic()
+
+        # Short statements per pk range keep row locks and WAL bursts small.
+        for start in range(0, last_id + 1, chunk_size):
+            updated += queryset.filter(pk__gte=start, pk__lt=start + chunk_size).update(
+                search_vector=thread_search_vector()
+            )
+            self.stdout.write(f'  • up to id {min(start + chunk_size, last_id)}: {updated} rows')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Backfilled search_vector on {updated} threads in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,96 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from forum.loadtest import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the per-request cost of getting a database connection: a new connection '
+        'per request (CONN_MAX_AGE=0), a persistent one with health checks, and psycopg\'s '
+        'pool (PostgreSQL with psycopg 3 only).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Simulated requests per mode')
+        parser.add_argument('--database', default='default', help='Database alias to benchmark')
+
+    def handle(self, *args, **options):
+        self.connection = connections[options['database']]
+        iterations = options['iterations']
+
+        fresh = self.direct_wrapper('bench_fresh', conn_max_age=0)
+        persistent = self.direct_wrapper('bench_persistent', conn_max_age=None)
+        modes = [('new connection', lambda: self.fresh(fresh)), ('persistent', lambda: self.persistent(persistent))]
+        pool = self.pooled_wrapper()
+        if pool is not None:
+            modes.append(('psycopg pool', lambda: self.pooled(pool)))
+
+        self.stdout.write(self.style.WARNING(
+            f'{iterations} simulated requests per mode against {self.connection.vendor} '
+            f"({self.connection.settings_dict.get('HOST') or 'local'})..."
+        ))
+        self.stdout.write(f"{'mode':<16}{'p50 ms':>9}{'p99 ms':>9}{'mean ms':>9}")
+        try:
+            for name, request in modes:
+                request()  # warm up
+                timings = []
+                for _ in range(iterations):
+                    started = time.perf_counter()
+                    request()
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                self.stdout.write(
+                    f'{name:<16}{percentile(timings, 0.5):>9.3f}{percentile(timings, 0.99):>9.3f}'
+                    f'{sum(timings) / len(timings):>9.3f}'
+                )
+        finally:
+            if pool is not None:
+                pool.close_pool()
+            fresh.close()
+            persistent.close()
+
+    def query(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+
+    def fresh(self, wrapper):
+        # What every request paid with CONN_MAX_AGE=0.
+        wrapper.connect()
+        self.query(wrapper)
+        wrapper.close()
+
+    def persistent(self, wrapper):
+        # request_started/request_finished, with CONN_HEALTH_CHECKS on.
+        wrapper.health_check_done = False
+        wrapper.ensure_connection()
+        wrapper.close_if_health_check_failed()
+        self.query(wrapper)
+
+    def pooled(self, wrapper):
+        wrapper.connect()
+        self.query(wrapper)
+        wrapper.close()
+
+    def direct_wrapper(self, alias, conn_max_age):
+        """
+        A connection to the same database without psycopg's pool, so the
+        first two modes measure what they say whatever DB_CONNECTION_MODE
+        configured for the alias.
+        """
+        settings_dict = {**self.connection.settings_dict, 'CONN_MAX_AGE': conn_max_age, 'CONN_HEALTH_CHECKS': True}
+        settings_dict['OPTIONS'] = {key: value for key, value in settings_dict['OPTIONS'].items() if key != 'pool'}
+        return type(self.connection)(settings_dict, alias=alias)
+
+    def pooled_wrapper(self):
+        if self.connection.vendor != 'postgresql':
+            return None
+        try:
+            import psycopg_pool  # noqa: F401
+        except ImportError:
+            return None
+        settings_dict = {**self.connection.settings_dict, 'CONN_MAX_AGE': 0}
+        settings_dict['OPTIONS'] = {**settings_dict['OPTIONS'], 'pool': {'min_size': 1, 'max_size': 2}}
+        return type(self.connection)(settings_dict, alias='bench_pool')
@@ -0,0 +1,81 @@
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from forum import counters
+from forum.models import Likes, Thread
+from forum.services import toggle_like
+
+
+class Command(BaseCommand):
+    help = 'Benchmark likes/sec against a single hot thread, with and without the write-behind like buffer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--likers', type=int, default=200, help='Distinct users liking the thread')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent worker threads')
+        parser.add_argument('--toggles', type=int, default=5, help='Like/unlike toggles per user (odd leaves it liked)')
+
+    def handle(self, *args, **options):
+        likers = options['likers']
+        workers = options['workers']
+        toggles = options['toggles']
+
+        thread = Thread.objects.create(title='Benchmark hot thread', content='Benchmark')
+        User.objects.bulk_create(
+            [User(username=f'bench_liker_{i}') for i in range(likers)],
+            ignore_conflicts=True,
+        )
+        users = list(User.objects.filter(username__startswith='bench_liker_')[:likers])
+        expected = len(users) if toggles % 2 else 0
+
+        self.stdout.write(self.style.WARNING(
+            f'Benchmarking {len(users) * toggles} toggles from {len(users)} users on {workers} workers...'
+        ))
+
+        try:
+            for mode, buffered in (('direct', False), ('buffered', True)):
+                with override_settings(FORUM_LIKE_BUFFER=buffered):
+                    Likes.objects.filter(thread=thread).delete()
+                    Thread.objects.filter(pk=thread.pk).update(likes_count=0)
+
+                    elapsed, errors = self._run(thread.pk, users, workers, toggles)
+                    if buffered:
+                        counters.flush()
+
+                    thread.refresh_from_db()
+                    rate = len(users) * toggles / elapsed if elapsed else 0
+                    status = self.style.SUCCESS('ok') if thread.likes_count == expected and not errors else self.style.ERROR('MISMATCH')
+                    self.stdout.write(
+                        f'  • {mode:<9} {rate:8.1f} likes/s  '
+                        f'(likes_count={thread.likes_count}, expected={expected}, errors={errors}) {status}'
+                    )
+        finally:
+            thread.delete()
+            User.objects.filter(username__startswith='bench_liker_').delete()
+
+    def _run(self, thread_id, users, workers, toggles):
+        chunks = [users[i::workers] for i in range(workers)]
+        barrier = threading.Barrier(len(chunks))
+        errors = []
+
+        def work(chunk):
+            try:
+                barrier.wait()
+                for user in chunk:
+                    for _ in range(toggles):
+                        toggle_like(thread_id, user)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        pool = [threading.Thread(target=work, args=(chunk,)) for chunk in chunks]
+        started = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        return time.perf_counter() - started, len(errors)
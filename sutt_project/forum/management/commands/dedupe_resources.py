@@ -0,0 +1,87 @@
+import os
+from collections import defaultdict
+from functools import partial
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
+from forum import blobs
+from forum.models import ThreadResource
+
+
+class Command(BaseCommand):
+    help = (
+        'Move resource files stored before content addressing into the blob store, '
+        'sharing one copy per SHA-256, then report disk usage. Safe to re-run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Hash the remaining files and report what deduplication would save',
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Only report disk usage',
+        )
+
+    def handle(self, *args, **options):
+        if not options['stats']:
+            legacy = ThreadResource.objects.filter(blob__isnull=True).only('file', 'original_name').order_by('pk')
+            if options['dry_run']:
+                self.report_duplicates(legacy)
+                return
+            self.migrate(legacy)
+            fixed = blobs.reconcile_ref_counts()
+            if fixed:
+                self.stdout.write(self.style.WARNING(f'Corrected ref_count on {fixed} blobs'))
+
+        usage = blobs.stats()
+        self.stdout.write(
+            f"{usage['resources']} resources share {usage['blobs']} blobs: "
+            f"{filesizeformat(usage['stored_bytes'])} stored for "
+            f"{filesizeformat(usage['logical_bytes'])} of files, "
+            f"{filesizeformat(usage['saved_bytes'])} saved"
+        )
+        if usage['legacy_resources']:
+            self.stdout.write(self.style.WARNING(f"{usage['legacy_resources']} resources still outside the blob store"))
+
+    def migrate(self, legacy):
+        moved = 0
+        for resource in legacy.iterator(chunk_size=100):
+            old = resource.file
+            try:
+                handle = old.storage.open(old.name, 'rb')
+            except FileNotFoundError:
+                self.stderr.write(f'Resource {resource.pk}: {old.name} is missing, skipped')
+                continue
+
+            with handle, transaction.atomic():
+                resource.original_name = resource.original_name or os.path.basename(old.name)
+                old_name = old.name
+                blobs.attach(resource, File(handle), resource.original_name)
+                resource.save(update_fields=['blob', 'file', 'original_name'])
+                transaction.on_commit(partial(old.storage.delete, old_name))
+            moved += 1
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Moved {moved} resources into the blob store'))
+
+    def report_duplicates(self, legacy):
+        sizes = defaultdict(list)
+        for resource in legacy.iterator(chunk_size=100):
+            try:
+                with resource.file.storage.open(resource.file.name, 'rb') as handle:
+                    sha256, size = blobs.hash_file(handle)
+            except FileNotFoundError:
+                continue
+            sizes[sha256].append(size)
+
+        duplicates = sum(len(group) - 1 for group in sizes.values())
+        reclaimable = sum(group[0] * (len(group) - 1) for group in sizes.values())
+        self.stdout.write(
+            f'{sum(map(len, sizes.values()))} files, {len(sizes)} distinct: '
+            f'{duplicates} duplicates, {filesizeformat(reclaimable)} reclaimable'
+        )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from forum.delivery import deliver_pending_notifications
+
+
+class Command(BaseCommand):
+    help = 'Send queued notification emails in batches and print throughput metrics.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Notifications per SMTP connection (default: FORUM_EMAIL_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--window',
+            type=int,
+            default=None,
+            help='Digest window in seconds (default: FORUM_EMAIL_DIGEST_WINDOW)',
+        )
+
+    def handle(self, *args, **options):
+        stats = deliver_pending_notifications(
+            batch_size=options['batch_size'],
+            window=options['window'],
+        )
+        self.stdout.write(self.style.SUCCESS('✓ Delivery run finished'))
+        self.stdout.write(f"  • Notifications: {stats['notifications']}")
+        self.stdout.write(f"  • Emails sent: {stats['messages']}")
+        self.stdout.write(f"  • Batches: {stats['batches']}")
+        self.stdout.write(f"  • Failed: {stats['failed']}")
+        self.stdout.write(f"  • Throughput: {stats['messages_per_second']:.1f} emails/s")
@@ -0,0 +1,86 @@
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models.query import EmptyQuerySet
+from django.test import RequestFactory
+from forum.models import Thread
+from forum.views import (
+    REPLIES_PER_PAGE, MyThreadsListView, ReportListView, ThreadDetailView, ThreadListView, replies_queryset,
+)
+
+
+class Command(BaseCommand):
+    help = "Print EXPLAIN plans for the querysets behind the forum's list and detail views."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Username to build per-user querysets for (default: first superuser)',
+        )
+        parser.add_argument(
+            '--thread',
+            type=int,
+            help='Thread id for the detail view (default: most recent thread)',
+        )
+        parser.add_argument(
+            '--query',
+            default='',
+            help='Extra query string applied to list views, e.g. "category=1" or "status=pending"',
+        )
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='Run EXPLAIN ANALYZE (PostgreSQL only; executes the queries)',
+        )
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"User '{options['user']}' does not exist")
+        else:
+            user = User.objects.filter(is_superuser=True).first() or AnonymousUser()
+
+        explain_options = {}
+        if options['analyze']:
+            if connection.vendor != 'postgresql':
+                raise CommandError('--analyze is only supported on PostgreSQL')
+            explain_options = {'analyze': True, 'buffers': True}
+
+        path = '/?' + options['query']
+        for name, queryset in self.view_querysets(user, path, options['thread']):
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n== {name}'))
+            if queryset is None or isinstance(queryset, EmptyQuerySet):
+                self.stdout.write(self.style.WARNING('  skipped (no data or not permitted for this user)'))
+                continue
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain(**explain_options))
+
+    def view_querysets(self, user, path, thread_id):
+        factory = RequestFactory()
+
+        for name, view_class in (
+            ('ThreadListView', ThreadListView),
+            ('MyThreadsListView', MyThreadsListView),
+            ('ReportListView', ReportListView),
+        ):
+            view = self.setup_view(view_class, factory.get(path), user)
+            queryset = view.get_queryset()
+            yield name, queryset[:view.paginate_by]
+
+        thread_id = thread_id or Thread.objects.order_by('-created_at').values_list('pk', flat=True).first()
+        if thread_id is None:
+            yield 'ThreadDetailView (replies)', None
+            return
+        if not Thread.objects.filter(pk=thread_id).exists():
+            raise CommandError(f'Thread {thread_id} does not exist')
+        # Not get_object(), which refreshes stale HTML and like counts.
+        view = self.setup_view(ThreadDetailView, factory.get('/'), user, pk=thread_id)
+        yield 'ThreadDetailView (thread)', view.get_queryset().filter(pk=thread_id)
+        yield 'ThreadDetailView (replies)', replies_queryset(thread_id)[:REPLIES_PER_PAGE + 1]
+
+    def setup_view(self, view_class, request, user, **kwargs):
+        request.user = user
+        view = view_class()
+        view.setup(request, **kwargs)
+        return view
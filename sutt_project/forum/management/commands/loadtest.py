@@ -0,0 +1,126 @@
+import json
+import os
+import sys
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from forum import loadtest
+from forum.models import Thread
+
+SERVERS = ('runserver', 'gunicorn', 'asgi')
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a seeded mix of thread list, search, thread page, like, reply and upload requests '
+        'against a server and report p50/p95/p99 latency and requests/sec per URL name. '
+        'Run it against the same database as the server, or let --serve start one. '
+        'With --baseline, exits with an error when the run regressed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000', help='Server to load')
+        parser.add_argument('--serve', choices=SERVERS, help='Start this server on --base-url for the run')
+        parser.add_argument('--server-workers', type=int, default=4, help='Worker processes for --serve gunicorn/asgi')
+        parser.add_argument('--seed-threads', type=int, default=0, help='Run seed_bulk first if there are fewer threads than this')
+        parser.add_argument('--mix', choices=['read', 'mixed', 'write', 'hot'], default='mixed', help='Request mix to replay')
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent logged-in sessions')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per session')
+        parser.add_argument('--warmup', type=int, default=10, help='Unrecorded requests per session before the run')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the request mix')
+        parser.add_argument('--label', default='', help='Name for this run in the output, e.g. wsgi or asgi')
+        parser.add_argument('--json', metavar='PATH', help='Also write the results as JSON')
+        parser.add_argument('--baseline', metavar='PATH', help='JSON from an earlier run to compare against')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative slowdown against --baseline')
+        parser.add_argument('--min-delta-ms', type=float, default=5, help='Ignore latency increases smaller than this')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        existing = Thread.objects.count()
+        if existing < options['seed_threads']:
+            missing = options['seed_threads'] - existing
+            call_command('seed_bulk', threads=missing, users=max(100, missing // 10), seed=options['seed'], stdout=self.stdout)
+
+        thread_ids = list(Thread.objects.order_by('-created_at').values_list('pk', flat=True)[:200])
+        if not thread_ids:
+            raise CommandError('No threads to load; run manage.py seed or pass --seed-threads.')
+        titles = Thread.objects.filter(pk__in=thread_ids).values_list('title', flat=True)
+        search_terms = sorted({title.split()[0].strip(':') for title in titles if title.split()})
+
+        sessions = loadtest.load_sessions(options['concurrency'])
+        mix = loadtest.mixes(thread_ids, search_terms)[options['mix']]
+        base_url = options['base_url'].rstrip('/')
+
+        if options['serve']:
+            with loadtest.serve(self.server_command(options), base_url, env=self.server_env(options)):
+                result = self.run_mix(base_url, mix, sessions, options)
+        else:
+            result = self.run_mix(base_url, mix, sessions, options)
+
+        if options['json']:
+            with open(options['json'], 'w') as out:
+                json.dump(result, out, indent=2)
+
+        if baseline is not None:
+            if baseline.get('mix') != result['mix']:
+                self.stderr.write(self.style.WARNING(f"Baseline used the {baseline.get('mix')} mix, this run {result['mix']}"))
+            regressions = loadtest.compare(result, baseline, options['tolerance'], options['min_delta_ms'])
+            if regressions:
+                for line in regressions:
+                    self.stderr.write(self.style.ERROR(f'  {line}'))
+                raise CommandError(f"{len(regressions)} regressions against {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS(f"✓ No regressions against {options['baseline']}"))
+
+    def run_mix(self, base_url, mix, sessions, options):
+        if options['warmup']:
+            loadtest.run(base_url, mix, sessions, options['warmup'], seed=options['seed'] + 1)
+
+        self.stdout.write(self.style.WARNING(
+            f"Sending {len(sessions) * options['requests']} {options['mix']} requests "
+            f"from {len(sessions)} sessions to {base_url}..."
+        ))
+        samples, elapsed = loadtest.run(base_url, mix, sessions, options['requests'], seed=options['seed'])
+        summary = loadtest.summarize(samples, elapsed)
+        total = sum(len(results) for results in samples.values())
+
+        self.stdout.write(f"{'url name':<18}{'requests':>9}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        for name, row in summary.items():
+            self.stdout.write(
+                f"{name:<18}{row['requests']:>9}{row['errors']:>8}{row['rps']:>9}"
+                f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}"
+            )
+        self.stdout.write(self.style.SUCCESS(f'✓ {total / elapsed:.1f} requests/sec overall in {elapsed:.1f}s'))
+
+        return {
+            'label': options['label'],
+            'base_url': base_url,
+            'server': options['serve'],
+            'mix': options['mix'],
+            'seed': options['seed'],
+            'concurrency': len(sessions),
+            'requests_per_session': options['requests'],
+            'elapsed': round(elapsed, 3),
+            'rps': round(total / elapsed, 1),
+            'urls': summary,
+        }
+
+    def server_command(self, options):
+        address = urlsplit(options['base_url']).netloc
+        if options['serve'] == 'runserver':
+            return [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'runserver', '--noreload', address]
+        command = ['gunicorn', '--chdir', str(settings.BASE_DIR), '--bind', address, '--workers', str(options['server_workers'])]
+        if options['serve'] == 'asgi':
+            return command + ['-k', 'uvicorn_worker.UvicornWorker', 'sutt_project.asgi:application']
+        return command + ['sutt_project.wsgi:application']
+
+    def server_env(self, options):
+        env = dict(os.environ)
+        if options['serve'] == 'asgi':
+            env['FORUM_ASYNC_VIEWS'] = 'True'
+        return env
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from forum.models import Likes, Thread
+
+
+class Command(BaseCommand):
+    help = 'Recompute Thread.likes_count from the Likes table in bulk. Use --dry-run to only report drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report threads whose counter has drifted without fixing them',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Threads per UPDATE statement, by primary key range',
+        )
+
+    def handle(self, *args, **options):
+        actual = Coalesce(
+            Subquery(
+                Likes.objects.filter(thread=OuterRef('pk'))
+                .order_by()
+                .values('thread')
+                .annotate(total=Count('pk'))
+                .values('total')
+            ),
+            0,
+        )
+        drifted = Thread.objects.filter(~Q(likes_count=actual))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{drifted.count()} threads have a drifted likes_count'))
+            return
+
+        batch_size = options['batch_size']
+        last_id = Thread.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        fixed = 0
+        for start in range(0, last_id + 1, batch_size):
+            fixed += drifted.filter(pk__gte=start, pk__lt=start + batch_size).update(likes_count=actual)
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Reconciled likes_count on {fixed} threads'))
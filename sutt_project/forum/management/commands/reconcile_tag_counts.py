@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from forum.models import Tags, Thread
+
+
+class Command(BaseCommand):
+    help = 'Recompute Tags.thread_count from the thread/tag links. Run nightly; use --dry-run to only report drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report tags whose counter has drifted without fixing them',
+        )
+
+    def handle(self, *args, **options):
+        actual = Coalesce(
+            Subquery(
+                Thread.tags.through.objects.filter(tags=OuterRef('pk'))
+                .order_by()
+                .values('tags')
+                .annotate(total=Count('pk'))
+                .values('total')
+            ),
+            0,
+        )
+        drifted = Tags.objects.filter(~Q(thread_count=actual))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{drifted.count()} tags have a drifted thread_count'))
+            return
+
+        fixed = drifted.update(thread_count=actual)
+        self.stdout.write(self.style.SUCCESS(f'✓ Reconciled thread_count on {fixed} tags'))
@@ -0,0 +1,189 @@
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from forum import markup, rendering
+from forum.models import Replies, Thread
+
+MODELS = {'thread': Thread, 'replies': Replies}
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-render stored markdown HTML for threads and replies in a process pool, '
+        'e.g. after changing the bleach allow-list. Use --benchmark to compare worker counts.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Rows sent to a worker and written back per bulk_update',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Render processes (1 renders in this process)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Re-render every row, not only rows rendered with an older policy',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='JSON file recording the last written id per model; an existing file resumes from it',
+        )
+        parser.add_argument(
+            '--benchmark',
+            action='store_true',
+            help='Render (without saving) at 1, 4 and --workers processes and report rows/s',
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--chunk-size and --workers must be positive')
+
+        if options['benchmark']:
+            return self.benchmark(options)
+
+        checkpoint = self.load_checkpoint(options['checkpoint'])
+        started = time.monotonic()
+        for name, model in MODELS.items():
+            queryset = model.objects.all()
+            if not options['all']:
+                queryset = queryset.exclude(content_html_version=rendering.RENDER_VERSION)
+
+            rendered = self.rerender(
+                name, queryset, options['chunk_size'], options['workers'],
+                checkpoint, options['checkpoint'],
+            )
+            self.stdout.write(f'  • {model._meta.verbose_name_plural}: {rendered} rows')
+
+        if options['checkpoint'] and os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Rendered with policy {rendering.RENDER_VERSION} in {time.monotonic() - started:.1f}s'
+        ))
+
+    def chunks(self, queryset, chunk_size, after=0):
+        """
+        Yield [(pk, content), ...] in pk order, one keyset query per chunk.
+        """
+        last_id = after
+        while True:
+            rows = list(
+                queryset.filter(pk__gt=last_id).order_by('pk').values_list('pk', 'content')[:chunk_size]
+            )
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+
+    def render_chunks(self, chunks, workers):
+        """
+        Yield (rows, rendered) per chunk, in order. At most two chunks per
+        worker are in flight so memory stays flat on large tables.
+        """
+        if workers == 1:
+            for rows in chunks:
+                yield rows, markup.render_rows(rows)
+            return
+
+        # Spawned rather than forked, so workers never inherit the parent's
+        # open database connection (CONN_MAX_AGE keeps it open between
+        # chunks). forum.markup imports only markdown and bleach, so
+        # starting a worker loads no Django.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            pending = deque()
+            for rows in chunks:
+                pending.append((rows, pool.submit(markup.render_rows, rows)))
+                if len(pending) >= workers * 2:
+                    rows, future = pending.popleft()
+                    yield rows, future.result()
+            while pending:
+                rows, future = pending.popleft()
+                yield rows, future.result()
+
+    def rerender(self, name, queryset, chunk_size, workers, checkpoint, checkpoint_path):
+        model = queryset.model
+        after = checkpoint.get(name, 0)
+        if after:
+            self.stdout.write(f'  • {name}: resuming after id {after}')
+
+        total = queryset.filter(pk__gt=after).count()
+        rendered = 0
+        started = time.monotonic()
+        for rows, results in self.render_chunks(self.chunks(queryset, chunk_size, after), workers):
+            rendered += self.write_back(model, rows, results)
+            checkpoint[name] = rows[-1][0]
+            self.save_checkpoint(checkpoint_path, checkpoint)
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'    {name}: {rendered}/{total} rows, {rendered / elapsed if elapsed else 0:.0f} rows/s'
+            )
+        return rendered
+
+    def write_back(self, model, rows, results):
+        """
+        Save the rendered HTML of rows whose content is still what was
+        rendered, and return how many were saved. Rows edited while their
+        chunk was in flight were re-rendered by their own save().
+        """
+        rendered_from = dict(rows)
+        with transaction.atomic():
+            current = dict(
+                model.objects.select_for_update().filter(pk__in=rendered_from).values_list('pk', 'content')
+            )
+            unchanged = [(pk, html) for pk, html in results if current.get(pk) == rendered_from[pk]]
+            model.objects.bulk_update(
+                [
+                    model(pk=pk, content_html=html, content_html_version=rendering.RENDER_VERSION)
+                    for pk, html in unchanged
+                ],
+                ['content_html', 'content_html_version'],
+            )
+        return len(unchanged)
+
+    def load_checkpoint(self, path):
+        if not path or not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def save_checkpoint(self, path, checkpoint):
+        if not path:
+            return
+        # Write then rename, so an interrupted run never leaves half a file.
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(f'{path}.tmp', path)
+
+    def benchmark(self, options):
+        rows = [
+            row
+            for model in MODELS.values()
+            for chunk in self.chunks(model.objects.all(), options['chunk_size'])
+            for row in chunk
+        ]
+        if not rows:
+            raise CommandError('Nothing to render; seed some threads first')
+
+        chunk_size = options['chunk_size']
+        chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+        self.stdout.write(self.style.WARNING(f'Rendering {len(rows)} rows in {len(chunks)} chunks (not saved)...'))
+
+        for workers in sorted({1, 4, options['workers']}):
+            started = time.perf_counter()
+            for _ in self.render_chunks(iter(chunks), workers):
+                pass
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'  • {workers:>3} workers: {len(rows) / elapsed:8.1f} rows/s ({elapsed:.2f}s)')
@@ -245,6 +245,7 @@ class Command(BaseCommand):
             for user in selected_users:
                 Likes.objects.get_or_create(thread=thread, user=user)
             thread.likes_count = thread.likes_set.count()
+            thread.reply_count = thread.replies_set.filter(is_deleted=False).count()
             thread.save()
 
         # Create Reports for some threads
@@ -0,0 +1,271 @@
+import math
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+from forum import caching, rendering, taxonomy
+from forum.models import Category, Likes, Replies, Report, Tags, Thread
+
+USER_PREFIX = 'bulk_user_'
+TAG_PREFIX = 'topic-'
+CATEGORIES = ['General Discussion', 'Announcements', 'Help & Support', 'Off-Topic', 'Feedback', 'Courses', 'Projects', 'Events']
+
+TITLE_SUBJECTS = ['Django', 'PostgreSQL', 'React', 'Linear algebra', 'Compilers', 'Operating systems', 'Thermodynamics', 'Data structures', 'Networks', 'Machine learning']
+TITLE_PHRASES = ['question about', 'notes on', 'help with', 'best resources for', 'exam prep:', 'bug in', 'thoughts on', 'project idea:']
+CONTENT_TEMPLATES = [
+    '# {subject}\n\nI have been stuck on this for a while. Does anyone have **working examples**?\n\n- what I tried\n- what failed\n',
+    'Sharing my notes on {subject}.\n\n```\nstep 1\nstep 2\n```\n\nCorrections welcome.',
+    'Quick question about {subject}: is the *official guide* still the best place to start?',
+    '## Summary\n\n{subject} comes up every semester. Collecting the best answers here.\n\n1. Read the docs\n2. Ask early\n3. Share solutions',
+]
+REPLY_TEMPLATES = [
+    'Thanks, this helped!',
+    'Same problem here. The fix for me was clearing the cache.',
+    'Have you read the **official docs**? Section 3 covers exactly this.',
+    '+1, following.',
+    'I wrote up my approach:\n\n```\nexample code\n```',
+    'This depends on your use case, but generally *measure first*.',
+    'Can you share the full error message?',
+    'Great explanation, bookmarking this thread.',
+]
+REPORT_REASONS = ['spam', 'inappropriate', 'harassment', 'misinformation', 'copyright', 'other']
+REPORT_STATUSES = ['pending', 'reviewed', 'resolved']
+
+# Multiplier for mapping a thread's index to its popularity rank; prime,
+# so i -> i * RANK_STRIDE mod N is a permutation.
+RANK_STRIDE = 2654435761
+# Tail index of the Pareto distribution for reply counts.
+REPLY_TAIL = 1.6
+MAX_REPLIES = 5000
+
+
+def skewed(rng, n, power):
+    """
+    An index in [0, n) where low indices are far more likely: a cheap
+    stand-in for a power-law choice over millions of items.
+    """
+    return min(int(n * rng.random() ** power), n - 1)
+
+
+def rounded(rng, x):
+    """
+    Round x up with probability equal to its fraction, so sums stay unbiased.
+    """
+    whole = int(x)
+    return whole + (rng.random() < x - whole)
+
+
+@contextmanager
+def explicit_created_at(*models):
+    """
+    Let bulk_create keep the created_at values we generate instead of
+    auto_now_add overwriting them with now().
+    """
+    fields = [model._meta.get_field('created_at') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def seed_shard(shard, params):
+    """
+    Generate threads [start, end) and everything hanging off them. Runs in
+    a worker process; everything is drawn from an RNG seeded by
+    (seed, shard), so output doesn't depend on the number of workers.
+    Returns row counts.
+    """
+    start = shard * params['shard_size']
+    end = min(start + params['shard_size'], params['threads'])
+    rng = random.Random(f"{params['seed']}:{shard}")
+    batch_size = params['batch_size']
+
+    user_ids = list(User.objects.filter(username__startswith=USER_PREFIX).order_by('pk').values_list('pk', flat=True))
+    category_ids = list(Category.objects.filter(name__in=CATEGORIES).order_by('pk').values_list('pk', flat=True))
+    tag_ids = list(Tags.objects.filter(name__startswith=TAG_PREFIX).order_by('pk').values_list('pk', flat=True))
+    # Few distinct bodies, so render each once instead of per row.
+    content_html = {
+        (template, subject): rendering.render_markdown(CONTENT_TEMPLATES[template].format(subject=subject))
+        for template in range(len(CONTENT_TEMPLATES))
+        for subject in TITLE_SUBJECTS
+    }
+    reply_html = [rendering.render_markdown(t) for t in REPLY_TEMPLATES]
+
+    n_users = len(user_ids)
+    total_likes = params['threads'] * params['likes_per_thread']
+    now = params['now']
+    span = params['days'] * 86400
+    counts = Counter()
+
+    with explicit_created_at(Thread, Replies, Likes, Report):
+        for batch_start in range(start, end, batch_size):
+            threads = []
+            for i in range(batch_start, min(batch_start + batch_size, end)):
+                subject = rng.choice(TITLE_SUBJECTS)
+                template = rng.randrange(len(CONTENT_TEMPLATES))
+                rank = i * RANK_STRIDE % params['threads'] + 1
+                n_likes = min(rounded(rng, total_likes * rank ** -params['zipf'] / params['harmonic']), n_users)
+                # Pareto(a) - 1 has mean 1 / (a - 1).
+                n_replies = min(int(params['replies_per_thread'] * (REPLY_TAIL - 1) * (rng.paretovariate(REPLY_TAIL) - 1)), MAX_REPLIES)
+                # Later threads are newer, so keyset pages line up with ids.
+                created_at = now - timedelta(seconds=span * (1 - i / params['threads']) + rng.random() * 60)
+                threads.append(Thread(
+                    title=f'{subject}: {rng.choice(TITLE_PHRASES)} #{i}',
+                    content=CONTENT_TEMPLATES[template].format(subject=subject),
+                    content_html=content_html[template, subject],
+                    content_html_version=rendering.RENDER_VERSION,
+                    author_id=user_ids[skewed(rng, n_users, 2)],
+                    category_id=rng.choice(category_ids),
+                    likes_count=n_likes,
+                    reply_count=n_replies,
+                    created_at=created_at,
+                ))
+            Thread.objects.bulk_create(threads, batch_size=batch_size)
+            counts['threads'] += len(threads)
+
+            links, replies, likes, reports = [], [], [], []
+            for thread in threads:
+                for tag_id in {tag_ids[skewed(rng, len(tag_ids), 3)] for _ in range(1 + skewed(rng, 4, 2))}:
+                    links.append(Thread.tags.through(thread_id=thread.pk, tags_id=tag_id))
+
+                offset = 0
+                for _ in range(thread.reply_count):
+                    offset += rng.expovariate(1 / 3600)
+                    template = rng.randrange(len(REPLY_TEMPLATES))
+                    replies.append(Replies(
+                        thread_id=thread.pk,
+                        content=REPLY_TEMPLATES[template],
+                        content_html=reply_html[template],
+                        content_html_version=rendering.RENDER_VERSION,
+                        author_id=user_ids[skewed(rng, n_users, 2.5)],
+                        created_at=min(thread.created_at + timedelta(seconds=offset), now),
+                    ))
+
+                for user_index in rng.sample(range(n_users), thread.likes_count):
+                    likes.append(Likes(thread_id=thread.pk, user_id=user_ids[user_index], created_at=thread.created_at))
+
+                if rng.random() < params['report_rate']:
+                    for user_index in rng.sample(range(n_users), min(rng.randint(1, 2), n_users)):
+                        reports.append(Report(
+                            thread_id=thread.pk,
+                            reporter_id=user_ids[user_index],
+                            reason=rng.choice(REPORT_REASONS),
+                            description='Generated report.',
+                            status=rng.choice(REPORT_STATUSES),
+                            created_at=thread.created_at,
+                        ))
+
+            for model, rows in ((Thread.tags.through, links), (Replies, replies), (Likes, likes), (Report, reports)):
+                model.objects.bulk_create(rows, batch_size=batch_size)
+            counts.update(tags=len(links), replies=len(replies), likes=len(likes), reports=len(reports))
+
+    connection.close()
+    return counts
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a large synthetic dataset for load and performance testing: Zipf-distributed '
+        'thread popularity, long-tail reply counts, skewed user activity. Deterministic for a '
+        'given --seed, in parallel worker processes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000, help='Users to create')
+        parser.add_argument('--threads', type=int, default=100000, help='Threads to create')
+        parser.add_argument('--replies-per-thread', type=float, default=8, help='Mean replies per thread (Pareto tail)')
+        parser.add_argument('--likes-per-thread', type=float, default=5, help='Mean likes per thread (Zipf by popularity)')
+        parser.add_argument('--tags', type=int, default=500, help='Tags to create')
+        parser.add_argument('--report-rate', type=float, default=0.01, help='Share of threads that get reports')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent for thread popularity')
+        parser.add_argument('--days', type=int, default=365, help='Spread threads over this many days back')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per bulk_create')
+        parser.add_argument('--shard-size', type=int, default=10000, help='Threads generated per worker task')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Worker processes (default: CPU count on PostgreSQL, 1 on SQLite, which allows one writer)',
+        )
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['threads'], options['tags'], options['batch_size'], options['shard_size']) < 1:
+            raise CommandError('--users, --threads, --tags, --batch-size and --shard-size must be positive')
+        workers = options['workers'] or (os.cpu_count() or 1 if connection.vendor == 'postgresql' else 1)
+        started = time.monotonic()
+
+        self.stdout.write(self.style.WARNING(
+            f"Seeding {options['users']} users and {options['threads']} threads "
+            f"on {workers} workers (seed {options['seed']})..."
+        ))
+        self.create_users(options['users'], options['batch_size'])
+        Category.objects.bulk_create([Category(name=name) for name in CATEGORIES if not Category.objects.filter(name=name).exists()])
+        Tags.objects.bulk_create(
+            [Tags(name=f'{TAG_PREFIX}{i}') for i in range(options['tags'])],
+            batch_size=options['batch_size'],
+            ignore_conflicts=True,
+        )
+
+        params = {
+            key: options[key]
+            for key in ('threads', 'replies_per_thread', 'likes_per_thread', 'report_rate', 'zipf', 'days', 'seed', 'batch_size', 'shard_size')
+        }
+        params['now'] = timezone.now()
+        params['harmonic'] = math.fsum(k ** -options['zipf'] for k in range(1, options['threads'] + 1))
+
+        totals = Counter()
+        shards = range(math.ceil(options['threads'] / options['shard_size']))
+        for counts in self.run_shards(shards, params, workers):
+            totals.update(counts)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"    {totals['threads']}/{options['threads']} threads, {totals['replies']} replies, "
+                f"{totals['likes']} likes ({sum(totals.values()) / elapsed:.0f} rows/s)"
+            )
+
+        call_command('reconcile_tag_counts', stdout=self.stdout)
+        # Nothing above sent signals, so invalidate caches by hand.
+        caching.bump_version('threads')
+        caching.bump_version('taxonomy')
+        taxonomy.clear()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {totals['threads']} threads, {totals['replies']} replies, {totals['likes']} likes, "
+            f"{totals['tags']} thread tags and {totals['reports']} reports in {time.monotonic() - started:.1f}s"
+        ))
+
+    def create_users(self, count, batch_size):
+        password = make_password('password123')
+        for start in range(0, count, batch_size):
+            User.objects.bulk_create(
+                [
+                    User(username=f'{USER_PREFIX}{i}', email=f'{USER_PREFIX}{i}@example.com', password=password)
+                    for i in range(start, min(start + batch_size, count))
+                ],
+                ignore_conflicts=True,
+            )
+
+    def run_shards(self, shards, params, workers):
+        if workers == 1:
+            for shard in shards:
+                yield seed_shard(shard, params)
+            return
+
+        # Forked workers must not share the parent's database socket.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(seed_shard, shards, [params] * len(shards)):
+                yield result
@@ -0,0 +1,45 @@
+"""
+The markdown and bleach policy behind forum/rendering.py, kept free of
+Django imports so ``manage.py rerender_content`` workers load nothing else.
+"""
+
+import hashlib
+import json
+
+import bleach
+import markdown
+
+MARKDOWN_EXTENSIONS = ['fenced_code', 'codehilite']
+
+ALLOWED_TAGS = [
+    "p", "h1", "h2", "h3", "h4", "h5", "h6",
+    "ul", "ol", "li",
+    "strong", "em", "blockquote",
+    "code", "pre",
+    "a",
+    "img",
+]
+
+ALLOWED_ATTRIBUTES = {
+    "a": ["href", "title"],
+    "img": ["src", "alt", "width", "height"],
+}
+
+RENDER_VERSION = hashlib.sha256(
+    json.dumps([MARKDOWN_EXTENSIONS, ALLOWED_TAGS, ALLOWED_ATTRIBUTES], sort_keys=True).encode()
+).hexdigest()[:16]
+
+
+def to_html(text):
+    return markdown.markdown(text or '', extensions=MARKDOWN_EXTENSIONS)
+
+
+def sanitize(html):
+    return bleach.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, strip=True)
+
+
+def render_rows(rows):
+    """
+    Render [(pk, content), ...] to [(pk, html), ...].
+    """
+    return [(pk, sanitize(to_html(content))) for pk, content in rows]
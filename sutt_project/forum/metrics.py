@@ -0,0 +1,213 @@
+"""
+Prometheus metrics, served at /metrics when FORUM_METRICS is on.
+
+- forum_request_duration_seconds and forum_requests_total, per URL name;
+- forum_db_queries_per_request, per URL name;
+- forum_cache_requests_total by result; the hit ratio is
+  ``rate(forum_cache_requests_total{result="hit"}[5m])
+  / rate(forum_cache_requests_total[5m])``;
+- forum_task_duration_seconds and forum_task_retries_total per Celery task,
+  which covers the email tasks in forum/tasks.py and users/tasks.py;
+- forum_email_send_seconds per SMTP batch in forum/delivery.py, and
+  forum_emails_total by result (sent, failed, abandoned);
+- forum_email_queue_depth (unsent notifications) and
+  forum_celery_queue_length, read from the database and broker at scrape
+  time;
+- forum_activity_total for likes, replies and reports.
+
+Requests are counted by MetricsMiddleware, which shares the request's
+forum.profiling.Profile, so SQL and cache counting costs the same
+wrappers the profiler uses.
+
+gunicorn and Celery run several processes, each with its own values. Set
+PROMETHEUS_MULTIPROC_DIR to a directory per process group (web, Celery
+workers); prometheus_client then keeps values in files there, and the
+view merges the files from every directory in FORUM_METRICS_DIRS. Groups
+must not share a directory, since process ids repeat across containers.
+"""
+
+import glob
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from celery import current_app
+from celery import signals as celery_signals
+from django.conf import settings
+from django.http import HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+
+from forum import profiling
+from forum.models import PendingNotification
+from forum.multiprocess import clear_directory
+
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+REQUEST_LATENCY = Histogram(
+    'forum_request_duration_seconds', 'Request latency by URL name', ['url_name', 'method'],
+)
+REQUESTS = Counter(
+    'forum_requests_total', 'Requests by URL name and status class', ['url_name', 'method', 'status'],
+)
+DB_QUERIES = Histogram(
+    'forum_db_queries_per_request', 'SQL queries per request by URL name', ['url_name'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, float('inf')),
+)
+CACHE_REQUESTS = Counter(
+    'forum_cache_requests_total', 'Cache reads during requests', ['result'],
+)
+TASK_LATENCY = Histogram(
+    'forum_task_duration_seconds', 'Celery task run time', ['task'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf')),
+)
+TASK_RETRIES = Counter(
+    'forum_task_retries_total', 'Celery task retries', ['task'],
+)
+EMAIL_SEND_LATENCY = Histogram(
+    'forum_email_send_seconds', 'Time to send one batch of notification emails over SMTP',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float('inf')),
+)
+EMAILS = Counter(
+    'forum_emails_total', 'Notification emails by delivery result', ['result'],
+)
+ACTIVITY = Counter(
+    'forum_activity_total', 'Likes, replies and reports created', ['kind'],
+)
+
+
+class QueueCollector:
+    """
+    Queue sizes, read when Prometheus scrapes rather than tracked live.
+    """
+
+    def describe(self):
+        # Lets the registry check names without running the queries.
+        return [self.depth_family(), self.length_family()]
+
+    def depth_family(self):
+        return GaugeMetricFamily('forum_email_queue_depth', 'Notifications waiting to be sent')
+
+    def length_family(self):
+        return GaugeMetricFamily('forum_celery_queue_length', 'Messages waiting in the Celery broker', labels=['queue'])
+
+    def collect(self):
+        depth = self.depth_family()
+        depth.add_metric([], PendingNotification.objects.filter(sent_at__isnull=True).count())
+        yield depth
+
+        length = self.length_family()
+        queue = current_app.conf.task_default_queue
+        try:
+            with current_app.connection_for_read() as connection:
+                connection.ensure_connection(max_retries=1)
+                length.add_metric([queue], connection.default_channel.queue_declare(queue, passive=True).message_count)
+        except Exception:
+            # The broker being down shouldn't fail the whole scrape.
+            pass
+        yield length
+
+
+class DirectoriesCollector:
+    """
+    Merge the multiprocess files of every directory in FORUM_METRICS_DIRS.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+
+    def collect(self):
+        files = [name for path in self.paths for name in glob.glob(os.path.join(path, '*.db'))]
+        return MultiProcessCollector.merge(files, accumulate=True)
+
+
+def registry():
+    if not MULTIPROCESS:
+        return REGISTRY
+    registry = CollectorRegistry()
+    registry.register(DirectoriesCollector(settings.FORUM_METRICS_DIRS))
+    registry.register(QueueCollector())
+    return registry
+
+
+if not MULTIPROCESS:
+    REGISTRY.register(QueueCollector())
+
+
+def metrics_view(request):
+    return HttpResponse(generate_latest(registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profiling.install_query_recorder()
+        profile = profiling.Profile()
+        token = profiling.current.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiling.current.reset(token)
+        self.observe(request, response, profile)
+        return response
+
+    async def __acall__(self, request):
+        # Connections opened in sync_to_async threads get the query
+        # recorder from the connection_created receiver in forum/signals.py.
+        profile = profiling.Profile()
+        token = profiling.current.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiling.current.reset(token)
+        self.observe(request, response, profile)
+        return response
+
+    def observe(self, request, response, profile):
+        match = request.resolver_match
+        # Never the raw path, which would make a label per URL.
+        url_name = (match.url_name or match.view_name) if match else 'unresolved'
+        REQUEST_LATENCY.labels(url_name, request.method).observe(time.perf_counter() - profile.started)
+        REQUESTS.labels(url_name, request.method, f'{response.status_code // 100}xx').inc()
+        DB_QUERIES.labels(url_name).observe(profile.queries)
+        if profile.cache_hits:
+            CACHE_REQUESTS.labels('hit').inc(profile.cache_hits)
+        if profile.cache_misses:
+            CACHE_REQUESTS.labels('miss').inc(profile.cache_misses)
+
+
+_task_started = {}
+
+
+@celery_signals.task_prerun.connect
+def start_task_timer(task_id, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@celery_signals.task_postrun.connect
+def observe_task(task_id, task, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        TASK_LATENCY.labels(task.name).observe(time.perf_counter() - started)
+
+
+@celery_signals.task_retry.connect
+def count_task_retry(sender, **kwargs):
+    TASK_RETRIES.labels(sender.name).inc()
+
+
+@celery_signals.worker_init.connect
+def clear_worker_metrics(**kwargs):
+    if MULTIPROCESS:
+        clear_directory()
@@ -0,0 +1,85 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:31
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class AddIndexConcurrentlyOnPostgres(AddIndexConcurrently):
+    """
+    CREATE INDEX CONCURRENTLY on PostgreSQL, so building an index on a
+    large table doesn't block writes to it; a plain AddIndex elsewhere.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("forum", "0010_pendingnotification"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # Every list index ends in id, the tiebreaker of the keyset pagination
+    # in forum/pagination.py. Threads and replies are the large tables.
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name="replies",
+            index=models.Index(
+                condition=models.Q(("is_deleted", False)),
+                fields=["thread", "created_at"],
+                name="forum_replies_live_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="report",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="forum_report_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="report",
+            index=models.Index(
+                fields=["status", "-created_at", "-id"], name="forum_report_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="report",
+            index=models.Index(
+                fields=["reason", "-created_at", "-id"], name="forum_report_reason_idx"
+            ),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name="thread",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="forum_thread_created_idx"
+            ),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name="thread",
+            index=models.Index(
+                fields=["category", "-created_at", "-id"],
+                name="forum_thread_cat_created_idx",
+            ),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name="thread",
+            index=models.Index(
+                fields=["author", "-created_at", "-id"],
+                name="forum_thread_auth_created_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:34
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# Keep the text search configuration in sync with forum.search.SEARCH_CONFIG.
+CREATE_TRIGGER = """
+CREATE OR REPLACE FUNCTION forum_thread_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.content, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS forum_thread_search_vector_trigger ON forum_thread;
+CREATE TRIGGER forum_thread_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, content ON forum_thread
+    FOR EACH ROW EXECUTE FUNCTION forum_thread_search_vector_update();
+
+CREATE INDEX IF NOT EXISTS forum_thread_search_vector_gin ON forum_thread USING gin (search_vector);
+
+-- Full-text search replaces trigram matching on content.
+DROP INDEX IF EXISTS forum_thread_content_trgm;
+"""
+
+DROP_TRIGGER = """
+DROP INDEX IF EXISTS forum_thread_search_vector_gin;
+DROP TRIGGER IF EXISTS forum_thread_search_vector_trigger ON forum_thread;
+DROP FUNCTION IF EXISTS forum_thread_search_vector_update();
+CREATE INDEX IF NOT EXISTS forum_thread_content_trgm ON forum_thread USING gin (content gin_trgm_ops);
+"""
+
+
+def create_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_TRIGGER)
+
+
+def drop_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0012_thread_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="thread",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        # Existing rows are filled in by `manage.py backfill_search_vector`.
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
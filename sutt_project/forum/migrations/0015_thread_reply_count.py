@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:39
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_reply_count(apps, schema_editor):
+    Thread = apps.get_model("forum", "Thread")
+    Replies = apps.get_model("forum", "Replies")
+    live = (
+        Replies.objects.filter(thread=OuterRef("pk"), is_deleted=False)
+        .order_by()
+        .values("thread")
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    Thread.objects.update(reply_count=Coalesce(Subquery(live), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0013_thread_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="thread",
+            name="reply_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_reply_count, migrations.RunPython.noop),
+    ]
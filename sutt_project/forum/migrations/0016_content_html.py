@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0015_thread_reply_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="replies",
+            name="content_html",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="replies",
+            name="content_html_version",
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name="thread",
+            name="content_html",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="thread",
+            name="content_html_version",
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+    ]
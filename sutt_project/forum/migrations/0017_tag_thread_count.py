@@ -0,0 +1,47 @@
+# Generated by Django 5.1.3 on 2026-10-18 17:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_thread_count(apps, schema_editor):
+    Tags = apps.get_model("forum", "Tags")
+    Thread = apps.get_model("forum", "Thread")
+    through = Thread.tags.through
+    used = (
+        through.objects.filter(tags=OuterRef("pk"))
+        .order_by()
+        .values("tags")
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    Tags.objects.update(thread_count=Coalesce(Subquery(used), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0016_content_html"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tags",
+            name="thread_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="tags",
+            index=models.Index(
+                fields=["-thread_count", "name"], name="forum_tags_count_idx"
+            ),
+        ),
+        # The auto-created through table only has single-column indexes;
+        # tag filters read (tags_id, thread_id) straight from this one.
+        migrations.RunSQL(
+            "CREATE INDEX forum_thread_tags_tag_thread_idx ON forum_thread_tags (tags_id, thread_id)",
+            "DROP INDEX forum_thread_tags_tag_thread_idx",
+        ),
+        migrations.RunPython(backfill_thread_count, migrations.RunPython.noop),
+    ]
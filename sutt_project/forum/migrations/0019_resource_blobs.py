@@ -0,0 +1,61 @@
+# Generated by Django 5.1.3 on 2026-10-18 17:01
+
+import django.db.models.deletion
+import forum.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0018_upload_sessions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResourceBlob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sha256", models.CharField(max_length=64, unique=True)),
+                (
+                    "file",
+                    models.FileField(max_length=200, upload_to=forum.models.blob_path),
+                ),
+                ("size", models.PositiveBigIntegerField()),
+                ("ref_count", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="threadresource",
+            name="original_name",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name="threadresource",
+            name="file",
+            field=models.FileField(
+                max_length=200, upload_to="thread_resources/%Y/%m/%d/"
+            ),
+        ),
+        migrations.AddField(
+            model_name="threadresource",
+            name="blob",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="resources",
+                to="forum.resourceblob",
+            ),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from collections import defaultdict
+
+from django.db import migrations
+
+
+def merge_case_duplicates(apps, schema_editor):
+    """
+    Tag names are stored lower-cased since tags are resolved by their
+    normalized name. Lower-case older tags, merging "Django" into an
+    existing "django" and moving its threads across.
+    """
+    Tags = apps.get_model("forum", "Tags")
+    Thread = apps.get_model("forum", "Thread")
+    through = Thread.tags.through
+
+    groups = defaultdict(list)
+    for tag in Tags.objects.order_by("pk"):
+        groups[tag.name.strip().lower()].append(tag)
+
+    for name, tags in groups.items():
+        if len(tags) == 1 and tags[0].name == name:
+            continue
+        # Keep the row already named correctly, else the oldest.
+        keeper = next((tag for tag in tags if tag.name == name), tags[0])
+        duplicates = [tag.pk for tag in tags if tag.pk != keeper.pk]
+        if duplicates:
+            tagged = set(through.objects.filter(tags=keeper).values_list("thread_id", flat=True))
+            moved = set(through.objects.filter(tags__in=duplicates).values_list("thread_id", flat=True)) - tagged
+            through.objects.bulk_create([through(thread_id=thread_id, tags_id=keeper.pk) for thread_id in moved])
+            through.objects.filter(tags__in=duplicates).delete()
+            Tags.objects.filter(pk__in=duplicates).delete()
+        keeper.name = name
+        keeper.thread_count = through.objects.filter(tags=keeper).count()
+        keeper.save(update_fields=["name", "thread_count"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0019_resource_blobs"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_case_duplicates, migrations.RunPython.noop),
+    ]
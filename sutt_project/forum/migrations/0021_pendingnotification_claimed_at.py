@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0020_lowercase_tag_names"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pendingnotification",
+            name="claimed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,6 +1,11 @@
+import uuid
+
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from martor.models import MartorField
 
+from forum.rendering import RenderedContentMixin
+
 
 # Create your models here.
 class Course(models.Model):
@@ -17,31 +22,59 @@ class Category(models.Model):
   def __str__(self):
     return self.name
   
-class Thread(models.Model):
+class Thread(RenderedContentMixin, models.Model):
   title = models.CharField(max_length=200)
   content = models.TextField()
   author = models.ForeignKey('auth.User', on_delete=models.SET_NULL,null=True)
   category = models.ForeignKey(Category, on_delete=models.SET_NULL,null=True)
   locked = models.BooleanField(default=False)
   likes_count = models.PositiveIntegerField(default=0)
+  reply_count = models.PositiveIntegerField(default=0)
   created_at = models.DateTimeField(auto_now_add=True)
   updated_at = models.DateTimeField(auto_now=True)
   tags = models.ManyToManyField('Tags', blank=True)
+  # Weighted title/content document, maintained by a PostgreSQL trigger
+  # (migration 0013) and backfilled with `manage.py backfill_search_vector`.
+  search_vector = SearchVectorField(null=True, editable=False)
+  # Sanitized HTML of content, see forum/rendering.py.
+  content_html = models.TextField(blank=True, editable=False)
+  content_html_version = models.CharField(max_length=16, blank=True, editable=False)
   
   def __str__(self):
     return self.title
   
-class Replies(models.Model):
+  class Meta:
+    indexes = [
+      # Thread list ordering, and the per-category / per-author filters.
+      # Keyset pagination walks (created_at, id), so id is the tiebreaker.
+      models.Index(fields=['-created_at', '-id'], name='forum_thread_created_idx'),
+      models.Index(fields=['category', '-created_at', '-id'], name='forum_thread_cat_created_idx'),
+      models.Index(fields=['author', '-created_at', '-id'], name='forum_thread_auth_created_idx'),
+    ]
+  
+class Replies(RenderedContentMixin, models.Model):
   thread = models.ForeignKey(Thread, on_delete=models.CASCADE)
   content = models.TextField()
   author = models.ForeignKey('auth.User', on_delete=models.SET_NULL,null=True)
   is_deleted = models.BooleanField(default=False)
   created_at = models.DateTimeField(auto_now_add=True)
   updated_at = models.DateTimeField(auto_now=True)
+  content_html = models.TextField(blank=True, editable=False)
+  content_html_version = models.CharField(max_length=16, blank=True, editable=False)
   
   def __str__(self):
     return f"Reply by {self.author.username} on {self.thread.title}"
   
+  class Meta:
+    indexes = [
+      # Replies shown on a thread page; deleted replies are never listed.
+      models.Index(
+        fields=['thread', 'created_at'],
+        condition=models.Q(is_deleted=False),
+        name='forum_replies_live_idx',
+      ),
+    ]
+  
 class Likes(models.Model):
   thread = models.ForeignKey(Thread, on_delete=models.CASCADE)
   user = models.ForeignKey('auth.User', on_delete=models.CASCADE)
@@ -52,9 +85,23 @@ class Likes(models.Model):
     
 class Tags(models.Model):
   name = models.CharField(max_length=50, unique=True)
+  # Threads carrying this tag, maintained from m2m_changed signals and
+  # repaired nightly by `manage.py reconcile_tag_counts`.
+  thread_count = models.PositiveIntegerField(default=0)
   
   def __str__(self):
     return self.name
+
+  def save(self, *args, **kwargs):
+    # Tags are resolved by lower-cased name (see services.normalize_tag_names).
+    self.name = self.name.strip().lower()
+    super().save(*args, **kwargs)
+  
+  class Meta:
+    indexes = [
+      # Tag cloud, most used first.
+      models.Index(fields=['-thread_count', 'name'], name='forum_tags_count_idx'),
+    ]
     
 class Report(models.Model):
   REASON_CHOICES = [
@@ -85,6 +132,30 @@ class Report(models.Model):
   
   class Meta:
     unique_together = ('thread', 'reporter')
+    indexes = [
+      # Moderator report list, newest first, optionally filtered.
+      models.Index(fields=['-created_at', '-id'], name='forum_report_created_idx'),
+      models.Index(fields=['status', '-created_at', '-id'], name='forum_report_status_idx'),
+      models.Index(fields=['reason', '-created_at', '-id'], name='forum_report_reason_idx'),
+    ]
+
+def blob_path(instance, filename):
+  return f'blobs/{instance.sha256[:2]}/{instance.sha256[2:4]}/{instance.sha256}'
+
+class ResourceBlob(models.Model):
+  """
+  One stored copy of a file's content, shared by every ThreadResource with
+  the same SHA-256. ``ref_count`` is maintained by forum/blobs.py; the file
+  is removed when it drops to zero.
+  """
+  sha256 = models.CharField(max_length=64, unique=True)
+  file = models.FileField(upload_to=blob_path, max_length=200)
+  size = models.PositiveBigIntegerField()
+  ref_count = models.PositiveIntegerField(default=0)
+  created_at = models.DateTimeField(auto_now_add=True)
+
+  def __str__(self):
+    return f"{self.sha256[:12]} ({self.ref_count} refs)"
 
 class ThreadResource(models.Model):
   FILE_TYPE_CHOICES = [
@@ -98,14 +169,80 @@ class ThreadResource(models.Model):
   
   thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name='thread_resources')
   title = models.CharField(max_length=200)
-  file = models.FileField(upload_to='thread_resources/%Y/%m/%d/')
+  # Points at blob.file once the content is stored in a ResourceBlob; files
+  # from before content addressing keep their dated path until
+  # `manage.py dedupe_resources` moves them over.
+  file = models.FileField(upload_to='thread_resources/%Y/%m/%d/', max_length=200)
+  blob = models.ForeignKey(ResourceBlob, on_delete=models.PROTECT, null=True, blank=True, editable=False, related_name='resources')
+  # The uploader's file name, used for downloads.
+  original_name = models.CharField(max_length=255, blank=True)
   file_type = models.CharField(max_length=50, choices=FILE_TYPE_CHOICES, default='other')
   uploaded_by = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True)
   description = models.TextField(blank=True, null=True)
   created_at = models.DateTimeField(auto_now_add=True)
+  # Thumbnail for images and PDFs, generated by a Celery task.
+  preview = models.ImageField(upload_to='thread_resources/previews/', blank=True, editable=False)
   
   def __str__(self):
     return f"{self.title} - {self.thread.title}"
   
   class Meta:
     ordering = ['-created_at']
+
+class PendingNotification(models.Model):
+  KIND_CHOICES = [
+    ('reply', 'Reply'),
+    ('like', 'Like'),
+    ('report', 'Report'),
+    ('admin', 'Admin'),
+    ('welcome', 'Welcome'),
+  ]
+
+  # Kinds that are merged into one digest per recipient and thread.
+  DIGEST_KINDS = ('reply', 'like')
+
+  recipient = models.EmailField()
+  thread = models.ForeignKey(Thread, on_delete=models.CASCADE, null=True, blank=True, related_name='pending_notifications')
+  kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+  actor_name = models.CharField(max_length=150, blank=True)
+  subject = models.CharField(max_length=255)
+  html_message = models.TextField()
+  attempts = models.PositiveSmallIntegerField(default=0)
+  created_at = models.DateTimeField(auto_now_add=True)
+  # Set while a delivery run is sending it (see forum/delivery.py).
+  claimed_at = models.DateTimeField(null=True, blank=True)
+  sent_at = models.DateTimeField(null=True, blank=True)
+
+  def __str__(self):
+    return f"{self.get_kind_display()} notification for {self.recipient}"
+
+  class Meta:
+    ordering = ['created_at']
+    indexes = [
+      models.Index(
+        fields=['created_at'],
+        condition=models.Q(sent_at__isnull=True),
+        name='forum_pendingnotif_unsent_idx',
+      ),
+    ]
+
+class UploadSession(models.Model):
+  """
+  A resumable, chunked resource upload in progress. Chunks are appended to
+  a partial file on the media volume; see forum/uploads.py.
+  """
+  id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+  thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name='upload_sessions')
+  uploaded_by = models.ForeignKey('auth.User', on_delete=models.CASCADE)
+  title = models.CharField(max_length=200)
+  description = models.TextField(blank=True, null=True)
+  filename = models.CharField(max_length=255)
+  size = models.PositiveBigIntegerField()
+  received = models.PositiveBigIntegerField(default=0)
+  # Detected from the first chunk's magic bytes, never from the client.
+  file_type = models.CharField(max_length=50, choices=ThreadResource.FILE_TYPE_CHOICES, blank=True)
+  created_at = models.DateTimeField(auto_now_add=True)
+  updated_at = models.DateTimeField(auto_now=True)
+
+  def __str__(self):
+    return f"Upload of {self.filename} ({self.received}/{self.size})"
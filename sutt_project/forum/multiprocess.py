@@ -0,0 +1,16 @@
+"""
+prometheus_client multiprocess housekeeping shared by forum/metrics.py and
+gunicorn.conf.py. Imports nothing from Django, so the gunicorn master can
+use it before any app is loaded.
+"""
+
+import glob
+import os
+
+
+def clear_directory():
+    """
+    Drop metric files left by this process group's previous run.
+    """
+    for name in glob.glob(os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], '*.db')):
+        os.remove(name)
@@ -0,0 +1,196 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are addressed by the (created_at, id) of the row at their edge
+instead of an OFFSET, so every page costs one index range scan and no
+COUNT(*). Cursors are signed, opaque tokens. PostgreSQL can also report an
+approximate total from the planner's row estimate.
+"""
+
+import json
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.db import connections
+from django.db.models import Q
+
+CURSOR_SALT = 'forum.pagination'
+
+
+def encode_cursor(obj, field, direction):
+    value = getattr(obj, field)
+    return signing.dumps([value.isoformat(), obj.pk, direction], salt=CURSOR_SALT)
+
+
+def decode_cursor(token):
+    """
+    Return (value, pk, direction), or None for a missing or tampered token.
+    """
+    if not token:
+        return None
+    try:
+        value, pk, direction = signing.loads(token, salt=CURSOR_SALT)
+        return datetime.fromisoformat(value), int(pk), direction
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+
+
+def approximate_count(queryset):
+    """
+    Planner row estimate for a queryset (PostgreSQL only, else None).
+    Costs one EXPLAIN, which plans the query without running it.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CursorPage:
+    is_cursor_page = True
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor, approximate_count=None):
+        self.object_list = object_list
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.approximate_count = approximate_count
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+class CursorPaginator:
+    """
+    Paginate a queryset on (field, pk). ``descending`` matches an
+    ``order_by('-field', '-pk')`` listing, otherwise ``order_by('field', 'pk')``.
+    """
+
+    def __init__(self, queryset, per_page, field='created_at', descending=True, with_count=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+        self.descending = descending
+        self.with_count = with_count
+
+    @property
+    def ordering(self):
+        if self.descending:
+            return (f'-{self.field}', '-pk')
+        return (self.field, 'pk')
+
+    def page_queryset(self, cursor=None):
+        """
+        The unsliced queryset for the page after/before ``cursor``.
+        Backward pages are fetched in reverse order.
+        """
+        decoded = decode_cursor(cursor)
+        if decoded is None:
+            return self.queryset.order_by(*self.ordering), 'next'
+
+        value, pk, direction = decoded
+        forward = direction == 'next'
+        # Walking towards smaller keys?
+        smaller = forward == self.descending
+        if smaller:
+            bound = {f'{self.field}__lte': value}
+            after = Q(**{f'{self.field}__lt': value}) | Q(pk__lt=pk)
+            ordering = (f'-{self.field}', '-pk')
+        else:
+            bound = {f'{self.field}__gte': value}
+            after = Q(**{f'{self.field}__gt': value}) | Q(pk__gt=pk)
+            ordering = (self.field, 'pk')
+        # The redundant bound lets the planner range-scan the index.
+        return self.queryset.filter(**bound).filter(after).order_by(*ordering), direction
+
+    def page(self, cursor=None):
+        queryset, direction = self.page_queryset(cursor)
+        rows = list(queryset[:self.per_page + 1])
+        count = approximate_count(self.queryset) if self.with_count else None
+        return self._make_page(rows, cursor, direction, count)
+
+    async def apage(self, cursor=None):
+        """
+        page() for async views: rows come from the async ORM, the EXPLAIN
+        for the approximate count runs in a worker thread.
+        """
+        queryset, direction = self.page_queryset(cursor)
+        rows = [row async for row in queryset[:self.per_page + 1]]
+        count = await sync_to_async(approximate_count)(self.queryset) if self.with_count else None
+        return self._make_page(rows, cursor, direction, count)
+
+    def _make_page(self, rows, cursor, direction, count):
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if direction == 'next':
+            has_next, has_previous = more, decode_cursor(cursor) is not None
+        else:
+            rows.reverse()
+            has_next, has_previous = True, more
+
+        return CursorPage(
+            rows,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=encode_cursor(rows[-1], self.field, 'next') if rows and has_next else None,
+            previous_cursor=encode_cursor(rows[0], self.field, 'previous') if rows and has_previous else None,
+            approximate_count=count,
+        )
+
+
+class CursorPaginationMixin:
+    """
+    ListView mixin that paginates with CursorPaginator when the queryset is
+    ordered by (created_at, pk), and falls back to offset pagination for
+    other orderings such as ranked search results.
+    """
+
+    cursor_field = 'created_at'
+    cursor_descending = True
+    cursor_count = False
+
+    def get_cursor_paginator(self, queryset, page_size):
+        """
+        A CursorPaginator for the queryset, or None if it isn't ordered by
+        (cursor_field, pk).
+        """
+        paginator = CursorPaginator(
+            queryset, page_size,
+            field=self.cursor_field,
+            descending=self.cursor_descending,
+            with_count=self.cursor_count,
+        )
+        ordering = tuple('-pk' if f in ('-id', '-pk') else 'pk' if f in ('id', 'pk') else f for f in queryset.query.order_by)
+        return paginator if ordering == paginator.ordering else None
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = self.get_cursor_paginator(queryset, page_size)
+        if paginator is None:
+            return super().paginate_queryset(queryset, page_size)
+
+        page = paginator.page(self.request.GET.get('cursor'))
+        return paginator, page, page.object_list, page.has_other_pages()
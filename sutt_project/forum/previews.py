@@ -0,0 +1,80 @@
+"""
+Preview thumbnails for thread resources.
+
+Runs in a Celery worker (forum.tasks.generate_resource_preview_task), never
+on the request path. Images are thumbnailed with Pillow; PDFs have their
+first page rasterized by poppler's ``pdftoppm`` when it is installed.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_SIZE = (320, 320)
+
+
+def _thumbnail(image_file):
+    with Image.open(image_file) as image:
+        image.thumbnail(PREVIEW_SIZE)
+        output = BytesIO()
+        image.convert('RGB').save(output, format='JPEG', quality=80)
+    return output.getvalue()
+
+
+def _render_pdf_page(resource):
+    pdftoppm = shutil.which('pdftoppm')
+    if pdftoppm is None:
+        logger.info("pdftoppm not installed, skipping PDF preview")
+        return None
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, 'source.pdf')
+        with open(source, 'wb') as out, resource.file.open('rb') as pdf:
+            for chunk in pdf.chunks():
+                out.write(chunk)
+        subprocess.run(
+            [pdftoppm, '-jpeg', '-f', '1', '-l', '1', '-scale-to', str(max(PREVIEW_SIZE)), source, os.path.join(workdir, 'page')],
+            check=True,
+            timeout=60,
+            capture_output=True,
+        )
+        pages = [name for name in os.listdir(workdir) if name.startswith('page')]
+        if not pages:
+            return None
+        with open(os.path.join(workdir, pages[0]), 'rb') as page:
+            return _thumbnail(page)
+
+
+def generate_preview(resource):
+    """
+    Build and save resource.preview. Returns True if a preview was made.
+    """
+    if resource.file_type == 'image':
+        try:
+            with resource.file.open('rb') as image_file:
+                data = _thumbnail(image_file)
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+            logger.warning(f"⚠️ Could not thumbnail resource {resource.pk}: {exc}")
+            return False
+    elif resource.file_type == 'pdf':
+        try:
+            data = _render_pdf_page(resource)
+        except (subprocess.SubprocessError, UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+            logger.warning(f"⚠️ Could not render PDF preview for resource {resource.pk}: {exc}")
+            return False
+    else:
+        return False
+
+    if not data:
+        return False
+    resource.preview.save(f'{resource.pk}.jpg', ContentFile(data), save=False)
+    resource.save(update_fields=['preview'])
+    return True
@@ -0,0 +1,218 @@
+"""
+Opt-in per-request profiling, enabled with FORUM_PROFILING.
+
+ProfilingMiddleware samples FORUM_PROFILING_SAMPLE_RATE of requests. For a
+sampled request it records:
+
+- SQL query count and time, through record_query() in each connection's
+  execute_wrappers (the list connection.execute_wrapper() pushes onto). It
+  stays installed for the life of the connection object, so it also sees
+  the queries async views run in sync_to_async threads;
+- template render time, through the DjangoTemplates backend below;
+- cache hits and misses, through the cache backends below;
+- named spans, e.g. markdown and bleach in forum/rendering.py, via span().
+
+The results go out as a Server-Timing header, which browser dev tools show
+in the request's timing tab, and as one JSON line on the forum.profiling
+logger. The current profile lives in a context variable, so hooks outside
+a sampled request cost one lookup and nothing else.
+"""
+
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache.backends import filebased, locmem, redis
+from django.db import connections
+from django.template.backends import django as django_backend
+
+logger = logging.getLogger(__name__)
+
+current = ContextVar('forum_profile', default=None)
+
+MISSING = object()
+
+
+class Profile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # {name: [count, seconds]}
+        self.spans = {}
+
+    def add_span(self, name, seconds):
+        entry = self.spans.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def server_timing(self, total):
+        metrics = [f'db;dur={self.query_time * 1000:.1f};desc="{self.queries} queries"']
+        metrics += [f'{name};dur={seconds * 1000:.1f}' for name, (_, seconds) in self.spans.items()]
+        metrics.append(f'cache;desc="{self.cache_hits} hits / {self.cache_misses} misses"')
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def as_dict(self, total):
+        return {
+            'total_ms': round(total * 1000, 2),
+            'db_queries': self.queries,
+            'db_ms': round(self.query_time * 1000, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'spans': {
+                name: {'count': count, 'ms': round(seconds * 1000, 2)}
+                for name, (count, seconds) in self.spans.items()
+            },
+        }
+
+
+@contextmanager
+def span(name):
+    """
+    Time the block as ``name`` in the current profile, if any.
+    """
+    profile = current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_span(name, time.perf_counter() - started)
+
+
+def record_query(execute, sql, params, many, context):
+    profile = current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries += 1
+        profile.query_time += time.perf_counter() - started
+
+
+def install_query_recorder(connection=None):
+    """
+    Add record_query() to ``connection``, or to all of this thread's
+    connections. Last in the list, so it times the query alone rather than
+    other wrappers.
+    """
+    for wrapper in [connection] if connection else [connections[alias] for alias in connections]:
+        if record_query not in wrapper.execute_wrappers:
+            wrapper.execute_wrappers.append(record_query)
+
+
+def record_cache(hits, misses):
+    profile = current.get()
+    if profile is not None:
+        profile.cache_hits += hits
+        profile.cache_misses += misses
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.FORUM_PROFILING_SAMPLE_RATE
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        install_query_recorder()
+        # MetricsMiddleware may have started one already.
+        profile = current.get() or Profile()
+        token = current.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+
+        # Runs in the thread the async ORM and sync views use.
+        await sync_to_async(install_query_recorder)()
+        profile = current.get() or Profile()
+        token = current.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, profile)
+
+    def finish(self, request, response, profile):
+        total = time.perf_counter() - profile.started
+        response['Server-Timing'] = profile.server_timing(total)
+        match = request.resolver_match
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'url_name': match.url_name if match else None,
+            'status': response.status_code,
+            **profile.as_dict(total),
+        }))
+        return response
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        # Included templates render inside this span, not their own.
+        with span('template'):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+class CacheProfilingMixin:
+    """
+    Count get() results as hits or misses. get_or_set(), aget() and the
+    default get_many() all go through get().
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, MISSING, version)
+        if value is MISSING:
+            record_cache(0, 1)
+            return default
+        record_cache(1, 0)
+        return value
+
+
+class LocMemCache(CacheProfilingMixin, locmem.LocMemCache):
+    pass
+
+
+class FileBasedCache(CacheProfilingMixin, filebased.FileBasedCache):
+    pass
+
+
+class RedisCache(CacheProfilingMixin, redis.RedisCache):
+    def get_many(self, keys, version=None):
+        # One MGET, not a get() per key.
+        found = super().get_many(keys, version)
+        record_cache(len(found), len(keys) - len(found))
+        return found
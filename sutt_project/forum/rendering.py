@@ -0,0 +1,70 @@
+"""
+Markdown rendering for threads and replies.
+
+Content is rendered to sanitized HTML once, when it is saved, and stored in
+``content_html`` next to the ``RENDER_VERSION`` it was rendered with.
+RENDER_VERSION is a hash of the markdown extensions and the bleach
+allow-list in forum/markup.py, so changing either marks every stored
+rendering stale. Stale rows are re-rendered on read and in bulk by
+``manage.py rerender_content``.
+"""
+
+from forum.markup import RENDER_VERSION, sanitize, to_html
+from forum.profiling import span
+
+
+def render_markdown(text):
+    with span('markdown'):
+        html = to_html(text)
+    with span('bleach'):
+        return sanitize(html)
+
+
+def is_stale(obj):
+    return obj.content_html_version != RENDER_VERSION
+
+
+def render(obj):
+    """
+    Render obj.content into obj.content_html. Does not save.
+    """
+    obj.content_html = render_markdown(obj.content)
+    obj.content_html_version = RENDER_VERSION
+
+
+def refresh_stale(objects):
+    """
+    Re-render loaded objects whose HTML predates the current policy and
+    write them back with one bulk_update per model. Returns the objects.
+    """
+    objects = list(objects)
+    stale = [obj for obj in objects if is_stale(obj)]
+    for obj in stale:
+        render(obj)
+    if stale:
+        type(stale[0]).objects.bulk_update(stale, ['content_html', 'content_html_version'])
+    return objects
+
+
+class RenderedContentMixin:
+    """
+    Model mixin that keeps content_html in step with content on save().
+    Saves that don't touch content (``update_fields`` without it) skip the
+    render.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._rendered_content = instance.__dict__.get('content')
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        touches_content = update_fields is None or 'content' in update_fields
+        if touches_content and (is_stale(self) or self.content != getattr(self, '_rendered_content', None)):
+            render(self)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'content_html', 'content_html_version'}
+        super().save(*args, **kwargs)
+        self._rendered_content = self.content
@@ -0,0 +1,87 @@
+"""
+Thread search.
+
+On PostgreSQL, threads are matched against the stored, weighted
+``search_vector`` (title A, content B) through its GIN index and ranked with
+SearchRank. Title trigram similarity (``%`` operator, GIN trigram index from
+migration 0012) is OR-ed in so typos in short titles still match. The
+``%`` threshold, FORUM_SEARCH_SIMILARITY_THRESHOLD, only applies inside
+similarity_threshold(), so search results must be fetched there.
+Other databases (SQLite in development and tests) fall back to a
+case-insensitive substring match.
+"""
+
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramSimilarity,
+)
+from django.db import connections, transaction
+from django.db.models import Case, F, FloatField, Q, Value, When
+
+# Must match the configuration used by the trigger in migration 0013.
+SEARCH_CONFIG = 'english'
+
+
+def thread_search_vector():
+    """
+    Expression for Thread.search_vector, used to backfill existing rows.
+    """
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('content', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+@contextmanager
+def similarity_threshold(using):
+    """
+    Run the block in a transaction whose ``%`` operator uses
+    FORUM_SEARCH_SIMILARITY_THRESHOLD.
+
+    SET LOCAL ends with the transaction, so it can't leak into whatever
+    reuses the connection, and behind PgBouncer's transaction pooling it
+    reaches the same server connection as the search itself.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        yield
+        return
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config('pg_trgm.similarity_threshold', %s, true)",
+                [str(float(settings.FORUM_SEARCH_SIMILARITY_THRESHOLD))],
+            )
+        yield
+
+
+def search_threads(queryset, q):
+    """
+    Filter and rank a Thread queryset by a free-text query.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        return _full_text_search(queryset, q)
+    return _substring_search(queryset, q)
+
+
+def _full_text_search(queryset, q):
+    query = SearchQuery(q, search_type='websearch', config=SEARCH_CONFIG)
+    return queryset.filter(
+        Q(search_vector=query) | Q(title__trigram_similar=q)
+    ).annotate(
+        rank=SearchRank(F('search_vector'), query) + TrigramSimilarity('title', q)
+    ).order_by('-rank', '-created_at')
+
+
+def _substring_search(queryset, q):
+    return queryset.filter(
+        Q(title__icontains=q) | Q(content__icontains=q)
+    ).annotate(
+        rank=Case(
+            When(title__icontains=q, then=Value(1.0)),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    ).order_by('-rank', '-created_at')
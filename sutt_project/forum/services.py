@@ -0,0 +1,112 @@
+"""
+Write paths shared by the forum views.
+
+Counters on Thread are denormalized and maintained in SQL with F()
+expressions so concurrent requests never overwrite each other's updates.
+"""
+
+from functools import partial
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from forum import caching, counters, taxonomy
+from forum.models import Likes, Replies, Tags, Thread
+
+
+def _adjust_likes_count(thread_id, delta):
+    if counters.is_enabled():
+        # Buffered counts are applied later by counters.flush().
+        transaction.on_commit(partial(counters.add, thread_id, delta))
+    else:
+        Thread.objects.filter(pk=thread_id).update(
+            likes_count=Greatest(F('likes_count') + delta, 0)
+        )
+
+
+def toggle_like(thread_id, user):
+    """
+    Like the thread if the user hasn't liked it yet, otherwise unlike it.
+
+    Returns ``(liked, changed)``. ``changed`` is False when a concurrent
+    request from the same user already made the same change.
+    """
+    with transaction.atomic():
+        deleted, _ = Likes.objects.filter(thread_id=thread_id, user=user).delete()
+        if deleted:
+            _adjust_likes_count(thread_id, -1)
+            return False, True
+
+        try:
+            with transaction.atomic():
+                Likes.objects.create(thread_id=thread_id, user=user)
+        except IntegrityError:
+            # Lost the race against another request from the same user.
+            return True, False
+
+        _adjust_likes_count(thread_id, 1)
+        return True, True
+
+
+def add_reply(thread, author, content):
+    """
+    Create a reply and bump the thread's reply_count in one transaction.
+    """
+    with transaction.atomic():
+        reply = Replies.objects.create(thread=thread, content=content, author=author)
+        Thread.objects.filter(pk=thread.pk).update(reply_count=F('reply_count') + 1)
+    return reply
+
+
+def soft_delete_reply(reply):
+    """
+    Mark a reply deleted and decrement reply_count, at most once even if
+    two requests delete the same reply concurrently. Returns True if this
+    call deleted it.
+    """
+    with transaction.atomic():
+        deleted = Replies.objects.filter(pk=reply.pk, is_deleted=False).update(
+            is_deleted=True, updated_at=timezone.now()
+        )
+        if deleted:
+            Thread.objects.filter(pk=reply.thread_id).update(
+                reply_count=Greatest(F('reply_count') - 1, 0)
+            )
+    reply.is_deleted = True
+    return bool(deleted)
+
+
+def normalize_tag_names(raw):
+    """
+    Split a comma-separated tag string into unique, lower-cased names in
+    the order given. ``"#Quiz, quiz , notes"`` becomes ``['quiz', 'notes']``.
+    """
+    max_length = Tags._meta.get_field('name').max_length
+    names = {}
+    for name in raw.split(','):
+        name = ' '.join(name.strip().lstrip('#').split()).lower()[:max_length]
+        if name:
+            names[name] = None
+    return list(names)
+
+
+def resolve_tags(names):
+    """
+    Return Tags for ``names``, creating missing ones. Uses at most three
+    queries however many names there are. Concurrent requests creating the
+    same tag are safe: the loser's insert is skipped by the unique
+    constraint and the re-read picks up the winner's row.
+    """
+    if not names:
+        return []
+    tags = list(Tags.objects.filter(name__in=names))
+    missing = set(names) - {tag.name for tag in tags}
+    if missing:
+        Tags.objects.bulk_create([Tags(name=name) for name in missing], ignore_conflicts=True)
+        tags += Tags.objects.filter(name__in=missing)
+        # bulk_create skips post_save, so refresh the tag registry here.
+        transaction.on_commit(taxonomy.clear)
+        transaction.on_commit(partial(caching.bump_version, 'taxonomy'))
+    return tags
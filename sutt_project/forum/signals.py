@@ -1,55 +1,163 @@
-from django.db.models.signals import post_save, post_delete
+from collections import Counter
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from forum.models import Replies, Report, Thread
-from forum.emails import (
-    send_thread_reply_notification,
-    send_report_notification,
-    send_data_to_admin,
+from forum import blobs, caching, metrics, profiling, taxonomy
+from forum.models import Category, Likes, Replies, Report, Tags, Thread, ThreadResource
+from forum.tasks import (
+    generate_resource_preview_task,
+    send_thread_reply_notification_task,
+    send_report_notification_task,
+    send_admin_notification_task,
 )
+from sutt_project.celery import enqueue_on_commit
 
 
 @receiver(post_save, sender=Replies)
 def notify_thread_author_on_reply(sender, instance, created, **kwargs):
-    if created and instance.thread.author:
-        try:
-            send_thread_reply_notification(
-                thread_author_email=instance.thread.author.email,
-                reply_author_name=instance.author.get_full_name() or instance.author.username,
-                thread_title=instance.thread.title
-            )
-        except Exception as e:
-          pass
+    if created and instance.thread.author and instance.thread.author.email:
+        enqueue_on_commit(
+            send_thread_reply_notification_task,
+            thread_author_email=instance.thread.author.email,
+            reply_author_name=instance.author.get_full_name() or instance.author.username,
+            thread_title=instance.thread.title,
+            thread_id=instance.thread_id
+        )
 
 
 @receiver(post_save, sender=Report)
 def notify_thread_author_on_report(sender, instance, created, **kwargs):
-    if created and instance.thread.author:
-        try:
-            send_report_notification(
-                thread_author_email=instance.thread.author.email,
-                reporter_name=instance.reporter.get_full_name() or instance.reporter.username,
-                thread_title=instance.thread.title,
-                report_reason=instance.get_reason_display()
-            )
-        except Exception as e:
-          pass
-    
+    if not created:
+        return
+
+    if instance.thread.author and instance.thread.author.email:
+        enqueue_on_commit(
+            send_report_notification_task,
+            thread_author_email=instance.thread.author.email,
+            reporter_name=instance.reporter.get_full_name() or instance.reporter.username,
+            thread_title=instance.thread.title,
+            report_reason=instance.get_reason_display(),
+            thread_id=instance.thread_id
+        )
+
+    admin_emails = list(
+        User.objects.filter(groups__name='Moderator')
+        .exclude(email='')
+        .values_list('email', flat=True)[:1]
+    )
+    if admin_emails:
+        author_name = instance.thread.author.username if instance.thread.author else "Anonymous"
+        enqueue_on_commit(
+            send_admin_notification_task,
+            admin_email=admin_emails[0],
+            subject_line=f"New Report: {instance.thread.title}",
+            message_content=f"A report has been submitted for the thread by {author_name}",
+            data_dict={
+                "Thread": instance.thread.title,
+                "Reason": instance.get_reason_display(),
+                "Reporter": instance.reporter.username,
+                "Description": instance.description[:100] + "..."
+            }
+        )
+
+
+@receiver(post_save, sender=ThreadResource)
+def queue_resource_preview(sender, instance, created, **kwargs):
+    if created and instance.file_type in ('image', 'pdf'):
+        enqueue_on_commit(generate_resource_preview_task, resource_id=instance.pk)
+
+
+@receiver(post_delete, sender=ThreadResource)
+def release_resource_blob(sender, instance, **kwargs):
+    if instance.blob_id is not None:
+        blobs.release(instance.blob_id)
+    elif instance.file:
+        # Stored before content addressing: the file is this resource's own.
+        transaction.on_commit(partial(instance.file.storage.delete, instance.file.name))
+
+
+@receiver(post_save, sender=Thread)
+@receiver(post_delete, sender=Thread)
+@receiver(post_save, sender=ThreadResource)
+@receiver(post_delete, sender=ThreadResource)
+@receiver(m2m_changed, sender=Thread.tags.through)
+def invalidate_thread_list_cache(sender, **kwargs):
+    transaction.on_commit(partial(caching.bump_version, 'threads'))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tags)
+@receiver(post_delete, sender=Tags)
+def invalidate_taxonomy_cache(sender, **kwargs):
+    # Cards show category and tag names, so they go stale too.
+    transaction.on_commit(taxonomy.clear)
+    transaction.on_commit(partial(caching.bump_version, 'taxonomy'))
+    transaction.on_commit(partial(caching.bump_version, 'threads'))
+
+
+def _linked_tag_counts(through, instance, reverse, pk_set):
+    """
+    {tag_id: threads} for the links an upcoming remove/clear will delete.
+    """
+    if reverse:
+        links = through.objects.filter(tags_id=instance.pk)
+        if pk_set is not None:
+            links = links.filter(thread_id__in=pk_set)
+        return Counter({instance.pk: links.count()})
+    links = through.objects.filter(thread_id=instance.pk)
+    if pk_set is not None:
+        links = links.filter(tags_id__in=pk_set)
+    return Counter(links.values_list('tags_id', flat=True))
+
+
+def _adjust_tag_counts(counts, sign):
+    # One UPDATE per distinct delta, i.e. one for a thread's whole tag set.
+    by_delta = {}
+    for tag_id, n in counts.items():
+        if n:
+            by_delta.setdefault(n, []).append(tag_id)
+    for n, tag_ids in by_delta.items():
+        Tags.objects.filter(pk__in=tag_ids).update(thread_count=Greatest(F('thread_count') + sign * n, 0))
+
+
+@receiver(m2m_changed, sender=Thread.tags.through)
+def maintain_tag_thread_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add' and pk_set:
+        # pk_set only holds links that didn't exist yet.
+        _adjust_tag_counts(Counter({instance.pk: len(pk_set)}) if reverse else Counter(pk_set), 1)
+    elif action in ('pre_remove', 'pre_clear'):
+        # Only count links that actually exist, before they are deleted.
+        instance._removed_tag_counts = _linked_tag_counts(sender, instance, reverse, pk_set)
+    elif action in ('post_remove', 'post_clear'):
+        _adjust_tag_counts(instance.__dict__.pop('_removed_tag_counts', Counter()), -1)
+
+
+@receiver(pre_delete, sender=Thread)
+def release_tag_thread_counts(sender, instance, **kwargs):
+    # The cascade deletes through rows without sending m2m_changed.
+    _adjust_tag_counts(_linked_tag_counts(Thread.tags.through, instance, False, None), -1)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if settings.FORUM_PROFILING or settings.FORUM_METRICS:
+        profiling.install_query_recorder(connection)
+
+
+ACTIVITY_KINDS = {Likes: 'like', Replies: 'reply', Report: 'report'}
+
+
+@receiver(post_save, sender=Likes)
+@receiver(post_save, sender=Replies)
+@receiver(post_save, sender=Report)
+def count_activity(sender, instance, created, **kwargs):
     if created:
-        try:
-            moderators = instance.thread.author.groups.filter(name='Moderator')
-            if moderators.exists():
-                admin_emails = [user.email for user in moderators.user_set.all() if user.email]
-                if admin_emails:
-                    send_data_to_admin(
-                        admin_email=admin_emails[0], 
-                        subject_line=f"New Report: {instance.thread.title}",
-                        message_content=f"A report has been submitted for the thread by {instance.thread.author.username}",
-                        data_dict={
-                            "Thread": instance.thread.title,
-                            "Reason": instance.get_reason_display(),
-                            "Reporter": instance.reporter.username,
-                            "Description": instance.description[:100] + "..."
-                        }
-                    )
-        except Exception as e:
-          pass 
+        metrics.ACTIVITY.labels(ACTIVITY_KINDS[sender]).inc()
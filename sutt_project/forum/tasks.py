@@ -1,19 +1,102 @@
 """
 Celery tasks for forum app.
 Handles async email sending for forum events.
+
+Notification tasks queue a PendingNotification and schedule a delivery run,
+at most one per digest window; forum.delivery sends the queue in batches
+over one SMTP connection.
 """
 
 from celery import shared_task
-from django.core.mail import send_mail
 from django.conf import settings
-from django.utils.html import strip_tags
+from django.core.cache import cache
+from django.core.management import call_command
+from forum import counters
+from forum.delivery import deliver_pending_notifications, queue_notification
+from forum.models import ThreadResource
+from forum.previews import generate_preview
+from forum.uploads import expire_stale_sessions
 import logging
 
 logger = logging.getLogger(__name__)
 
+DELIVERY_SCHEDULED_KEY = 'forum:notifications:delivery-scheduled'
+
+
+def _queue_and_schedule(kind, recipient, subject, html_message, thread_id=None, actor_name=""):
+    queue_notification(
+        recipient=recipient,
+        kind=kind,
+        subject=subject,
+        html_message=html_message,
+        thread_id=thread_id,
+        actor_name=actor_name,
+    )
+    _schedule_delivery()
+
+
+def _schedule_delivery():
+    # Give bursts for the same thread time to pile up before delivering.
+    # One run drains everything queued in the window, so only the first
+    # notification schedules it; a notification queued just as the run
+    # starts is picked up by the beat entry.
+    window = settings.FORUM_EMAIL_DIGEST_WINDOW
+    if window and not cache.add(DELIVERY_SCHEDULED_KEY, True, timeout=window):
+        return
+    deliver_notifications_task.apply_async(countdown=window)
+
 
 @shared_task(bind=True, max_retries=3)
-def send_thread_reply_notification_task(self, thread_author_email, reply_author_name, thread_title):
+def deliver_notifications_task(self):
+    """
+    Async task: Drain queued notifications in batches.
+    """
+    try:
+        return deliver_pending_notifications()
+    except Exception as exc:
+        logger.error(f"❌ Notification delivery run failed: {str(exc)}")
+        raise self.retry(exc=exc, countdown=60)
+
+
+@shared_task
+def flush_like_counters_task():
+    """
+    Periodic task: Apply buffered like deltas to Thread.likes_count.
+    """
+    if counters.is_enabled():
+        return counters.flush()
+    return 0
+
+
+@shared_task
+def generate_resource_preview_task(resource_id):
+    """
+    Async task: Build the preview thumbnail for an uploaded resource.
+    """
+    resource = ThreadResource.objects.filter(pk=resource_id).first()
+    if resource is None:
+        return False
+    return generate_preview(resource)
+
+
+@shared_task
+def expire_upload_sessions_task():
+    """
+    Periodic task: Discard abandoned chunked uploads.
+    """
+    return expire_stale_sessions()
+
+
+@shared_task
+def reconcile_tag_counts_task():
+    """
+    Nightly task: Repair drift in Tags.thread_count.
+    """
+    call_command('reconcile_tag_counts')
+
+
+@shared_task(bind=True, max_retries=3)
+def send_thread_reply_notification_task(self, thread_author_email, reply_author_name, thread_title, thread_id=None):
     """
     Async task: Send email notification to thread author when someone replies.
     """
@@ -27,27 +110,19 @@ def send_thread_reply_notification_task(self, thread_author_email, reply_author_
     <p><a href="{settings.SITE_URL}/forum">View Thread</a></p>
     """
     
-    plain_message = strip_tags(html_message)
-    
     try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[thread_author_email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        logger.info(f"✅ Reply notification sent to {thread_author_email}")
-        return f"Email sent to {thread_author_email}"
+        _queue_and_schedule('reply', thread_author_email, subject, html_message,
+                            thread_id=thread_id, actor_name=reply_author_name)
+        logger.info(f"✅ Reply notification queued for {thread_author_email}")
+        return f"Email queued for {thread_author_email}"
     except Exception as exc:
-        logger.error(f"❌ Failed to send reply notification: {str(exc)}")
+        logger.error(f"❌ Failed to queue reply notification: {str(exc)}")
         # Retry after 60 seconds
         raise self.retry(exc=exc, countdown=60)
 
 
 @shared_task(bind=True, max_retries=3)
-def send_thread_like_notification_task(self, thread_author_email, liker_name, thread_title):
+def send_thread_like_notification_task(self, thread_author_email, liker_name, thread_title, thread_id=None):
     """
     Async task: Send email notification when someone likes a thread.
     """
@@ -60,26 +135,18 @@ def send_thread_like_notification_task(self, thread_author_email, liker_name, th
     <p><a href="{settings.SITE_URL}/forum">View Thread</a></p>
     """
     
-    plain_message = strip_tags(html_message)
-    
     try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[thread_author_email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        logger.info(f"✅ Like notification sent to {thread_author_email}")
-        return f"Email sent to {thread_author_email}"
+        _queue_and_schedule('like', thread_author_email, subject, html_message,
+                            thread_id=thread_id, actor_name=liker_name)
+        logger.info(f"✅ Like notification queued for {thread_author_email}")
+        return f"Email queued for {thread_author_email}"
     except Exception as exc:
-        logger.error(f"❌ Failed to send like notification: {str(exc)}")
+        logger.error(f"❌ Failed to queue like notification: {str(exc)}")
         raise self.retry(exc=exc, countdown=60)
 
 
 @shared_task(bind=True, max_retries=3)
-def send_report_notification_task(self, thread_author_email, reporter_name, thread_title, report_reason):
+def send_report_notification_task(self, thread_author_email, reporter_name, thread_title, report_reason, thread_id=None):
     """
     Async task: Send email notification when a thread is reported.
     """
@@ -94,21 +161,13 @@ def send_report_notification_task(self, thread_author_email, reporter_name, thre
     <p><a href="{settings.SITE_URL}/forum">View Thread</a></p>
     """
     
-    plain_message = strip_tags(html_message)
-    
     try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[thread_author_email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        logger.info(f"✅ Report notification sent to {thread_author_email}")
-        return f"Email sent to {thread_author_email}"
+        _queue_and_schedule('report', thread_author_email, subject, html_message,
+                            thread_id=thread_id, actor_name=reporter_name)
+        logger.info(f"✅ Report notification queued for {thread_author_email}")
+        return f"Email queued for {thread_author_email}"
     except Exception as exc:
-        logger.error(f"❌ Failed to send report notification: {str(exc)}")
+        logger.error(f"❌ Failed to queue report notification: {str(exc)}")
         raise self.retry(exc=exc, countdown=60)
 
 
@@ -128,21 +187,12 @@ def send_admin_notification_task(self, admin_email, subject_line, message_conten
             html_message += f"<li><strong>{key}:</strong> {value}</li>"
         html_message += "</ul>"
     
-    plain_message = strip_tags(html_message)
-    
     try:
-        send_mail(
-            subject=subject_line,
-            message=plain_message,
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[admin_email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        logger.info(f"✅ Admin notification sent to {admin_email}")
-        return f"Email sent to {admin_email}"
+        _queue_and_schedule('admin', admin_email, subject_line, html_message)
+        logger.info(f"✅ Admin notification queued for {admin_email}")
+        return f"Email queued for {admin_email}"
     except Exception as exc:
-        logger.error(f"❌ Failed to send admin notification: {str(exc)}")
+        logger.error(f"❌ Failed to queue admin notification: {str(exc)}")
         raise self.retry(exc=exc, countdown=60)
 
 
@@ -167,19 +217,10 @@ def send_welcome_email_task(self, user_email, user_name):
     <p>Happy discussing!</p>
     """
     
-    plain_message = strip_tags(html_message)
-    
     try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[user_email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        logger.info(f"✅ Welcome email sent to {user_email}")
-        return f"Email sent to {user_email}"
+        _queue_and_schedule('welcome', user_email, subject, html_message)
+        logger.info(f"✅ Welcome email queued for {user_email}")
+        return f"Email queued for {user_email}"
     except Exception as exc:
-        logger.error(f"❌ Failed to send welcome email: {str(exc)}")
+        logger.error(f"❌ Failed to queue welcome email: {str(exc)}")
         raise self.retry(exc=exc, countdown=60)
@@ -0,0 +1,81 @@
+"""
+Process-local registry of categories and tags.
+
+Both tables are tiny and almost never change, so each worker process keeps
+them in memory as tuples of ``Entry(id, name)`` instead of querying them on
+every request. The registry is tagged with the shared ``taxonomy`` cache
+version from forum/caching.py, which the signal receivers bump when a
+category or tag changes, so every gunicorn worker reloads on its next
+access. FORUM_TAXONOMY_TTL bounds staleness if a bump is lost, e.g. when the
+version key is evicted.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+from forum import caching
+from forum.models import Category, Tags
+
+Entry = namedtuple('Entry', 'id name')
+
+# (generation, loaded_at, categories, tags), replaced as a whole.
+_registry = None
+_lock = threading.Lock()
+
+
+def _load(generation):
+    return (
+        generation,
+        time.monotonic(),
+        tuple(Entry(*row) for row in Category.objects.order_by('pk').values_list('pk', 'name')),
+        tuple(Entry(*row) for row in Tags.objects.order_by('pk').values_list('pk', 'name')),
+    )
+
+
+def _is_fresh(registry, generation):
+    return (
+        registry is not None
+        and registry[0] == generation
+        and time.monotonic() - registry[1] <= settings.FORUM_TAXONOMY_TTL
+    )
+
+
+def _current():
+    global _registry
+    generation = caching.get_version('taxonomy')
+    registry = _registry
+    if not _is_fresh(registry, generation):
+        with _lock:
+            registry = _registry
+            if not _is_fresh(registry, generation):
+                registry = _registry = _load(generation)
+    return registry
+
+
+def categories():
+    return _current()[2]
+
+
+def tags():
+    return _current()[3]
+
+
+def find_tag(name):
+    """
+    The Entry for a tag name (case-insensitive), or None.
+    """
+    name = name.strip().lower()
+    # Stored names are lower-cased, but rows written outside Tags.save()
+    # (bulk_create, raw SQL) may not be.
+    return next((tag for tag in tags() if tag.name.lower() == name), None)
+
+
+def clear():
+    """
+    Drop this process's copy; the next access reloads it.
+    """
+    global _registry
+    _registry = None
@@ -1,3 +1,1378 @@
-from django.test import TestCase
+import json
+import os
+import random
+import tempfile
+import threading
+from datetime import timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import async_views, blobs, caching, counters, loadtest, markup, metrics, profiling, rendering, taxonomy, uploads
+from .delivery import MAX_ATTEMPTS, deliver_pending_notifications, queue_notification
+from .tasks import DELIVERY_SCHEDULED_KEY, _queue_and_schedule, deliver_notifications_task, flush_like_counters_task
+from .pagination import CursorPaginator, decode_cursor, encode_cursor
+from .models import (
+    Category, Likes, PendingNotification, Replies, Report, ResourceBlob, Tags, Thread, ThreadResource, UploadSession,
+)
+from .previews import generate_preview
+from .services import add_reply, normalize_tag_names, resolve_tags, soft_delete_reply, toggle_like
+from .views import REPLIES_PER_PAGE, ThreadListView
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True, FORUM_EMAIL_DIGEST_WINDOW=0)
+class NotificationQueueTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'pw')
+        self.liker = User.objects.create_user('liker', 'liker@example.com', 'pw')
+        self.category = Category.objects.create(name='General')
+        self.thread = Thread.objects.create(
+            title='Hello', content='Body', author=self.author, category=self.category
+        )
+        self.client.force_login(self.liker)
+
+    def test_like_notification_waits_for_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.client.get(reverse('thread-like', args=[self.thread.pk]))
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(len(mail.outbox), 0)
+
+        callbacks[0]()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['author@example.com'])
+
+    def test_unlike_does_not_notify(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('thread-like', args=[self.thread.pk]))
+        mail.outbox.clear()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.client.get(reverse('thread-like', args=[self.thread.pk]))
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_reply_notifies_thread_author(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('thread-reply', args=[self.thread.pk]), {'content': 'Nice'}
+            )
+
+        self.assertEqual(Replies.objects.count(), 1)
+        self.assertEqual([m.to for m in mail.outbox], [['author@example.com']])
+
+    def test_report_notifies_author_and_moderator(self):
+        moderator = User.objects.create_user('mod', 'mod@example.com', 'pw')
+        moderator.groups.add(Group.objects.create(name='Moderator'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Report.objects.create(
+                thread=self.thread, reporter=self.liker, reason='spam', description='Spam'
+            )
+
+        recipients = sorted(m.to[0] for m in mail.outbox)
+        self.assertEqual(recipients, ['author@example.com', 'mod@example.com'])
+
+    def test_signup_sends_welcome_email(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user('newbie', 'newbie@example.com', 'pw')
+
+        self.assertEqual([m.to for m in mail.outbox], [['newbie@example.com']])
+        self.assertTrue(PendingNotification.objects.filter(kind='welcome', sent_at__isnull=False).exists())
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=False, FORUM_EMAIL_DIGEST_WINDOW=120)
+    def test_burst_schedules_one_delivery_run_per_window(self):
+        cache.delete(DELIVERY_SCHEDULED_KEY)
+        self.addCleanup(cache.delete, DELIVERY_SCHEDULED_KEY)
+        with mock.patch.object(deliver_notifications_task, 'apply_async') as apply_async:
+            for i in range(5):
+                _queue_and_schedule('reply', 'author@example.com', f'Reply {i}', '<p>Reply</p>', self.thread.pk)
+
+        self.assertEqual(PendingNotification.objects.count(), 5)
+        apply_async.assert_called_once_with(countdown=120)
+
+
+class NotificationDeliveryTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'pw')
+        self.thread = Thread.objects.create(title='Hello', content='Body', author=self.author)
+
+    def queue(self, kind, actor, recipient='author@example.com', thread=None):
+        thread = thread or self.thread
+        return queue_notification(
+            recipient=recipient,
+            kind=kind,
+            subject=f'{kind} from {actor}',
+            html_message=f'<p>{actor}</p>',
+            thread_id=thread.pk,
+            actor_name=actor,
+        )
+
+    def test_burst_is_coalesced_into_one_digest(self):
+        for i in range(20):
+            self.queue('like', f'user{i}')
+        self.queue('reply', 'replier')
+
+        with mock.patch('forum.delivery.get_connection', wraps=get_connection) as connect:
+            stats = deliver_pending_notifications(window=60, now=timezone.now() + timedelta(minutes=2))
+
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual(stats['notifications'], 21)
+        self.assertEqual(stats['messages'], 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('21 new notifications', mail.outbox[0].subject)
+        self.assertIn('20</strong> new likes', mail.outbox[0].alternatives[0][0])
+        self.assertFalse(PendingNotification.objects.filter(sent_at__isnull=True).exists())
+
+    def test_digest_waits_for_window(self):
+        self.queue('like', 'early')
+
+        stats = deliver_pending_notifications(window=60)
+
+        self.assertEqual(stats['messages'], 0)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_batches_share_one_connection_per_batch(self):
+        other = Thread.objects.create(title='Other', content='Body', author=self.author)
+        self.queue('like', 'a')
+        self.queue('like', 'b', thread=other)
+        self.queue('like', 'c', recipient='someone@example.com')
+        queue_notification('mod@example.com', 'admin', 'Report', '<p>x</p>')
+
+        with mock.patch('forum.delivery.get_connection', wraps=get_connection) as connect:
+            stats = deliver_pending_notifications(batch_size=10, window=0)
+
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual(stats['messages'], 4)
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_failed_batch_is_retried_later(self):
+        self.queue('like', 'a')
+
+        with mock.patch('forum.delivery.get_connection', side_effect=OSError('down')):
+            stats = deliver_pending_notifications(window=0)
+
+        self.assertEqual(stats['failed'], 1)
+        notification = PendingNotification.objects.get()
+        self.assertIsNone(notification.sent_at)
+        self.assertEqual(notification.attempts, 1)
+
+        deliver_pending_notifications(window=0)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failure_mid_batch_keeps_what_was_sent(self):
+        for i in range(3):
+            queue_notification(f'user{i}@example.com', 'admin', f'Report {i}', '<p>x</p>')
+        send_messages = mail.get_connection().__class__.send_messages
+
+        def fail_second(connection, messages):
+            if len(mail.outbox) == 1:
+                raise OSError('dropped')
+            return send_messages(connection, messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', fail_second):
+            stats = deliver_pending_notifications(window=0)
+
+        self.assertEqual((stats['messages'], stats['failed']), (1, 1))
+        attempts = dict(PendingNotification.objects.values_list('subject', 'attempts'))
+        self.assertEqual(attempts, {'Report 0': 0, 'Report 1': 1, 'Report 2': 0})
+        self.assertFalse(PendingNotification.objects.filter(claimed_at__isnull=False, sent_at__isnull=True).exists())
+
+        deliver_pending_notifications(window=0)
+        self.assertEqual(sorted(m.subject for m in mail.outbox), ['Report 0', 'Report 1', 'Report 2'])
+
+    def test_last_attempt_is_logged_and_counted(self):
+        notification = queue_notification('mod@example.com', 'admin', 'Report', '<p>x</p>')
+        PendingNotification.objects.filter(pk=notification.pk).update(attempts=MAX_ATTEMPTS - 1)
+        abandoned = metrics.EMAILS.labels('abandoned')
+        before = abandoned._value.get()
+
+        with mock.patch('forum.delivery.get_connection', side_effect=OSError('down')), \
+                self.assertLogs('forum.delivery', 'ERROR') as logs:
+            deliver_pending_notifications(window=0)
+
+        self.assertEqual(abandoned._value.get(), before + 1)
+        self.assertIn('Giving up', logs.output[-1])
+        deliver_pending_notifications(window=0)
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class ToggleLikeTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'pw')
+        self.user = User.objects.create_user('user', 'user@example.com', 'pw')
+        self.thread = Thread.objects.create(title='Hello', content='Body', author=self.author)
+
+    def test_toggle_updates_counter_in_sql(self):
+        stale = Thread.objects.get(pk=self.thread.pk)
+        updated_at = stale.updated_at
+
+        self.assertEqual(toggle_like(stale.pk, self.user), (True, True))
+        Likes.objects.create(thread=self.thread, user=self.author)
+        Thread.objects.filter(pk=self.thread.pk).update(likes_count=2)
+
+        # The stale instance must not clobber the counter.
+        self.assertEqual(toggle_like(stale.pk, self.user), (False, True))
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.likes_count, 1)
+        self.assertEqual(self.thread.updated_at, updated_at)
+
+    def test_duplicate_insert_is_not_counted(self):
+        with mock.patch.object(Likes.objects, 'filter') as filter_:
+            # Pretend the existence check missed a like that was just inserted.
+            Likes.objects.create(thread=self.thread, user=self.user)
+            filter_.return_value.delete.return_value = (0, {})
+            self.assertEqual(toggle_like(self.thread.pk, self.user), (True, False))
+
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.likes_count, 0)
+
+    def test_counter_never_goes_negative(self):
+        Likes.objects.create(thread=self.thread, user=self.user)
+
+        toggle_like(self.thread.pk, self.user)
+
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.likes_count, 0)
+
+    def test_reconcile_likes_fixes_drift(self):
+        other = Thread.objects.create(title='Other', content='Body', likes_count=7)
+        Likes.objects.create(thread=self.thread, user=self.user)
+        Likes.objects.create(thread=self.thread, user=self.author)
+
+        call_command('reconcile_likes', stdout=StringIO())
+
+        self.assertEqual(
+            dict(Thread.objects.values_list('pk', 'likes_count')),
+            {self.thread.pk: 2, other.pk: 0},
+        )
+
+
+@skipIf(connection.vendor == 'sqlite', 'SQLite serializes writers with table locks')
+class ToggleLikeConcurrencyTests(TransactionTestCase):
+    workers = 16
+    rounds = 5
+
+    def test_concurrent_likes_are_not_lost(self):
+        thread = Thread.objects.create(title='Hot', content='Body')
+        users = [User.objects.create_user(f'user{i}', password='pw') for i in range(self.workers)]
+        barrier = threading.Barrier(self.workers)
+        errors = []
+
+        def worker(user):
+            try:
+                barrier.wait()
+                # An odd number of toggles leaves every user liking the thread.
+                for _ in range(self.rounds * 2 + 1):
+                    toggle_like(thread.pk, user)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        thread.refresh_from_db()
+        self.assertEqual(thread.likes_count, self.workers)
+        self.assertEqual(Likes.objects.filter(thread=thread).count(), self.workers)
+
+
+@override_settings(FORUM_LIKE_BUFFER=True)
+class LikeBufferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.thread = Thread.objects.create(title='Hot', content='Body', likes_count=3)
+        self.users = [User.objects.create_user(f'user{i}', password='pw') for i in range(4)]
+
+    def test_likes_are_buffered_until_flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for user in self.users:
+                toggle_like(self.thread.pk, user)
+            toggle_like(self.thread.pk, self.users[0])
+
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.likes_count, 3)
+        self.assertEqual(counters.pending([self.thread.pk]), {self.thread.pk: 3})
+
+        with self.assertNumQueries(1):
+            self.assertEqual(counters.flush(), 1)
+
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.likes_count, 6)
+        self.assertEqual(counters.pending([self.thread.pk]), {})
+        self.assertEqual(counters.flush(), 0)
+
+    def test_views_read_buffered_count(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_like(self.thread.pk, self.users[0])
+
+        self.client.force_login(self.users[1])
+        detail = self.client.get(reverse('thread-detail', args=[self.thread.pk]))
+        listing = self.client.get(reverse('thread-list'))
+
+        self.assertEqual(detail.context['thread'].likes_count, 4)
+        self.assertEqual(listing.context['threads'][0].likes_count, 4)
+
+    def test_likes_after_flush_are_kept(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_like(self.thread.pk, self.users[0])
+        counters.flush()
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_like(self.thread.pk, self.users[1])
+        counters.flush()
+
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.likes_count, 5)
+
+    def test_flush_between_delta_and_registration_loses_nothing(self):
+        mark_dirty = counters._mark_dirty
+
+        def flush_first(cache, thread_id):
+            counters.flush()
+            mark_dirty(cache, thread_id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_like(self.thread.pk, self.users[0])
+        with mock.patch.object(counters, '_mark_dirty', flush_first), self.captureOnCommitCallbacks(execute=True):
+            toggle_like(self.thread.pk, self.users[1])
+        counters.flush()
+
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.likes_count, 5)
+        self.assertEqual(counters.pending([self.thread.pk]), {})
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class QueryCountTests(TestCase):
+    """
+    Page query counts must not depend on how many threads, tags, resources
+    or replies are shown. Update the expected numbers only when a view
+    deliberately gains or loses a fixed query.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'pw')
+        self.moderator = User.objects.create_user('mod', 'mod@example.com', 'pw')
+        self.moderator.groups.add(Group.objects.create(name='Moderator'))
+        self.category = Category.objects.create(name='General')
+        self.tags = [Tags.objects.create(name=f'tag{i}') for i in range(3)]
+
+    def seed(self, threads, replies=0, author=None):
+        created = []
+        for i in range(threads):
+            author_ = author or User.objects.create_user(f'author{Thread.objects.count()}', password='pw')
+            thread = Thread.objects.create(
+                title=f'Thread {i}', content='Body', author=author_, category=self.category
+            )
+            thread.tags.set(self.tags)
+            ThreadResource.objects.create(
+                thread=thread, title='Notes', file=ContentFile(b'x', name='notes.txt'), uploaded_by=author_
+            )
+            for j in range(replies):
+                Replies.objects.create(
+                    thread=thread, content=f'Reply {j}',
+                    author=User.objects.create_user(f'r{thread.pk}_{j}', password='pw'),
+                )
+            Report.objects.create(thread=thread, reporter=self.user, reason='spam', description='Spam')
+            created.append(thread)
+        return created
+
+    def assertConstantQueries(self, num, url, user, grow):
+        self.client.force_login(user)
+        with self.assertNumQueries(num):
+            self.client.get(url)
+        grow()
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_thread_list(self):
+        self.seed(2)
+        # Warm the category fragment cache.
+        self.client.get(reverse('thread-list'))
+        self.assertConstantQueries(
+            self.thread_list_queries, reverse('thread-list'), self.user, lambda: self.seed(10)
+        )
+
+    def test_my_threads(self):
+        self.seed(2, author=self.user)
+        self.assertConstantQueries(
+            self.my_threads_queries, reverse('my-threads'), self.user, lambda: self.seed(10, author=self.user)
+        )
+
+    def test_thread_detail(self):
+        thread = self.seed(1, replies=1)[0]
+
+        def grow():
+            for j in range(20):
+                Replies.objects.create(
+                    thread=thread, content='More',
+                    author=User.objects.create_user(f'more{j}', password='pw'),
+                )
+            ThreadResource.objects.create(
+                thread=thread, title='More notes', file=ContentFile(b'y', name='more.txt'), uploaded_by=self.user
+            )
+
+        self.assertConstantQueries(
+            self.thread_detail_queries, reverse('thread-detail', args=[thread.pk]), self.user, grow
+        )
+
+    def test_report_list(self):
+        self.seed(2)
+        self.assertConstantQueries(
+            self.report_list_queries, reverse('report-list'), self.moderator, lambda: self.seed(8)
+        )
+
+    # session, user, navbar groups
+    base_queries = 3
+    # threads, tags (keyset pages skip the COUNT on SQLite, categories
+    # come from the fragment cache)
+    thread_list_queries = base_queries + 2
+    # threads, tags
+    my_threads_queries = base_queries + 2
+    # thread, tags, resources, replies, moderator check, liked
+    thread_detail_queries = base_queries + 6
+    # moderator check, reports
+    report_list_queries = base_queries + 2
+
+
+class ExplainViewsCommandTests(TestCase):
+    def test_prints_a_plan_per_view(self):
+        moderator = User.objects.create_user('mod', 'mod@example.com', 'pw')
+        moderator.groups.add(Group.objects.create(name='Moderator'))
+        Thread.objects.create(title='Hello', content='Body', author=moderator)
+
+        out = StringIO()
+        call_command('explain_views', user='mod', stdout=out)
+
+        output = out.getvalue()
+        for name in ('ThreadListView', 'MyThreadsListView', 'ReportListView', 'ThreadDetailView (replies)'):
+            self.assertIn(f'== {name}', output)
+        self.assertNotIn('skipped', output)
+
+    def test_writes_nothing(self):
+        User.objects.create_user('reader', password='pw')
+        thread = Thread.objects.create(title='Hello', content='Body')
+        Thread.objects.filter(pk=thread.pk).update(content_html='', content_html_version='old')
+
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('explain_views', user='reader', thread=thread.pk, stdout=StringIO())
+
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].lstrip().upper().startswith(('UPDATE', 'INSERT', 'DELETE'))])
+        self.assertEqual(Thread.objects.get(pk=thread.pk).content_html_version, 'old')
+
+
+class ThreadSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_search_ranks_title_matches_first(self):
+        body_match = Thread.objects.create(title='Misc', content='All about Django signals')
+        title_match = Thread.objects.create(title='Django tips', content='Short')
+        Thread.objects.create(title='Unrelated', content='Nothing here')
+
+        response = self.client.get(reverse('thread-list'), {'q': 'django'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['threads']), [title_match, body_match])
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Thread.objects.bulk_create(Thread(title=f'Thread {i}', content='Body') for i in range(57))
+        # Force ties on created_at so the id tiebreaker matters.
+        base = timezone.now()
+        for i, thread in enumerate(Thread.objects.order_by('pk')):
+            Thread.objects.filter(pk=thread.pk).update(created_at=base - timedelta(minutes=i // 3))
+        cls.expected = list(Thread.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, paginator):
+        pages, page = [], paginator.page()
+        pages.append([t.pk for t in page])
+        while page.has_next():
+            page = paginator.page(page.next_cursor)
+            pages.append([t.pk for t in page])
+        return pages, page
+
+    def test_forward_and_backward_walks_cover_every_row_once(self):
+        paginator = CursorPaginator(Thread.objects.all(), 10)
+        forward, last = self.walk(paginator)
+        self.assertEqual(sum(forward, []), self.expected)
+        self.assertEqual([len(p) for p in forward], [10, 10, 10, 10, 10, 7])
+
+        backward, page = [], last
+        while page.has_previous():
+            page = paginator.page(page.previous_cursor)
+            backward.insert(0, [t.pk for t in page])
+        self.assertEqual(backward, forward[:-1])
+        self.assertFalse(page.has_previous())
+
+    def test_tampered_cursor_starts_from_the_first_page(self):
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        page = CursorPaginator(Thread.objects.all(), 10).page('not-a-cursor')
+        self.assertEqual([t.pk for t in page], self.expected[:10])
+
+    def test_deep_page_skips_count_and_offset(self):
+        url = reverse('thread-list')
+        response = self.client.get(url)
+        for _ in range(4):
+            response = self.client.get(url, {'cursor': response.context['page_obj'].next_cursor})
+
+        self.assertEqual([t.pk for t in response.context['threads']], self.expected[40:50])
+        with self.assertNumQueries(QueryCountTests.thread_list_queries - QueryCountTests.base_queries) as ctx:
+            self.client.get(url, {'cursor': response.context['page_obj'].next_cursor})
+        for query in ctx.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
+            self.assertNotIn('OFFSET', query['sql'].upper())
+
+    def test_ranked_search_falls_back_to_offset_pages(self):
+        response = self.client.get(reverse('thread-list'), {'q': 'Thread', 'page': 2})
+        self.assertEqual(response.context['page_obj'].number, 2)
+
+    def test_search_page_is_fetched_before_rendering(self):
+        # The trigram threshold only holds in similarity_threshold()'s
+        # transaction, which has ended by the time the template runs.
+        response = self.client.get(reverse('thread-list'), {'q': 'Thread'})
+        self.assertIsInstance(response.context['page_obj'].object_list, list)
+
+
+class CursorPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Thread.objects.bulk_create(
+            (Thread(title=f'Thread {i}', content='Body') for i in range(5000)), batch_size=500
+        )
+
+    def test_deep_keyset_page_range_scans_the_index(self):
+        ordered = Thread.objects.order_by('-created_at', '-id')
+        cursor = encode_cursor(ordered[4000], 'created_at', 'next')
+        keyset, _ = CursorPaginator(Thread.objects.all(), 10).page_queryset(cursor)
+
+        keyset_plan = keyset[:11].explain()
+        offset_plan = ordered[4000:4011].explain()
+
+        if connection.vendor == 'postgresql':
+            self.assertIn('Index Cond', keyset_plan)
+            self.assertNotIn('Index Cond', offset_plan)
+        else:
+            self.assertIn('SEARCH forum_thread USING INDEX forum_thread_created_idx', keyset_plan)
+            self.assertIn('SCAN forum_thread', offset_plan)
+        self.assertEqual(
+            [t.pk for t in keyset[:10]], list(ordered[4001:4011].values_list('pk', flat=True))
+        )
+
+
+class ReplyPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('replier', password='pw')
+        self.thread = Thread.objects.create(title='Busy thread', content='Body')
+        self.client.force_login(self.user)
+
+    def test_reply_count_follows_create_and_soft_delete(self):
+        self.client.post(reverse('thread-reply', args=[self.thread.pk]), {'content': 'Hi'})
+        reply = add_reply(self.thread, self.user, 'Again')
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.reply_count, 2)
+
+        self.client.get(reverse('reply-delete', args=[reply.pk]))
+        self.assertFalse(soft_delete_reply(reply))
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.reply_count, 1)
+
+    def test_detail_renders_first_page_and_endpoint_serves_the_rest(self):
+        total = REPLIES_PER_PAGE * 2 + 5
+        for i in range(total):
+            add_reply(self.thread, self.user, f'Reply {i}')
+
+        response = self.client.get(reverse('thread-detail', args=[self.thread.pk]))
+        self.assertEqual(len(response.context['replies']), REPLIES_PER_PAGE)
+        self.assertContains(response, 'Load more replies')
+        cursor = response.context['replies_page'].next_cursor
+
+        url = reverse('thread-replies', args=[self.thread.pk])
+        fragment = self.client.get(url, {'cursor': cursor}, headers={'HX-Request': 'true'})
+        self.assertContains(fragment, f'Reply {REPLIES_PER_PAGE}')
+        self.assertNotContains(fragment, '<html')
+
+        data = self.client.get(url, {'cursor': fragment.context['replies_page'].next_cursor}).json()
+        self.assertIn(f'Reply {total - 1}', data['html'])
+        self.assertFalse(data['has_next'])
+        self.assertIsNone(data['next_cursor'])
+
+
+class RenderedContentTests(TestCase):
+    def test_content_is_rendered_on_save_and_sanitized(self):
+        thread = Thread.objects.create(title='T', content='# Hi\n\n<script>x()</script>')
+        self.assertIn('<h1>Hi</h1>', thread.content_html)
+        self.assertNotIn('<script>', thread.content_html)
+
+        thread.content = '**bold**'
+        thread.save()
+        thread.refresh_from_db()
+        self.assertEqual(thread.content_html, '<p><strong>bold</strong></p>')
+        self.assertEqual(thread.content_html_version, rendering.RENDER_VERSION)
+
+    def test_saves_that_skip_content_do_not_render(self):
+        thread = Thread.objects.create(title='T', content='Body')
+        thread = Thread.objects.get(pk=thread.pk)
+        with mock.patch.object(rendering, 'render_markdown') as render_markdown:
+            thread.locked = True
+            thread.save()
+            thread.save(update_fields=['locked'])
+        render_markdown.assert_not_called()
+
+    def test_stale_rows_are_rerendered_on_read_and_by_command(self):
+        user = User.objects.create_user('reader', password='pw')
+        thread = Thread.objects.create(title='T', content='*one*')
+        reply = Replies.objects.create(thread=thread, content='*two*', author=user)
+        Thread.objects.update(content_html='', content_html_version='old')
+        Replies.objects.update(content_html='', content_html_version='old')
+
+        self.client.force_login(user)
+        response = self.client.get(reverse('thread-detail', args=[thread.pk]))
+        self.assertContains(response, '<em>one</em>')
+        self.assertContains(response, '<em>two</em>')
+
+        Replies.objects.update(content_html='', content_html_version='old')
+        call_command('rerender_content', stdout=StringIO())
+        reply.refresh_from_db()
+        self.assertEqual(reply.content_html, '<p><em>two</em></p>')
+
+
+class RerenderContentCommandTests(TestCase):
+    def setUp(self):
+        self.threads = [Thread.objects.create(title=f'T{i}', content=f'*{i}*') for i in range(5)]
+        Thread.objects.update(content_html='', content_html_version='old')
+
+    def test_renders_in_worker_processes(self):
+        out = StringIO()
+        call_command('rerender_content', workers=2, chunk_size=2, stdout=out)
+
+        self.assertIn('5/5 rows', out.getvalue())
+        self.assertFalse(Thread.objects.exclude(content_html_version=rendering.RENDER_VERSION).exists())
+        self.assertEqual(Thread.objects.get(pk=self.threads[3].pk).content_html, '<p><em>3</em></p>')
+
+    def test_resumes_from_checkpoint(self):
+        path = f'{tempfile.mkdtemp()}/checkpoint.json'
+        with open(path, 'w') as f:
+            f.write(f'{{"thread": {self.threads[2].pk}}}')
+
+        call_command('rerender_content', workers=1, checkpoint=path, stdout=StringIO())
+
+        rendered = Thread.objects.filter(content_html_version=rendering.RENDER_VERSION)
+        self.assertEqual(set(rendered), set(self.threads[3:]))
+        self.assertFalse(os.path.exists(path))
+
+    def test_rows_edited_during_rendering_are_not_overwritten(self):
+        edited = self.threads[1]
+        render_rows = markup.render_rows
+
+        def render_then_edit(rows):
+            results = render_rows(rows)
+            if edited.pk in dict(rows):
+                edited.content = '**new**'
+                edited.save()
+            return results
+
+        out = StringIO()
+        with mock.patch.object(markup, 'render_rows', render_then_edit):
+            call_command('rerender_content', workers=1, chunk_size=2, stdout=out)
+
+        self.assertIn('4/5 rows', out.getvalue())
+        edited.refresh_from_db()
+        self.assertEqual(edited.content_html, '<p><strong>new</strong></p>')
+
+
+class ThreadListCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.thread = Thread.objects.create(title='Original title', content='Body')
+
+    def test_anonymous_pages_are_cached_until_a_thread_changes(self):
+        url = reverse('thread-list')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url), 'Original title')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.thread.title = 'Edited title'
+            self.thread.save()
+        self.assertContains(self.client.get(url), 'Edited title')
+
+    def test_cached_pages_keep_status_and_headers(self):
+        url = reverse('thread-list')
+        render_to_response = ThreadListView.render_to_response
+
+        def with_vary(view, context, **kwargs):
+            response = render_to_response(view, context, **kwargs)
+            response['Vary'] = 'Accept-Language'
+            return response
+
+        with mock.patch.object(ThreadListView, 'render_to_response', with_vary):
+            miss = self.client.get(url)
+        hit = self.client.get(url)
+
+        self.assertEqual(hit.status_code, miss.status_code)
+        self.assertEqual(hit['Content-Type'], miss['Content-Type'])
+        self.assertEqual(hit['Vary'], miss['Vary'])
+        self.assertIn('Accept-Language', hit['Vary'])
+        self.assertEqual(hit.content, miss.content)
+
+    def test_category_change_refreshes_the_filter_fragment(self):
+        user = User.objects.create_user('reader', password='pw')
+        self.client.force_login(user)
+        url = reverse('thread-list')
+        self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Brand new category')
+        self.assertContains(self.client.get(url), 'Brand new category')
+
+    def test_logged_in_pages_are_not_cached(self):
+        self.client.force_login(User.objects.create_user('reader', password='pw'))
+        self.client.get(reverse('thread-list'))
+        self.client.logout()
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('thread-list'))
+        self.assertTrue(ctx.captured_queries)
+
+
+class TaxonomyRegistryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        taxonomy.clear()
+        Category.objects.create(name='General')
+        Tags.objects.create(name='quiz')
+
+    def test_lookups_are_memoized_until_the_generation_changes(self):
+        self.assertEqual([c.name for c in taxonomy.categories()], ['General'])
+        with self.assertNumQueries(0):
+            self.assertEqual([t.name for t in taxonomy.tags()], ['quiz'])
+
+        # Another worker's change only reaches this process through the
+        # shared generation key.
+        Category.objects.bulk_create([Category(name='Exams')])
+        self.assertEqual(len(taxonomy.categories()), 1)
+        caching.bump_version('taxonomy')
+        self.assertEqual([c.name for c in taxonomy.categories()], ['General', 'Exams'])
+
+    def test_saving_a_tag_invalidates_the_registry(self):
+        taxonomy.tags()
+        with self.captureOnCommitCallbacks(execute=True):
+            Tags.objects.filter(name='quiz').get().delete()
+        self.assertEqual(taxonomy.tags(), ())
+
+    @override_settings(FORUM_TAXONOMY_TTL=0)
+    def test_ttl_forces_a_reload(self):
+        taxonomy.categories()
+        Category.objects.bulk_create([Category(name='Exams')])
+        self.assertEqual(len(taxonomy.categories()), 2)
+
+
+class TagResolutionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('author', password='pw')
+        self.category = Category.objects.create(name='General')
+        self.client.force_login(self.user)
+
+    def create_thread(self, tags):
+        return self.client.post(reverse('thread-create'), {
+            'title': 'Tagged', 'content': 'Body', 'category': self.category.pk, 'tags': tags,
+        })
+
+    def test_mixed_case_tags_are_merged_into_lower_case(self):
+        migration = import_module('forum.migrations.0020_lowercase_tag_names')
+        Tags.objects.bulk_create([Tags(name='Django'), Tags(name='django'), Tags(name='Notes')])
+        old, current, notes = Tags.objects.order_by('pk')
+        first = Thread.objects.create(title='One', content='Body')
+        second = Thread.objects.create(title='Two', content='Body')
+        first.tags.add(old, current)
+        second.tags.add(old, notes)
+
+        migration.merge_case_duplicates(django_apps, None)
+
+        self.assertEqual(sorted(Tags.objects.values_list('name', flat=True)), ['django', 'notes'])
+        django = Tags.objects.get(name='django')
+        self.assertEqual(django.pk, current.pk)
+        self.assertEqual(set(django.thread_set.all()), {first, second})
+        self.assertEqual(django.thread_count, 2)
+        self.create_thread('Django, NOTES')
+        self.assertEqual(Tags.objects.count(), 2)
+
+    def test_names_are_normalized_and_deduped(self):
+        self.assertEqual(normalize_tag_names(' #Quiz, quiz ,, Mid  Sem,notes'), ['quiz', 'mid sem', 'notes'])
+
+    def test_query_count_does_not_depend_on_tag_count(self):
+        Tags.objects.create(name='existing')
+        with CaptureQueriesContext(connection) as few:
+            self.create_thread('existing, new0')
+        with CaptureQueriesContext(connection) as many:
+            self.create_thread('existing, ' + ', '.join(f'new{i}' for i in range(1, 12)))
+
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+        thread = Thread.objects.latest('pk')
+        self.assertEqual(thread.tags.count(), 12)
+        self.assertEqual(Tags.objects.filter(name__startswith='new').count(), 12)
+
+
+@skipIf(connection.vendor == 'sqlite', 'SQLite serializes writers with table locks')
+class TagResolutionConcurrencyTests(TransactionTestCase):
+    workers = 8
+
+    def test_concurrent_creation_of_the_same_tag(self):
+        barrier = threading.Barrier(self.workers)
+        results, errors = [], []
+
+        def worker():
+            try:
+                barrier.wait()
+                results.append({tag.pk for tag in resolve_tags(['brand-new', 'also-new'])})
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Tags.objects.filter(name__in=['brand-new', 'also-new']).count(), 2)
+        self.assertEqual(len({frozenset(r) for r in results}), 1)
+
+
+class TagBrowsingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        taxonomy.clear()
+        self.quiz, self.notes = Tags.objects.create(name='quiz'), Tags.objects.create(name='notes')
+        self.threads = [Thread.objects.create(title=f'Thread {i}', content='Body') for i in range(3)]
+
+    def counts(self):
+        return dict(Tags.objects.values_list('name', 'thread_count'))
+
+    def test_thread_count_follows_tag_changes(self):
+        first, second, third = self.threads
+        first.tags.add(self.quiz, self.notes)
+        first.tags.add(self.quiz)
+        second.tags.set([self.quiz])
+        self.notes.thread_set.add(second, third)
+        self.assertEqual(self.counts(), {'quiz': 2, 'notes': 3})
+
+        first.tags.remove(self.notes, self.notes)
+        third.tags.clear()
+        self.quiz.thread_set.remove(second)
+        self.assertEqual(self.counts(), {'quiz': 1, 'notes': 1})
+
+        first.delete()
+        self.assertEqual(self.counts(), {'quiz': 0, 'notes': 1})
+
+    def test_reconcile_command_repairs_drift(self):
+        self.threads[0].tags.add(self.quiz)
+        Tags.objects.update(thread_count=7)
+        call_command('reconcile_tag_counts', stdout=StringIO())
+        self.assertEqual(self.counts(), {'quiz': 1, 'notes': 0})
+
+    def test_tag_filter_and_tag_page(self):
+        self.threads[0].tags.add(self.quiz)
+        self.threads[2].tags.add(self.quiz, self.notes)
+
+        response = self.client.get(reverse('thread-list'), {'tag': 'Quiz'})
+        self.assertEqual(list(response.context['threads']), [self.threads[2], self.threads[0]])
+        self.assertEqual([t.name for t in response.context['tag_cloud']], ['quiz', 'notes'])
+
+        response = self.client.get(reverse('tag-threads', args=['notes']))
+        self.assertEqual(list(response.context['threads']), [self.threads[2]])
+        self.assertContains(response, '#notes')
+
+        self.assertEqual(self.client.get(reverse('tag-threads', args=['missing'])).status_code, 404)
+        self.assertEqual(list(self.client.get(reverse('thread-list'), {'tag': 'missing'}).context['threads']), [])
+
+    def test_tags_are_found_whatever_their_case(self):
+        Tags.objects.bulk_create([Tags(name='Django')])
+        django = Tags.objects.get(name='Django')
+        self.threads[0].tags.add(django)
+
+        for name in ('Django', 'django', 'DJANGO'):
+            response = self.client.get(reverse('tag-threads', args=[name]))
+            self.assertEqual(list(response.context['threads']), [self.threads[0]], name)
+        self.assertEqual(taxonomy.find_tag(' DJango ').id, django.pk)
+
+
+def png_bytes(size=(64, 48)):
+    output = BytesIO()
+    Image.new('RGB', size, 'red').save(output, format='PNG')
+    return output.getvalue()
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    FORUM_UPLOAD_TEMP_DIR=tempfile.mkdtemp(),
+    FORUM_UPLOAD_CHUNK_SIZE=1024,
+    FORUM_UPLOAD_MAX_SIZES={'pdf': 8192, 'document': 8192, 'image': 2048, 'video': 8192, 'audio': 8192, 'other': 8192},
+    CELERY_TASK_ALWAYS_EAGER=True,
+)
+class ResourceUploadTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='pw')
+        self.thread = Thread.objects.create(title='Notes', content='Body', author=self.author)
+        self.client.force_login(self.author)
+
+    def start(self, data, filename='notes.pdf'):
+        return self.client.post(reverse('resource-upload-start', args=[self.thread.pk]), {
+            'title': 'Lecture notes', 'filename': filename, 'size': len(data),
+        })
+
+    def put(self, url, data, offset):
+        return self.client.put(
+            url, data, content_type='application/octet-stream', headers={'Upload-Offset': str(offset)}
+        )
+
+    def test_file_types_come_from_magic_bytes(self):
+        self.assertEqual(uploads.detect_file_type(b'%PDF-1.7 ...', 'x.exe'), 'pdf')
+        self.assertEqual(uploads.detect_file_type(png_bytes(), 'x.pdf'), 'image')
+        self.assertEqual(uploads.detect_file_type(b'\x00\x00\x00\x18ftypmp42', 'clip'), 'video')
+        self.assertEqual(uploads.detect_file_type(b'\x00\x00\x00\x18ftypM4A ', 'song'), 'audio')
+        self.assertEqual(uploads.detect_file_type(b'ID3\x04', 'song.mp3'), 'audio')
+        self.assertEqual(uploads.detect_file_type(b'PK\x03\x04', 'essay.docx'), 'document')
+        self.assertEqual(uploads.detect_file_type(b'PK\x03\x04', 'archive.zip'), 'other')
+
+    def test_chunked_upload_resumes_and_creates_the_resource(self):
+        data = b'%PDF-1.4\n' + bytes(range(256)) * 10
+        url = self.start(data).json()['url']
+
+        self.assertEqual(self.put(url, data[:1024], 0).json(), {'offset': 1024})
+        # A retried or out-of-order chunk is refused with the real offset.
+        conflict = self.put(url, data[2048:3072], 2048)
+        self.assertEqual((conflict.status_code, conflict.json()['offset']), (409, 1024))
+        self.assertEqual(self.client.get(url).json()['offset'], 1024)
+
+        self.put(url, data[1024:2048], 1024)
+        response = self.put(url, data[2048:], 2048)
+
+        self.assertEqual(response.status_code, 201)
+        resource = ThreadResource.objects.get(pk=response.json()['resource_id'])
+        self.assertEqual(resource.file_type, 'pdf')
+        with resource.file.open('rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(settings.FORUM_UPLOAD_TEMP_DIR), [])
+
+    def test_limit_applies_to_the_detected_type(self):
+        data = png_bytes((400, 400)) + b'\x00' * 2048
+        url = self.start(data, filename='notes.pdf').json()['url']
+
+        response = self.put(url, data[:1024], 0)
+
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_oversized_chunks_and_other_users_are_rejected(self):
+        url = self.start(b'x' * 4096).json()['url']
+        self.assertEqual(self.put(url, b'x' * 2048, 0).status_code, 413)
+
+        self.client.force_login(User.objects.create_user('intruder', password='pw'))
+        self.assertEqual(self.put(url, b'x' * 10, 0).status_code, 404)
+        self.assertEqual(self.start(b'x').status_code, 403)
+
+    def test_image_upload_gets_a_preview_in_the_background(self):
+        upload = ContentFile(png_bytes(), name='photo.bin')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('upload-resource', args=[self.thread.pk]), {
+                'title': 'Photo', 'file_type': 'pdf', 'file': upload,
+            })
+
+        resource = ThreadResource.objects.get()
+        self.assertEqual(resource.file_type, 'image')
+        self.assertTrue(resource.preview.name.endswith('.jpg'))
+
+    def test_decompression_bomb_is_skipped(self):
+        resource = ThreadResource.objects.create(
+            thread=self.thread, title='Bomb', file=ContentFile(png_bytes((400, 400)), name='bomb.png'), file_type='image',
+        )
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000), self.assertLogs('forum.previews', 'WARNING'):
+            self.assertFalse(generate_preview(resource))
+        self.assertFalse(resource.preview)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), FORUM_MEDIA_ACCEL_REDIRECT=False)
+class ResourceDownloadTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='pw')
+        thread = Thread.objects.create(title='Notes', content='Body', author=self.author)
+        self.data = b'%PDF-1.4\n' + bytes(range(256)) * 4
+        self.resource = ThreadResource.objects.create(
+            thread=thread, title='Notes', file=ContentFile(self.data, name='notes.pdf'),
+            file_type='pdf', uploaded_by=self.author,
+        )
+        self.url = reverse('resource-download', args=[self.resource.pk])
+        self.client.force_login(User.objects.create_user('reader', password='pw'))
+
+    def test_download_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_full_download_is_cacheable_privately(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertTrue(response['Cache-Control'].startswith('private'))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+        again = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=9-18'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.data[9:19])
+        self.assertEqual(response['Content-Range'], f'bytes 9-18/{len(self.data)}')
+
+        suffix = self.client.get(self.url, headers={'Range': 'bytes=-4'})
+        self.assertEqual(b''.join(suffix.streaming_content), self.data[-4:])
+
+        stale = self.client.get(self.url, headers={'Range': 'bytes=9-18', 'If-Range': '"other"'})
+        self.assertEqual(stale.status_code, 200)
+
+        self.assertEqual(self.client.get(self.url, headers={'Range': f'bytes={len(self.data)}-'}).status_code, 416)
+
+    @override_settings(FORUM_MEDIA_ACCEL_REDIRECT=True)
+    def test_accel_redirect_hands_the_file_to_nginx(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.resource.file.name)
+        self.assertIn('ETag', response)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), CELERY_TASK_ALWAYS_EAGER=True)
+class ResourceBlobTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='pw')
+        self.thread = Thread.objects.create(title='Notes', content='Body', author=self.author)
+        self.client.force_login(self.author)
+
+    def upload(self, data, name='notes.pdf', thread=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('upload-resource', args=[(thread or self.thread).pk]), {
+                'title': 'Lecture notes', 'file': ContentFile(data, name=name),
+            })
+        return ThreadResource.objects.latest('pk')
+
+    def test_identical_uploads_share_one_blob(self):
+        data = b'%PDF-1.4\n' + os.urandom(512)
+        other = Thread.objects.create(title='Other', content='Body', author=self.author)
+        first = self.upload(data, 'week1.pdf')
+        second = self.upload(data, 'copy.pdf', thread=other)
+
+        blob = ResourceBlob.objects.get()
+        self.assertEqual((first.blob_id, second.blob_id, blob.ref_count), (blob.pk, blob.pk, 2))
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(blobs.stats()['saved_bytes'], len(data))
+        response = self.client.get(reverse('resource-download', args=[second.pk]))
+        self.assertIn('copy.pdf', response['Content-Disposition'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete-resource', args=[first.pk]))
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(os.path.exists(blob.file.path))
+
+        # Deleting the thread cascades to the last reference.
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertFalse(ResourceBlob.objects.exists())
+        self.assertFalse(os.path.exists(blob.file.path))
+
+    def test_reupload_before_the_file_delete_keeps_the_file(self):
+        data = b'%PDF-1.4\n' + os.urandom(512)
+        resource = self.upload(data)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.client.post(reverse('delete-resource', args=[resource.pk]))
+
+        again = self.upload(data, 'again.pdf')
+        for callback in callbacks:
+            callback()
+
+        blob = ResourceBlob.objects.get()
+        self.assertEqual((again.blob_id, blob.ref_count), (blob.pk, 1))
+        self.assertTrue(os.path.exists(blob.file.path))
+
+    def test_dedupe_command_moves_legacy_files(self):
+        data = b'%PDF-1.4\n' + os.urandom(512)
+        legacy = [
+            ThreadResource.objects.create(
+                thread=self.thread, title=f'Copy {i}', file=ContentFile(data, name='notes.pdf'), file_type='pdf',
+            )
+            for i in range(3)
+        ]
+        paths = [resource.file.path for resource in legacy]
+
+        out = StringIO()
+        call_command('dedupe_resources', '--dry-run', stdout=out)
+        self.assertIn('2 duplicates', out.getvalue())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('dedupe_resources', stdout=StringIO())
+
+        blob = ResourceBlob.objects.get()
+        self.assertEqual(blob.ref_count, 3)
+        self.assertIn('notes.pdf', ThreadResource.objects.values_list('original_name', flat=True))
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+        self.assertEqual(blobs.stats()['legacy_resources'], 0)
+
+
+class AsyncViewTests(TestCase):
+    """
+    The ASGI profile's views, called directly since the URLconf routes to
+    the sync ones unless FORUM_ASYNC_VIEWS is set at startup.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', 'author@example.com', 'pw')
+        self.user = User.objects.create_user('user', 'user@example.com', 'pw')
+        self.thread = Thread.objects.create(title='Async thread', content='**Body**', author=self.author)
+        add_reply(self.thread, self.user, 'First reply')
+
+    def request(self, method, path, user):
+        request = getattr(AsyncRequestFactory(), method)(path)
+
+        async def auser():
+            return user
+        request.auser = auser
+        return request
+
+    async def test_thread_detail(self):
+        view = async_views.ThreadDetailView.as_view()
+        url = reverse('thread-detail', args=[self.thread.pk])
+
+        response = await view(self.request('get', url, self.user), pk=self.thread.pk)
+        self.assertContains(response, '<strong>Body</strong>', html=True)
+        self.assertContains(response, 'First reply')
+
+        anonymous = await view(self.request('get', url, AnonymousUser()), pk=self.thread.pk)
+        self.assertEqual(anonymous.status_code, 302)
+
+    async def test_thread_list_caches_anonymous_pages(self):
+        view = async_views.ThreadListView.as_view()
+        url = reverse('thread-list')
+
+        response = await view(self.request('get', url, AnonymousUser()))
+        self.assertContains(response, 'Async thread')
+
+        cached = await view(self.request('get', url, AnonymousUser()))
+        self.assertEqual(cached.content, response.content)
+
+    async def test_like_thread(self):
+        url = reverse('thread-like', args=[self.thread.pk])
+
+        response = await async_views.like_thread(self.request('post', url, self.user), pk=self.thread.pk)
+
+        self.assertEqual(response.status_code, 302)
+        thread = await Thread.objects.aget(pk=self.thread.pk)
+        self.assertEqual(thread.likes_count, 1)
+
+
+class SeedBulkCommandTests(TestCase):
+    def test_counters_match_generated_rows(self):
+        call_command(
+            'seed_bulk', '--users', '20', '--threads', '60', '--tags', '10',
+            '--shard-size', '25', '--batch-size', '10', '--workers', '1', stdout=StringIO(),
+        )
+
+        self.assertEqual(Thread.objects.count(), 60)
+        threads = Thread.objects.annotate(
+            n_likes=Count('likes', distinct=True), n_replies=Count('replies', distinct=True),
+        )
+        for thread in threads:
+            self.assertEqual((thread.likes_count, thread.reply_count), (thread.n_likes, thread.n_replies))
+        self.assertFalse(Thread.objects.exclude(content_html_version=rendering.RENDER_VERSION).exists())
+        for tag in Tags.objects.annotate(n_threads=Count('thread')):
+            self.assertEqual(tag.thread_count, tag.n_threads)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), CELERY_TASK_ALWAYS_EAGER=True)
+class LoadTestTests(TestCase):
+    def result(self, p95_ms, rps=100, errors=0):
+        row = {'requests': 100, 'errors': errors, 'rps': rps, 'p50_ms': 10, 'p95_ms': p95_ms, 'p99_ms': 50}
+        return {'rps': rps, 'urls': {'thread-list': row}}
+
+    def test_mix_requests_succeed_with_load_sessions(self):
+        thread = Thread.objects.create(title='Django: notes', content='Body')
+        session = loadtest.load_sessions(1)[0]
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.key
+        rng = random.Random(0)
+
+        for name, _, make in loadtest.mixes([thread.pk], ['Django'])['mixed']:
+            method, path, kwargs = make(rng, session)
+            if method == 'GET':
+                response = self.client.get(path, kwargs.get('params'))
+            else:
+                data = dict(kwargs.get('data', {}))
+                for field, (filename, content, content_type) in kwargs.get('files', {}).items():
+                    data[field] = SimpleUploadedFile(filename, content, content_type)
+                response = self.client.post(path, data)
+            self.assertLess(response.status_code, 400, name)
+            self.assertNotIn(settings.LOGIN_URL, response.get('Location', ''), name)
+
+        self.assertEqual(ThreadResource.objects.get().thread_id, session.thread_id)
+        self.assertEqual(Replies.objects.filter(thread=thread).count(), 1)
+
+    def test_compare_flags_regressions(self):
+        baseline = self.result(p95_ms=40)
+
+        self.assertEqual(loadtest.compare(self.result(p95_ms=44), baseline), [])
+        self.assertEqual(loadtest.compare(self.result(p95_ms=60), baseline), ['thread-list p95_ms: 40 -> 60'])
+        self.assertEqual(loadtest.compare(self.result(p95_ms=40, rps=70), baseline), ['requests/sec: 100 -> 70'])
+        self.assertEqual(len(loadtest.compare(self.result(p95_ms=40, errors=3), baseline)), 1)
+
+    def test_compare_ignores_small_absolute_slowdowns(self):
+        baseline = self.result(p95_ms=2)
+
+        self.assertEqual(loadtest.compare(self.result(p95_ms=4), baseline), [])
+
+
+@override_settings(
+    MIDDLEWARE=['forum.profiling.ProfilingMiddleware', *settings.MIDDLEWARE],
+    TEMPLATES=[{**settings.TEMPLATES[0], 'BACKEND': 'forum.profiling.DjangoTemplates'}],
+    CACHES={'default': {'BACKEND': 'forum.profiling.LocMemCache', 'LOCATION': 'profiling-tests'}},
+    FORUM_PROFILING_SAMPLE_RATE=1.0,
+)
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader', password='pw')
+        self.thread = Thread.objects.create(title='Profiled', content='**Body**', author=self.user)
+
+    def timings(self, response):
+        return dict(metric.split(';', 1) for metric in response['Server-Timing'].split(', '))
+
+    def test_records_queries_and_template_time(self):
+        self.client.force_login(self.user)
+        url = reverse('thread-detail', args=[self.thread.pk])
+
+        with CaptureQueriesContext(connection) as queries, self.assertLogs('forum.profiling', 'INFO') as logs:
+            response = self.client.get(url)
+
+        timings = self.timings(response)
+        self.assertIn(f'desc="{len(queries)} queries"', timings['db'])
+        self.assertIn('template', timings)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['url_name'], record['status'], record['db_queries']), ('thread-detail', 200, len(queries)))
+
+    def test_counts_cache_hits_and_misses(self):
+        url = reverse('thread-list')
+        with self.assertLogs('forum.profiling', 'INFO'):
+            self.client.get(url)
+            response = self.client.get(url)
+
+        self.assertEqual(self.timings(response)['cache'], 'desc="2 hits / 0 misses"')
+
+    def test_markdown_and_bleach_spans(self):
+        self.client.force_login(self.user)
+        with self.assertLogs('forum.profiling', 'INFO'):
+            response = self.client.post(reverse('thread-reply', args=[self.thread.pk]), {'content': '*Thanks*'})
+
+        self.assertIn('markdown', self.timings(response))
+        self.assertIn('bleach', self.timings(response))
+
+    @override_settings(FORUM_PROFILING_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_untouched(self):
+        response = self.client.get(reverse('thread-list'))
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertIsNone(profiling.current.get())
+
+    async def test_async_requests_record_queries(self):
+        with self.assertLogs('forum.profiling', 'INFO') as logs:
+            response = await self.async_client.get(reverse('thread-list'))
+
+        self.assertIn('db', self.timings(response))
+        self.assertGreater(json.loads(logs.records[0].getMessage())['db_queries'], 0)
+
+
+@override_settings(MIDDLEWARE=['forum.metrics.MetricsMiddleware', *settings.MIDDLEWARE])
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('member', password='pw')
+        self.thread = Thread.objects.create(title='Measured', content='Body', author=self.user)
+
+    def sample(self, name, **labels):
+        return metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_requests_are_counted_per_url_name(self):
+        self.client.force_login(self.user)
+        url = reverse('thread-detail', args=[self.thread.pk])
+        labels = {'url_name': 'thread-detail', 'method': 'GET'}
+        before = self.sample('forum_requests_total', status='2xx', **labels)
+        queries_before = self.sample('forum_db_queries_per_request_sum', url_name='thread-detail')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+
+        self.assertEqual(self.sample('forum_requests_total', status='2xx', **labels), before + 1)
+        self.assertEqual(self.sample('forum_db_queries_per_request_sum', url_name='thread-detail'), queries_before + len(queries))
+        self.assertGreater(self.sample('forum_request_duration_seconds_count', **labels), 0)
+
+    def test_unknown_paths_share_one_label(self):
+        self.client.get('/no/such/page/')
+        self.client.get('/another/missing/page/')
+
+        self.assertGreaterEqual(self.sample('forum_requests_total', url_name='unresolved', method='GET', status='4xx'), 2)
+
+    def test_activity_and_task_metrics(self):
+        replies = self.sample('forum_activity_total', kind='reply')
+        likes = self.sample('forum_activity_total', kind='like')
+        runs = self.sample('forum_task_duration_seconds_count', task=flush_like_counters_task.name)
+
+        add_reply(self.thread, self.user, 'Thanks')
+        toggle_like(self.thread.pk, self.user)
+        flush_like_counters_task.apply()
+
+        self.assertEqual(self.sample('forum_activity_total', kind='reply'), replies + 1)
+        self.assertEqual(self.sample('forum_activity_total', kind='like'), likes + 1)
+        self.assertEqual(self.sample('forum_task_duration_seconds_count', task=flush_like_counters_task.name), runs + 1)
+
+    def test_exposition_includes_queue_depth(self):
+        queue_notification('author@example.com', 'admin', 'Subject', '<p>Body</p>')
+
+        response = metrics.metrics_view(RequestFactory().get('/metrics'))
+
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE_LATEST)
+        self.assertIn(b'forum_email_queue_depth 1.0', response.content)
+        self.assertIn(b'forum_requests_total', response.content)
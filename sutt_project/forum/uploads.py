@@ -0,0 +1,229 @@
+"""
+Thread resource uploads.
+
+Large files arrive as a resumable series of chunks: start_upload() opens an
+UploadSession, append_chunk() streams each request body onto a partial file
+under FORUM_UPLOAD_TEMP_DIR (never holding a whole chunk in memory), and the
+last chunk moves the file into the content-addressed blob store (see
+forum/blobs.py) as a ThreadResource. A client that loses its connection
+asks for the session's offset and carries on from there.
+
+The resource type is detected from the file's leading bytes, not from the
+client, and FORUM_UPLOAD_MAX_SIZES is enforced for that type. Previews are
+generated afterwards by a Celery task (see forum/previews.py).
+"""
+
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from forum import blobs
+from forum.blobs import READ_SIZE
+from forum.models import ThreadResource, UploadSession
+
+# Enough leading bytes for every signature below.
+HEAD_SIZE = 512
+
+OFFICE_EXTENSIONS = {'.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp'}
+MP4_AUDIO_BRANDS = {b'M4A ', b'M4B '}
+
+
+class UploadError(Exception):
+    """
+    A rejected upload. ``status`` is the HTTP status to answer with.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def detect_file_type(head, filename=''):
+    """
+    Map leading file bytes to a ThreadResource file_type.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+
+    if head.startswith(b'%PDF-'):
+        return 'pdf'
+    if head.startswith((b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff', b'GIF87a', b'GIF89a')):
+        return 'image'
+    if head[:4] == b'RIFF':
+        return {b'WEBP': 'image', b'AVI ': 'video', b'WAVE': 'audio'}.get(head[8:12], 'other')
+    if head[4:8] == b'ftyp':
+        return 'audio' if head[8:12] in MP4_AUDIO_BRANDS else 'video'
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'video'
+    if head.startswith((b'ID3', b'OggS', b'fLaC')) or head[:2] in (b'\xff\xfb', b'\xff\xf3', b'\xff\xf2'):
+        return 'audio'
+    if head.startswith(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'):
+        return 'document'
+    if head.startswith(b'PK\x03\x04') and extension in OFFICE_EXTENSIONS:
+        return 'document'
+    return 'other'
+
+
+def max_size(file_type=None):
+    """
+    The size limit for a type, or the largest limit when it isn't known yet.
+    """
+    limits = settings.FORUM_UPLOAD_MAX_SIZES
+    return limits[file_type] if file_type else max(limits.values())
+
+
+def check_size(size, file_type=None):
+    limit = max_size(file_type)
+    if size > limit:
+        kind = dict(ThreadResource.FILE_TYPE_CHOICES).get(file_type, 'Upload')
+        raise UploadError(f"{kind} files are limited to {limit // (1024 * 1024)} MB.", status=413)
+
+
+def partial_path(session):
+    return os.path.join(settings.FORUM_UPLOAD_TEMP_DIR, f'{session.pk}.part')
+
+
+class _StoredPartial(File):
+    """
+    The finished partial file. Exposing temporary_file_path() lets
+    FileSystemStorage move it into place instead of copying it.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def start_upload(thread, user, title, description, filename, size):
+    if not title or not filename:
+        raise UploadError("A title and a file are required.")
+    if size <= 0:
+        raise UploadError("The file is empty.")
+    check_size(size)
+
+    session = UploadSession.objects.create(
+        thread=thread,
+        uploaded_by=user,
+        title=title,
+        description=description,
+        filename=get_valid_filename(os.path.basename(filename)) or 'upload',
+        size=size,
+    )
+    os.makedirs(settings.FORUM_UPLOAD_TEMP_DIR, exist_ok=True)
+    open(partial_path(session), 'wb').close()
+    return session
+
+
+def append_chunk(session_id, user, offset, stream, length):
+    """
+    Append ``length`` bytes from ``stream`` at ``offset``. Returns the
+    session and, once the last byte has arrived, the new ThreadResource.
+    The session row is locked so concurrent retries of the same chunk
+    can't interleave their writes.
+    """
+    if length > settings.FORUM_UPLOAD_CHUNK_SIZE:
+        raise UploadError("Chunk too large.", status=413)
+
+    with transaction.atomic():
+        try:
+            session = UploadSession.objects.select_for_update().get(pk=session_id, uploaded_by=user)
+        except UploadSession.DoesNotExist:
+            raise UploadError("Unknown upload.", status=404)
+
+        if offset != session.received:
+            raise UploadError("Offset mismatch.", status=409)
+        if session.received + length > session.size:
+            raise UploadError("More data than announced.", status=400)
+
+        path = partial_path(session)
+        written = 0
+        with open(path, 'r+b') as partial:
+            partial.seek(offset)
+            while written < length:
+                data = stream.read(min(READ_SIZE, length - written))
+                if not data:
+                    break
+                partial.write(data)
+                written += len(data)
+            partial.truncate()
+
+        session.received += written
+        rejected = None
+        if offset == 0:
+            with open(path, 'rb') as partial:
+                session.file_type = detect_file_type(partial.read(HEAD_SIZE), session.filename)
+            try:
+                check_size(session.size, session.file_type)
+            except UploadError as exc:
+                rejected = exc
+                discard(session)
+
+        if rejected is None:
+            session.save(update_fields=['received', 'file_type', 'updated_at'])
+            resource = finish_upload(session) if session.received == session.size else None
+
+    # Raised outside the atomic block so the discarded session stays deleted.
+    if rejected is not None:
+        raise rejected
+    return session, resource
+
+
+def finish_upload(session):
+    path = partial_path(session)
+    with open(path, 'rb') as partial:
+        resource = ThreadResource(
+            thread=session.thread,
+            title=session.title,
+            file_type=session.file_type or 'other',
+            description=session.description,
+            uploaded_by=session.uploaded_by,
+        )
+        blobs.attach(resource, _StoredPartial(partial, name=session.filename), session.filename)
+        resource.save()
+    discard(session)
+    return resource
+
+
+def discard(session):
+    try:
+        os.remove(partial_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+
+def save_uploaded_file(thread, user, title, description, uploaded_file):
+    """
+    Create a ThreadResource from a regular multipart upload, which Django
+    has already spooled to disk past FILE_UPLOAD_MAX_MEMORY_SIZE.
+    """
+    head = uploaded_file.read(HEAD_SIZE)
+    uploaded_file.seek(0)
+    file_type = detect_file_type(head, uploaded_file.name)
+    check_size(uploaded_file.size, file_type)
+    resource = ThreadResource(
+        thread=thread,
+        title=title,
+        file_type=file_type,
+        description=description,
+        uploaded_by=user,
+    )
+    with transaction.atomic():
+        blobs.attach(resource, uploaded_file, os.path.basename(uploaded_file.name))
+        resource.save()
+    return resource
+
+
+def expire_stale_sessions():
+    """
+    Discard uploads that haven't received a chunk within
+    FORUM_UPLOAD_SESSION_TTL. Returns how many were removed.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.FORUM_UPLOAD_SESSION_TTL)
+    stale = list(UploadSession.objects.filter(updated_at__lt=cutoff))
+    for session in stale:
+        discard(session)
+    return len(stale)
@@ -1,15 +1,25 @@
-from . import views
+from . import async_views, views
+from django.conf import settings
 from django.urls import path
 
+# The ASGI profile serves the hot read paths and likes from async views.
+hot_views = async_views if settings.FORUM_ASYNC_VIEWS else views
+
 urlpatterns = [
   path("",views.forum_home, name="forum-home"),
-  path("threads/",views.ThreadListView.as_view(), name="thread-list"),
+  path("threads/",hot_views.ThreadListView.as_view(), name="thread-list"),
+  path("threads/tags/<path:name>/",hot_views.TagThreadListView.as_view(), name="tag-threads"),
   path("my-threads/", views.MyThreadsListView.as_view(), name="my-threads"),
   path("threads/create",views.ThreadView.as_view(), name="thread-create"),
-  path("threads/<int:pk>/",views.ThreadDetailView.as_view(), name="thread-detail"),
-  path("threads/<int:pk>/like",views.like_thread, name="thread-like"),
+  path("threads/<int:pk>/",hot_views.ThreadDetailView.as_view(), name="thread-detail"),
+  path("threads/<int:pk>/replies/",views.thread_replies, name="thread-replies"),
+  path("threads/<int:pk>/like",hot_views.like_thread, name="thread-like"),
   path("threads/<int:thread_id>/report/",views.report_thread, name="thread-report"),
   path("threads/<int:thread_id>/upload-resource/", views.upload_thread_resource, name="upload-resource"),
+  path("threads/<int:thread_id>/uploads/", views.start_resource_upload, name="resource-upload-start"),
+  path("uploads/<uuid:upload_id>/", views.resource_upload_chunk, name="resource-upload-chunk"),
+  path("resources/<int:resource_id>/download/", views.download_thread_resource, name="resource-download"),
+  path("resources/<int:resource_id>/preview/", views.download_thread_resource, {"preview": True}, name="resource-preview"),
   path("resources/<int:resource_id>/delete/", views.delete_thread_resource, name="delete-resource"),
   path("reports/",views.ReportListView.as_view(), name="report-list"),
   path("reports/<int:report_id>/review/",views.review_report, name="report-review"),
@@ -1,29 +1,24 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404,redirect
+from django.http import Http404, JsonResponse
+from django.template.loader import render_to_string
 from django.views.generic import TemplateView, DetailView, ListView,CreateView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Count, Q
-from .models import Category, Tags, Thread, Replies, Likes, Report, ThreadResource
-from forum.emails import send_thread_like_notification
-from django.contrib.postgres.search import TrigramSimilarity
-import markdown 
-import bleach
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Prefetch, Q
+from .models import Category, Tags, Thread, Replies, Likes, Report, ThreadResource, UploadSession
+from forum import caching, counters, downloads, rendering, taxonomy, uploads
+from forum.pagination import CursorPaginationMixin, CursorPaginator
+from forum.search import search_threads, similarity_threshold
+from forum.services import add_reply, normalize_tag_names, resolve_tags, soft_delete_reply, toggle_like
+from forum.tasks import send_thread_like_notification_task
+from sutt_project.celery import enqueue_on_commit
 
-
-ALLOWED_TAGS = [
-    "p", "h1", "h2", "h3", "h4", "h5", "h6",
-    "ul", "ol", "li",
-    "strong", "em", "blockquote",
-    "code", "pre",
-    "a",
-    "img",
-]
-
-ALLOWED_ATTRIBUTES = {
-    "a": ["href", "title"],
-    "img": ["src", "alt", "width", "height"],
-}
+REPLIES_PER_PAGE = 20
+TAG_CLOUD_SIZE = 30
 
 # Create your views here.
 def forum_home(request):
@@ -59,65 +54,107 @@ class ThreadView(LoginRequiredMixin,CreateView):
     fields = ['title', 'content', 'category']
     
     def form_valid(self,form):
-        thread = form.save(commit=False)
-        thread.author = self.request.user
-        thread.save()
-        
-        raw_tags = self.request.POST.get("tags", "")
-        tag_names = [tag.strip() for tag in raw_tags.split(",") if tag.strip()]
-        for tag_name in tag_names:
-            tag, created = Tags.objects.get_or_create(name=tag_name)
-            thread.tags.add(tag)
+        with transaction.atomic():
+            thread = form.save(commit=False)
+            thread.author = self.request.user
+            thread.save()
+            
+            tags = resolve_tags(normalize_tag_names(self.request.POST.get("tags", "")))
+            if tags:
+                thread.tags.add(*tags)
         
         return super().form_valid(form)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
+        context['categories'] = taxonomy.categories()
         return context
 
         
 
-class ThreadListView(ListView):
+class ThreadListView(caching.AnonymousPageCacheMixin, CursorPaginationMixin, ListView):
     model = Thread
     template_name = 'forum/threads/list.html'
     context_object_name = 'threads'
     paginate_by = 10
-    ordering = ['-created_at']
+    ordering = ['-created_at', '-id']
+    cursor_count = True
     def get_queryset(self):
-        queryset = Thread.objects.annotate().select_related('author', 'category').prefetch_related('thread_resources')
+        queryset = Thread.objects.select_related('author', 'category').defer('search_vector', 'content_html').prefetch_related('tags').annotate(
+            has_resources=Exists(ThreadResource.objects.filter(thread=OuterRef('pk')))
+        ).order_by('-created_at', '-id')
         q = self.request.GET.get("q")
         category=self.request.GET.get("category")
+        tag_name = self.get_tag_name()
         if q:
-            queryset = queryset.annotate(similarity=TrigramSimilarity("title", q) + TrigramSimilarity("content", q)).filter(similarity__gt=0.1).order_by("-similarity")
+            queryset = search_threads(queryset, q)
         if category:
             queryset = queryset.filter(category__id=category)
+        if tag_name:
+            self.tag = taxonomy.find_tag(tag_name)
+            # Filtering on the tag id only touches the through table and
+            # its (tags_id, thread_id) index, never forum_tags.
+            queryset = queryset.filter(tags=self.tag.id) if self.tag else queryset.none()
 
         return queryset
-            
+    
+    def paginate_queryset(self, queryset, page_size):
+        if not self.request.GET.get("q"):
+            return super().paginate_queryset(queryset, page_size)
+        # The count and the page have to run where the trigram threshold is
+        # set, so fetch the page now rather than while rendering.
+        with similarity_threshold(queryset.db):
+            paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+            page.object_list = list(object_list)
+        return paginator, page, page.object_list, is_paginated
+    
+    def get_tag_name(self):
+        return self.request.GET.get("tag")
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
-        context['tags'] = Tags.objects.all()
+        counters.apply_pending(context['threads'])
+        context['categories'] = taxonomy.categories()
+        context['tags'] = taxonomy.tags()
+        context['current_tag'] = getattr(self, 'tag', None)
+        # Evaluated only when the cached tag cloud fragment is rebuilt.
+        context['tag_cloud'] = Tags.objects.filter(thread_count__gt=0).order_by('-thread_count', 'name')[:TAG_CLOUD_SIZE]
+        context['cache_versions'] = caching.get_versions()
+        context['fragment_cache_timeout'] = settings.FORUM_FRAGMENT_CACHE_TIMEOUT
         return context
 
-class MyThreadsListView(LoginRequiredMixin, ListView):
+class TagThreadListView(ThreadListView):
+    """
+    /threads/tags/<name>/: the thread list for a single tag.
+    """
+    
+    def get_tag_name(self):
+        return self.kwargs['name']
+    
+    def get(self, request, *args, **kwargs):
+        if taxonomy.find_tag(self.kwargs['name']) is None:
+            raise Http404("No such tag")
+        return super().get(request, *args, **kwargs)
+
+class MyThreadsListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     model = Thread
     template_name = 'forum/threads/my_threads.html'
     context_object_name = 'threads'
     paginate_by = 10
-    ordering = ['-created_at']
+    ordering = ['-created_at', '-id']
     login_url = '/accounts/login/'
     
     def get_queryset(self):
-        queryset = Thread.objects.filter(author=self.request.user).select_related('author', 'category').prefetch_related('thread_resources')
-        return queryset.order_by('-created_at')
+        queryset = Thread.objects.filter(author=self.request.user).select_related('author', 'category').defer('search_vector', 'content_html').prefetch_related('tags').annotate(
+            has_resources=Exists(ThreadResource.objects.filter(thread=OuterRef('pk')))
+        )
+        return queryset.order_by('-created_at', '-id')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
-        context['tags'] = Tags.objects.all()
+        counters.apply_pending(context['threads'])
+        context['categories'] = taxonomy.categories()
+        context['tags'] = taxonomy.tags()
         return context
 
 class ThreadDetailView(LoginRequiredMixin, DetailView):
@@ -127,37 +164,81 @@ class ThreadDetailView(LoginRequiredMixin, DetailView):
     login_url = '/accounts/login/'
     
     def get_queryset(self):
-        return Thread.objects.select_related('author', 'category').prefetch_related('thread_resources')
+        return Thread.objects.select_related('author', 'category').defer('search_vector').prefetch_related(
+            'tags',
+            Prefetch('thread_resources', queryset=ThreadResource.objects.select_related('uploaded_by')),
+        )
+    
+    def get_object(self, queryset=None):
+        return self.prepare_object(super().get_object(queryset))
+    
+    def prepare_object(self, thread):
+        counters.apply_pending([thread])
+        rendering.refresh_stale([thread])
+        return thread
+    
+    def get_reader_context(self):
+        """
+        The parts of the page that depend on who is reading it.
+        """
+        return {
+            'replies_page': replies_paginator(self.object.pk).page(),
+            'is_moderator': self.request.user.groups.filter(name='Moderator').exists(),
+            'liked': Likes.objects.filter(thread=self.object, user=self.request.user).exists(),
+        }
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['replies'] = Replies.objects.filter(
-            thread=self.object, 
-            is_deleted=False
-        ).select_related('author').order_by('created_at')
-        context['thread_resources'] = ThreadResource.objects.filter(thread=self.object)
-        context['is_moderator'] = self.request.user.groups.filter(name='Moderator').exists()
+        context.update(self.get_reader_context())
+        rendering.refresh_stale(context['replies_page'].object_list)
+        context['replies'] = context['replies_page'].object_list
+        context['thread_resources'] = self.object.thread_resources.all()
+        file_types = dict(ThreadResource.FILE_TYPE_CHOICES)
+        context['upload_limits'] = [(file_types[k], limit) for k, limit in settings.FORUM_UPLOAD_MAX_SIZES.items()]
         context['is_author'] = self.request.user == self.object.author
-        context['liked'] = Likes.objects.filter(thread=self.object, user=self.request.user).exists()
-        context['content_html'] = bleach.clean(
-            markdown.markdown(self.object.content, extensions=['fenced_code', 'codehilite']),
-        tags=ALLOWED_TAGS,
-        attributes=ALLOWED_ATTRIBUTES,
-        strip=True
-    )
+        context['content_html'] = self.object.content_html
         return context
     
+def replies_queryset(thread_id):
+    return Replies.objects.filter(
+        thread_id=thread_id,
+        is_deleted=False
+    ).select_related('author').order_by('created_at', 'id')
+
+def replies_paginator(thread_id):
+    return CursorPaginator(replies_queryset(thread_id), REPLIES_PER_PAGE, descending=False)
+
+@login_required
+def thread_replies(request, pk):
+    """
+    The next page of reply fragments for the thread page's "Load more"
+    button. HTMX requests get the HTML fragment, anything else gets JSON.
+    """
+    page = replies_paginator(pk).page(request.GET.get('cursor'))
+    rendering.refresh_stale(page.object_list)
+    context = {
+        'thread_id': pk,
+        'replies': page.object_list,
+        'replies_page': page,
+        'is_moderator': request.user.groups.filter(name='Moderator').exists(),
+    }
+    if request.headers.get('HX-Request'):
+        return render(request, 'forum/threads/partials/replies.html', context)
+
+    html = render_to_string('forum/threads/partials/replies.html', context, request=request)
+    return JsonResponse({
+        'html': html,
+        'has_next': page.has_next(),
+        'next_cursor': page.next_cursor,
+    })
+
 @login_required 
 def reply_to_thread(request,thread_id):
     if request.method == 'POST':
         thread = get_object_or_404(Thread, id=thread_id)
         content = request.POST.get('content')
         if content:
-            Replies.objects.create(
-                thread=thread,
-                content=content,
-                author=request.user
-            )
+            add_reply(thread, request.user, content)
     return redirect('thread-detail', pk=thread_id)
 
 @login_required
@@ -166,33 +247,27 @@ def delete_reply(request, reply_id):
         reply = get_object_or_404(Replies, id=reply_id)
     else:
         reply = get_object_or_404(Replies, id=reply_id, author=request.user)
-    reply.is_deleted = True
-    reply.save()
-    return redirect('thread-detail', pk=reply.thread.id)
+    soft_delete_reply(reply)
+    return redirect('thread-detail', pk=reply.thread_id)
 
 @login_required
 def like_thread(request, pk):
-    thread = get_object_or_404(Thread, id=pk)
-    if Likes.objects.filter(thread=thread, user=request.user).exists():
-        Likes.objects.filter(thread=thread, user=request.user).delete()
-        thread.likes_count = thread.likes_count - 1
-    else:
-        Likes.objects.create(thread=thread, user=request.user)
-        thread.likes_count = thread.likes_count + 1
-
-        if thread.author and thread.author != request.user:
-            try:
-                send_thread_like_notification(
-                    thread_author_email=thread.author.email,
-                    liker_name=request.user.get_full_name() or request.user.username,
-                    thread_title=thread.title
-                )
-            except Exception as e:
-                pass
-    
-    thread.save()
+    thread = get_object_or_404(Thread.objects.select_related('author'), id=pk)
+    liked, changed = toggle_like(thread.id, request.user)
+    if liked and changed:
+        queue_like_notification(thread, request.user)
     return redirect('thread-detail', pk=pk)
 
+def queue_like_notification(thread, user):
+    if thread.author and thread.author != user and thread.author.email:
+        enqueue_on_commit(
+            send_thread_like_notification_task,
+            thread_author_email=thread.author.email,
+            liker_name=user.get_full_name() or user.username,
+            thread_title=thread.title,
+            thread_id=thread.id
+        )
+
 @login_required
 def report_thread(request, thread_id):
     thread = get_object_or_404(Thread, id=thread_id)
@@ -223,19 +298,20 @@ def report_thread(request, thread_id):
         'reason_choices': Report.REASON_CHOICES
     })
 
-class ReportListView(LoginRequiredMixin, ListView):
+class ReportListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     model = Report
     template_name = 'forum/reports/list.html'
     context_object_name = 'reports'
     paginate_by = 10
-    ordering = ['-created_at']
+    ordering = ['-created_at', '-id']
+    cursor_count = True
     login_url = '/accounts/login/'
     
     def get_queryset(self):
         if not self.request.user.groups.filter(name='Moderator').exists():
-            return Report.objects.none()
+            return Report.objects.none().order_by('-created_at', '-id')
         
-        queryset = Report.objects.select_related('thread', 'reporter').order_by('-created_at')
+        queryset = Report.objects.select_related('thread__author', 'reporter').order_by('-created_at', '-id')
         status = self.request.GET.get('status')
         reason = self.request.GET.get('reason')
         
@@ -283,22 +359,89 @@ def upload_thread_resource(request, thread_id):
     
     if request.method == 'POST':
         title = request.POST.get('title')
-        file_type = request.POST.get('file_type', 'other')
         description = request.POST.get('description')
         file = request.FILES.get('file')
         
         if title and file:
-            ThreadResource.objects.create(
-                thread=thread,
-                title=title,
-                file=file,
-                file_type=file_type,
-                description=description,
-                uploaded_by=request.user
-            )
+            try:
+                uploads.save_uploaded_file(thread, request.user, title, description, file)
+            except uploads.UploadError as exc:
+                messages.error(request, str(exc))
     
     return redirect('thread-detail', pk=thread_id)
 
+@login_required
+def start_resource_upload(request, thread_id):
+    """
+    Open a chunked upload. Answers with the upload URL to send chunks to.
+    """
+    thread = get_object_or_404(Thread, id=thread_id)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required.'}, status=405)
+    if request.user != thread.author:
+        return JsonResponse({'error': 'Only the thread author can upload resources.'}, status=403)
+    
+    try:
+        session = uploads.start_upload(
+            thread,
+            request.user,
+            title=request.POST.get('title'),
+            description=request.POST.get('description'),
+            filename=request.POST.get('filename', ''),
+            size=int(request.POST.get('size') or 0),
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Invalid size.'}, status=400)
+    except uploads.UploadError as exc:
+        return JsonResponse({'error': str(exc)}, status=exc.status)
+    
+    return JsonResponse({
+        'url': reverse('resource-upload-chunk', args=[session.pk]),
+        'offset': 0,
+        'chunk_size': settings.FORUM_UPLOAD_CHUNK_SIZE,
+    }, status=201)
+
+@login_required
+def resource_upload_chunk(request, upload_id):
+    """
+    GET reports how many bytes arrived, so an interrupted client can resume.
+    PUT appends the request body at the ``Upload-Offset`` header.
+    """
+    if request.method == 'GET':
+        session = get_object_or_404(UploadSession, pk=upload_id, uploaded_by=request.user)
+        return JsonResponse({'offset': session.received, 'size': session.size})
+    if request.method != 'PUT':
+        return JsonResponse({'error': 'GET or PUT required.'}, status=405)
+    
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        length = int(request.headers.get('Content-Length', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Upload-Offset and Content-Length are required.'}, status=400)
+    
+    try:
+        session, resource = uploads.append_chunk(upload_id, request.user, offset, request, length)
+    except uploads.UploadError as exc:
+        body = {'error': str(exc)}
+        if exc.status == 409:
+            body['offset'] = UploadSession.objects.filter(pk=upload_id).values_list('received', flat=True).first()
+        return JsonResponse(body, status=exc.status)
+    
+    if resource is None:
+        return JsonResponse({'offset': session.received})
+    return JsonResponse({'offset': session.received, 'resource_id': resource.pk, 'file_type': resource.file_type}, status=201)
+
+@login_required
+def download_thread_resource(request, resource_id, preview=False):
+    """
+    Any signed-in member can read a thread, so any member can fetch its
+    resources; the transfer itself is left to nginx (see forum/downloads.py).
+    """
+    resource = get_object_or_404(ThreadResource.objects.only('file', 'preview', 'original_name'), id=resource_id)
+    if preview:
+        return downloads.serve(request, resource.preview, as_attachment=False)
+    return downloads.serve(request, resource.file, filename=resource.original_name)
+
 @login_required
 def delete_thread_resource(request, resource_id):
     resource = get_object_or_404(ThreadResource, id=resource_id)
@@ -306,7 +449,9 @@ def delete_thread_resource(request, resource_id):
     if request.user != resource.uploaded_by and request.user != resource.thread.author:
         return redirect('thread-detail', pk=thread_id)
     
-    resource.file.delete()
+    # The stored file is shared by content; the post_delete receiver
+    # releases it.
+    resource.preview.delete()
     resource.delete()
     
     return redirect('thread-detail', pk=thread_id)
\ No newline at end of file
@@ -0,0 +1,21 @@
+"""
+gunicorn settings, read from the working directory on start.
+
+With PROMETHEUS_MULTIPROC_DIR set (see forum/metrics.py), metric files from
+the previous run are cleared on start and those of exited workers are
+marked dead.
+"""
+
+import os
+
+
+def on_starting(server):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from forum.multiprocess import clear_directory
+        clear_directory()
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
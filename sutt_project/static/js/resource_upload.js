@@ -0,0 +1,74 @@
+// Chunked, resumable resource uploads (see forum/uploads.py).
+// Forms marked with data-chunked-upload send the file in slices; without
+// JavaScript they fall back to a regular multipart POST.
+document.querySelectorAll("form[data-chunked-upload]").forEach((form) => {
+  const progress = form.querySelector("[data-upload-progress]")
+  const csrfToken = form.querySelector("[name=csrfmiddlewaretoken]").value
+  const button = form.querySelector("button[type=submit]")
+
+  async function currentOffset(url) {
+    const response = await fetch(url, { credentials: "same-origin" })
+    return (await response.json()).offset
+  }
+
+  async function sendChunks(url, file, chunkSize) {
+    let offset = 0
+    let retries = 0
+    while (offset < file.size) {
+      let response
+      try {
+        response = await fetch(url, {
+          method: "PUT",
+          credentials: "same-origin",
+          headers: { "X-CSRFToken": csrfToken, "Upload-Offset": String(offset) },
+          body: file.slice(offset, offset + chunkSize),
+        })
+      } catch (error) {
+        // Network error: ask the server where to resume from.
+        if (++retries > 5) throw error
+        await new Promise((resolve) => setTimeout(resolve, 1000 * retries))
+        offset = await currentOffset(url)
+        continue
+      }
+      const data = await response.json()
+      if (response.status === 409) {
+        offset = data.offset
+        continue
+      }
+      if (!response.ok) throw new Error(data.error)
+      retries = 0
+      offset = data.offset
+      progress.value = Math.round((offset / file.size) * 100)
+    }
+  }
+
+  form.addEventListener("submit", async (event) => {
+    const file = form.querySelector("input[type=file]").files[0]
+    if (!file || !window.fetch) return
+    event.preventDefault()
+    button.disabled = true
+    progress.classList.remove("hidden")
+
+    try {
+      const body = new FormData()
+      body.append("title", form.querySelector("[name=title]").value)
+      body.append("description", form.querySelector("[name=description]").value)
+      body.append("filename", file.name)
+      body.append("size", file.size)
+      const response = await fetch(form.dataset.chunkedUpload, {
+        method: "POST",
+        credentials: "same-origin",
+        headers: { "X-CSRFToken": csrfToken },
+        body,
+      })
+      const upload = await response.json()
+      if (!response.ok) throw new Error(upload.error)
+      await sendChunks(upload.url, file, upload.chunk_size)
+      window.location.reload()
+    } catch (error) {
+      alert(error.message || "Upload failed")
+      button.disabled = false
+      progress.classList.add("hidden")
+    }
+  })
+})
@@ -0,0 +1,27 @@
+"""
+Celery application for sutt_project.
+
+Workers are started with ``celery -A sutt_project worker``. Configuration is
+read from Django settings using the ``CELERY_`` prefix.
+"""
+
+import os
+from functools import partial
+
+from celery import Celery
+from django.db import transaction
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sutt_project.settings')
+
+app = Celery('sutt_project')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+
+def enqueue_on_commit(task, **kwargs):
+    """
+    Queue a Celery task once the surrounding transaction commits, so the
+    worker never sees rows that were rolled back and the request never
+    waits on the mail server.
+    """
+    transaction.on_commit(partial(task.delay, **kwargs), robust=True)
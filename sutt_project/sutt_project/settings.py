@@ -14,6 +14,7 @@ from pathlib import Path
 import os
 import dj_database_url
 from dotenv import load_dotenv
+from celery.schedules import crontab
 
 # Load environment variables from .env file
 load_dotenv(Path(__file__).resolve().parent.parent.parent / '.env')
@@ -110,6 +111,17 @@ WSGI_APPLICATION = 'sutt_project.wsgi.application'
 #             ssl_require=True
 #         )
 #     }
+# DB_CONNECTION_MODE picks how production connections are managed:
+#   persistent  each worker thread keeps its connection for CONN_MAX_AGE
+#               seconds, checked with CONN_HEALTH_CHECKS before reuse.
+#   pool        psycopg 3's pool, one per process. Use this under ASGI, where
+#               requests don't stay on one thread and persistent connections
+#               would pile up.
+#   pgbouncer   connect through PgBouncer in transaction pooling mode
+#               (docker-compose.pgbouncer.yaml). Server-side cursors and
+#               prepared statements don't survive across transactions there.
+DB_CONNECTION_MODE = os.getenv('DB_CONNECTION_MODE', 'persistent')
+
 if os.getenv("ENV") == "production":
     DATABASES = {
             "default": {
@@ -117,10 +129,25 @@ if os.getenv("ENV") == "production":
                 "NAME": os.getenv("POSTGRES_DB"),
                 "USER": os.getenv("POSTGRES_USER"),
                 "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
-                "HOST": "postgres_db",
-                "PORT": "5432",
+                "HOST": os.getenv("POSTGRES_HOST", "postgres_db"),
+                "PORT": os.getenv("POSTGRES_PORT", "5432"),
+                "CONN_MAX_AGE": int(os.getenv("CONN_MAX_AGE", 600)),
+                "CONN_HEALTH_CHECKS": True,
+                "OPTIONS": {},
             }
         }
+    if DB_CONNECTION_MODE == 'pool':
+        # Django returns connections to the pool after each request, so they
+        # must not also be kept open by CONN_MAX_AGE.
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+            "timeout": int(os.getenv("DB_POOL_TIMEOUT", 10)),
+        }
+    elif DB_CONNECTION_MODE == 'pgbouncer':
+        DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+        DATABASES["default"]["OPTIONS"]["prepare_threshold"] = None
 else:
     DATABASES = {
     'default': {
@@ -219,6 +246,169 @@ SITE_ID = 1
 # Site URL for email links
 SITE_URL = os.getenv('SITE_URL', 'http://localhost:8000')
 
+
+# Cache
+# Redis when REDIS_URL is set (shared by all gunicorn and Celery workers),
+# otherwise a file-based cache if CACHE_DIR is set, otherwise per-process
+# local memory.
+
+REDIS_URL = os.getenv('REDIS_URL')
+CACHE_DIR = os.getenv('CACHE_DIR')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'sutt',
+        }
+    }
+elif CACHE_DIR:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_DIR,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'sutt',
+        }
+    }
+
+# Anonymous thread-list pages and list.html fragments (see forum/caching.py).
+# Saves and deletes invalidate them at once; like counts on cached pages,
+# buffered ones included, may lag by up to FORUM_THREAD_LIST_CACHE_TIMEOUT
+# seconds.
+FORUM_THREAD_LIST_CACHE_TIMEOUT = int(os.getenv('FORUM_THREAD_LIST_CACHE_TIMEOUT', '30'))
+FORUM_FRAGMENT_CACHE_TIMEOUT = int(os.getenv('FORUM_FRAGMENT_CACHE_TIMEOUT', '600'))
+
+# Per-process copy of categories and tags (see forum/taxonomy.py). Changes
+# reach every worker at once through the shared cache; the TTL is a backstop.
+FORUM_TAXONOMY_TTL = int(os.getenv('FORUM_TAXONOMY_TTL', '300'))
+
+
+# Thread resource uploads (see forum/uploads.py). Browsers send files in
+# FORUM_UPLOAD_CHUNK_SIZE pieces that are appended under
+# FORUM_UPLOAD_TEMP_DIR, which must be on the volume shared by all workers.
+# Size limits apply to the type detected from the file's magic bytes.
+
+MB = 1024 * 1024
+FORUM_UPLOAD_MAX_SIZES = {
+    'pdf': int(os.getenv('FORUM_UPLOAD_MAX_PDF_SIZE', 50 * MB)),
+    'document': int(os.getenv('FORUM_UPLOAD_MAX_DOCUMENT_SIZE', 50 * MB)),
+    'image': int(os.getenv('FORUM_UPLOAD_MAX_IMAGE_SIZE', 10 * MB)),
+    'video': int(os.getenv('FORUM_UPLOAD_MAX_VIDEO_SIZE', 1024 * MB)),
+    'audio': int(os.getenv('FORUM_UPLOAD_MAX_AUDIO_SIZE', 200 * MB)),
+    'other': int(os.getenv('FORUM_UPLOAD_MAX_OTHER_SIZE', 50 * MB)),
+}
+FORUM_UPLOAD_CHUNK_SIZE = int(os.getenv('FORUM_UPLOAD_CHUNK_SIZE', 5 * MB))
+FORUM_UPLOAD_TEMP_DIR = os.getenv('FORUM_UPLOAD_TEMP_DIR', str(MEDIA_ROOT / 'uploads'))
+# Unfinished uploads older than this are discarded.
+FORUM_UPLOAD_SESSION_TTL = int(os.getenv('FORUM_UPLOAD_SESSION_TTL', 24 * 60 * 60))
+
+# Downloads are authorized by Django. Behind nginx the transfer is handed off
+# with X-Accel-Redirect to an internal location aliased to MEDIA_ROOT (see
+# nginx/nginx.conf); without it Django streams the file itself.
+FORUM_MEDIA_ACCEL_REDIRECT = os.getenv('FORUM_MEDIA_ACCEL_REDIRECT', 'False') == 'True'
+FORUM_MEDIA_ACCEL_PREFIX = os.getenv('FORUM_MEDIA_ACCEL_PREFIX', '/protected-media/')
+# Stored files never change in place, so browsers may reuse them for a day.
+FORUM_DOWNLOAD_MAX_AGE = int(os.getenv('FORUM_DOWNLOAD_MAX_AGE', 24 * 60 * 60))
+
+
+# Set by the ASGI profile (docker-compose.asgi.yaml) to route the thread list,
+# thread page and likes to the async views in forum/async_views.py.
+FORUM_ASYNC_VIEWS = os.getenv('FORUM_ASYNC_VIEWS', 'False') == 'True'
+
+
+# Per-request profiling (see forum/profiling.py): SQL, template, cache and
+# markdown timings in a Server-Timing header and a JSON log line, for
+# FORUM_PROFILING_SAMPLE_RATE of requests. Cheap enough to leave on in
+# production at a low rate.
+FORUM_PROFILING = os.getenv('FORUM_PROFILING', 'False') == 'True'
+FORUM_PROFILING_SAMPLE_RATE = float(os.getenv('FORUM_PROFILING_SAMPLE_RATE', '1.0' if DEBUG else '0.01'))
+
+# Prometheus metrics at /metrics (see forum/metrics.py). gunicorn and Celery
+# processes keep values in files under PROMETHEUS_MULTIPROC_DIR, one
+# directory per process group; /metrics merges all of FORUM_METRICS_DIRS.
+FORUM_METRICS = os.getenv('FORUM_METRICS', 'False') == 'True'
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+FORUM_METRICS_DIRS = [path for path in os.getenv('FORUM_METRICS_DIRS', PROMETHEUS_MULTIPROC_DIR or '').split(',') if path]
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+if FORUM_PROFILING:
+    MIDDLEWARE.insert(0, 'forum.profiling.ProfilingMiddleware')
+    TEMPLATES[0]['BACKEND'] = 'forum.profiling.DjangoTemplates'
+    LOGGING = {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'handlers': {'console': {'class': 'logging.StreamHandler'}},
+        'loggers': {'forum.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False}},
+    }
+if FORUM_METRICS:
+    # Outermost, so the profiler above shares its per-request counts.
+    MIDDLEWARE.insert(0, 'forum.metrics.MetricsMiddleware')
+    # Prometheus scrapes the container directly, by service name.
+    ALLOWED_HOSTS.append(os.getenv('FORUM_METRICS_HOST', 'django'))
+if FORUM_PROFILING or FORUM_METRICS:
+    # Counts hits and misses; see forum/profiling.py.
+    CACHES['default']['BACKEND'] = 'forum.profiling.' + CACHES['default']['BACKEND'].rsplit('.', 1)[1]
+
+
+# Celery
+# Notification emails are sent by Celery workers, never on the request path.
+# Without CELERY_BROKER_URL the in-memory transport is used, which only works
+# inside a single process, so tasks also run eagerly outside production.
+
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'memory://')
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND')
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', str(DEBUG)) == 'True'
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    # Safety net for notifications whose scheduled delivery run was lost
+    # or failed; the first notification in each digest window also
+    # schedules a run (see forum/tasks.py).
+    'deliver-notifications': {
+        'task': 'forum.tasks.deliver_notifications_task',
+        'schedule': 60.0,
+    },
+    'flush-like-counters': {
+        'task': 'forum.tasks.flush_like_counters_task',
+        'schedule': float(os.getenv('FORUM_LIKE_BUFFER_FLUSH_INTERVAL', '5')),
+    },
+    'expire-upload-sessions': {
+        'task': 'forum.tasks.expire_upload_sessions_task',
+        'schedule': 60.0 * 60,
+    },
+    'reconcile-tag-counts': {
+        'task': 'forum.tasks.reconcile_tag_counts_task',
+        'schedule': crontab(hour=3, minute=30),
+    },
+}
+
+# Notification emails are drained in batches over one SMTP connection.
+# Likes and replies for the same recipient and thread that arrive within
+# the digest window are merged into a single email.
+FORUM_EMAIL_BATCH_SIZE = int(os.getenv('FORUM_EMAIL_BATCH_SIZE', '100'))
+FORUM_EMAIL_DIGEST_WINDOW = int(os.getenv('FORUM_EMAIL_DIGEST_WINDOW', '0' if CELERY_TASK_ALWAYS_EAGER else '120'))
+
+# Write-behind buffer for like counts on hot threads (see forum/counters.py).
+# The cache alias must be shared by the web workers and Celery beat's worker.
+FORUM_LIKE_BUFFER = os.getenv('FORUM_LIKE_BUFFER', 'False') == 'True'
+FORUM_LIKE_BUFFER_CACHE = os.getenv('FORUM_LIKE_BUFFER_CACHE', 'default')
+
+# pg_trgm threshold for thread title search (see forum/search.py), set with
+# SET LOCAL in the search's own transaction. Lower values match more
+# loosely; the GIN trigram index keeps either setting fast.
+FORUM_SEARCH_SIMILARITY_THRESHOLD = float(os.getenv('FORUM_SEARCH_SIMILARITY_THRESHOLD', '0.2'))
+
 ALLAUTH_UI_THEME = "light"
 
 
@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
+from forum import metrics
 from . import views
 
 urlpatterns = [
@@ -12,6 +14,10 @@ urlpatterns = [
     path('', views.home, name='home'),
 ]
 
+if settings.FORUM_METRICS:
+    # Not proxied by nginx; Prometheus scrapes the django service directly.
+    urlpatterns.append(path('metrics', metrics.metrics_view, name='metrics'))
+
 # Custom error handlers
 handler404 = 'sutt_project.views.handler404'
 handler500 = 'sutt_project.views.handler500'
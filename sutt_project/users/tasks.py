@@ -12,57 +12,6 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-@shared_task(bind=True, max_retries=3)
-def send_welcome_email_task(self, user_email, user_name, verification_link=None):
-    """
-    Async task: Send welcome/verification email to new user.
-    """
-    subject = "Welcome to SUTT Forum!"
-    
-    if verification_link:
-        html_message = f"""
-        <h2>Welcome to SUTT Forum, {user_name}!</h2>
-        <p>Please verify your email address by clicking the button below:</p>
-        <p><a href="{verification_link}" style="background-color: #4CAF50; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px; display: inline-block;">
-            Verify Email
-        </a></p>
-        <p>Or copy and paste this link in your browser:</p>
-        <p>{verification_link}</p>
-        <p>This link will expire in 24 hours.</p>
-        """
-    else:
-        html_message = f"""
-        <h2>Welcome to SUTT Forum, {user_name}!</h2>
-        <p>Thank you for creating an account on our forum.</p>
-        <p>You can now:</p>
-        <ul>
-            <li>Create and participate in discussions</li>
-            <li>Reply to threads</li>
-            <li>Like and react to posts</li>
-            <li>Join our community</li>
-        </ul>
-        <p>If you have any questions, feel free to reach out to us.</p>
-        <p>Happy discussing!</p>
-        """
-    
-    plain_message = strip_tags(html_message)
-    
-    try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[user_email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        logger.info(f"✅ Welcome email sent to {user_email}")
-        return f"Email sent to {user_email}"
-    except Exception as exc:
-        logger.error(f"❌ Failed to send welcome email: {str(exc)}")
-        raise self.retry(exc=exc, countdown=60)
-
-
 @shared_task(bind=True, max_retries=3)
 def send_password_reset_email_task(self, user_email, user_name, reset_link):
     """